@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,11 +39,9 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rental',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +51,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Тесты (manage.py test) идут с DEBUG=False: Debug Toolbar в них не подключается
+TESTING = 'test' in sys.argv[1:2]
+if not TESTING:
+    INSTALLED_APPS += ['debug_toolbar']
+    MIDDLEWARE.insert(0, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'prestige.urls'
 
 TEMPLATES = [
@@ -115,6 +120,19 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Фасеты каталога и счетчики попаданий хранятся здесь; в продакшене нужен общий
+# для всех воркеров бэкенд (Redis/Memcached), иначе у каждого процесса свой кэш
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'prestige',
+    }
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -131,7 +149,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
-STATICFILES_DIRS = [BASE_DIR / "templates"]
+STATICFILES_DIRS = [BASE_DIR / "static"]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Статика с хэшем в имени и готовыми .gz/.br (rental/staticfiles.py), собирается collectstatic
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "rental.staticfiles.CompressedManifestStaticFilesStorage",
+    },
+}
+# Отдавать собранную статику средствами Django (если перед приложением нет веб-сервера)
+SERVE_STATIC = not DEBUG
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -141,6 +172,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Пагинация каталога: 'keyset' (курсоры, без COUNT/OFFSET) или 'pages' (номера страниц для небольшого парка)
+CATALOG_PAGINATION = 'keyset'
+
+# Асинхронные каталог, страница машины и API стоимости (rental.async_views).
+# Включать при запуске под ASGI: под WSGI каждое такое представление
+# поднимает свой цикл событий и работает медленнее синхронного
+ASYNC_READ_VIEWS = False
+
+# Email
+# Уведомления уходят через очередь OutboxEmail (команда deliver_outbox).
+# Для разработки письма складываются в файлы вместо SMTP.
+# Уведомления об отзывах получают ADMINS; без получателей письма в очередь не ставятся
+DEFAULT_FROM_EMAIL = 'noreply@prestigewheels.local'
+ADMINS = []
+if DEBUG:
+    ADMINS = [('Администратор', 'admin@prestigewheels.local')]
+    EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+    EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+
 # Auth settings
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
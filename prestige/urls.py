@@ -1,8 +1,8 @@
 from django.contrib import admin
-from django.urls import path, include  # подключаем include
+from django.urls import path, re_path, include  # подключаем include
 from django.conf import settings
 from django.conf.urls.static import static
-from rental.views import register, logout_view
+from rental.views import register, logout_view, serve_media, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),         # путь к админке
@@ -12,9 +12,14 @@ urlpatterns = [
     path('logout/', logout_view, name='logout'),
 ]
 
-if settings.DEBUG:
+if settings.DEBUG and not settings.TESTING:
     urlpatterns += [
         path('__debug__/', include('debug_toolbar.urls')),
     ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
+
+if settings.SERVE_STATIC:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), serve_static),
+    ]
@@ -1,5 +1,83 @@
-from django.contrib import admin
-from .models import Car, Booking, Service, CarService, Review
+from datetime import date, timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import Max, Min
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import Car, Booking, Service, CarService, Review, PricingRule, DiscountTier
+from .pagination import EstimatedCountPaginator
+from . import caching, exports, facets, reservations, search
+
+# Режим производительности для списков по большим таблицам: число строк —
+# оценка (EstimatedCountPaginator), без второго COUNT(*) «всего», варианты
+# фильтров из кэша вместо SELECT DISTINCT, поиск по префиксу ('^') по индексам
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """Фильтр по значению поля field_path с вариантами из кэша фасетов (facets.get_facets()[facet_key])"""
+    field_path = None
+    facet_key = None
+
+    def lookups(self, request, model_admin):
+        return [(value, value) for value in facets.get_facets()[self.facet_key]]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+class BrandFilter(CachedChoicesFilter):
+    title = "Бренд"
+    parameter_name = 'brand'
+    field_path = 'brand'
+    facet_key = 'all_brands'
+
+class CarTypeFilter(CachedChoicesFilter):
+    title = "Тип кузова"
+    parameter_name = 'type'
+    field_path = 'type'
+    facet_key = 'categories'
+
+class BookingBrandFilter(BrandFilter):
+    field_path = 'car__brand'
+
+ADMIN_NAMESPACE = 'admin'
+
+class YearFilter(admin.SimpleListFilter):
+    """Годы по MIN/MAX индексированного поля вместо date_hierarchy с SELECT DISTINCT по датам"""
+    title = "Год"
+    parameter_name = 'year'
+    field_path = None
+
+    def lookups(self, request, model_admin):
+        model = model_admin.model
+
+        def compute():
+            bounds = model.objects.aggregate(first=Min(self.field_path), last=Max(self.field_path))
+            if bounds['first'] is None:
+                return []
+            return list(range(bounds['last'].year, bounds['first'].year - 1, -1))
+
+        years = caching.cached(ADMIN_NAMESPACE, f'years:{model._meta.label_lower}:{self.field_path}', compute)
+        return [(str(year), str(year)) for year in years]
+
+    def queryset(self, request, queryset):
+        try:
+            year = int(self.value())
+        except (TypeError, ValueError):
+            return queryset
+        return queryset.filter(**{f'{self.field_path}__year': year})
+
+class BookingYearFilter(YearFilter):
+    field_path = 'date_from'
+
+class ReviewYearFilter(YearFilter):
+    field_path = 'created_at'
 
 # Регистрация модели "Услуга"
 @admin.register(Service)
@@ -13,34 +91,167 @@ class CarServiceInline(admin.TabularInline):
     extra = 1
     autocomplete_fields = ('service',)
 
-# Inline-модель: бронирования внутри карточки машины
+class RecentBookingFormSet(BaseInlineFormSet):
+    """Не больше BookingInline.max_rows форм: размер страницы машины не зависит от истории"""
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            # Срез после фильтра по машине, который добавляет BaseInlineFormSet
+            self._queryset = super().get_queryset()[:BookingInline.max_rows]
+        return self._queryset
+
+# Inline-модель: ближайшие и недавние бронирования внутри карточки машины.
+# Вся история — по ссылке в список бронирований (CarAdmin.bookings_link)
 class BookingInline(admin.TabularInline):  # Можно заменить на StackedInline для вертикального отображения
     model = Booking
-    extra = 1  # количество пустых форм для добавления
-    raw_id_fields = ("user",)  # избегаем выпадающих списков на 1000+ юзеров
+    formset = RecentBookingFormSet
+    verbose_name_plural = "Ближайшие и недавние бронирования"
+    # Только просмотр: даты, статус и услуги меняются на странице бронирования
+    # (BookingAdmin.save_model → reservations.save — блокировка машины, проверка
+    # пересечений, пересчет стоимости); сохранение формсета это бы обошло
+    extra = 0
+    max_rows = 20
+    recent_days = 30
+    fields = ("user", "date_from", "date_to", "status", "total_amount")
+    readonly_fields = fields
+    show_change_link = True
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Отмена и удаление — тоже на странице бронирования
+        return False
+
+    def get_queryset(self, request):
+        since = date.today() - timedelta(days=self.recent_days)
+        # Заголовок строки — Booking.__str__ с пользователем и машиной
+        return super().get_queryset(request).filter(date_to__gte=since).select_related(
+            'user', 'car'
+        ).order_by('date_from', 'pk')
+
+def auto_confirm_action(priority, car_field):
+    """Действие: разобрать все ожидающие брони машин из выбранных строк по приоритету"""
+    def action(modeladmin, request, queryset):
+        car_ids = set(queryset.values_list(car_field, flat=True))
+        result = reservations.auto_confirm(car_ids, priority)
+        modeladmin.message_user(
+            request,
+            f"Подтверждено: {len(result['confirmed'])}, отменено из-за пересечений: {len(result['cancelled'])}",
+            messages.SUCCESS,
+        )
+
+    action.__name__ = f'auto_confirm_{priority}'
+    return admin.action(
+        description=f"Автоподтверждение ожидающих броней: {reservations.PRIORITIES[priority].lower()}"
+    )(action)
 
 # Админка для автомобиля
 @admin.register(Car)
-class CarAdmin(admin.ModelAdmin):
+class CarAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("id", "brand", "name", "type", "price", "is_available", "car_display_name")
-    list_filter = ("brand", "type", "is_available")
-    search_fields = ("name", "brand")
+    list_filter = (BrandFilter, CarTypeFilter, "is_available")
+    search_fields = ("^name", "^brand")
     list_display_links = ("brand", "name")
-    readonly_fields = ("id",)
+    readonly_fields = ("id", "bookings_link")
     inlines = [CarServiceInline, BookingInline]
+    actions = [auto_confirm_action(priority, 'pk') for priority in reservations.PRIORITIES]
 
     @admin.display(description="Модель авто")
     def car_display_name(self, obj):
         return f"{obj.brand} {obj.name}"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу rental.search: слова бренда, названия, типа кузова и отзывов
+        if search.tokenize(search_term):
+            return search.filter_cars(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    @admin.display(description="История бронирований")
+    def bookings_link(self, obj):
+        if obj.pk is None:
+            return "—"
+        url = reverse('admin:rental_booking_changelist') + f'?car__id__exact={obj.pk}'
+        return format_html('<a href="{}">Все бронирования ({})</a>', url, obj.bookings.count())
+
+class BookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        car, date_from, date_to = (cleaned_data.get(name) for name in ('car', 'date_from', 'date_to'))
+        # Предварительная проверка для понятной ошибки в форме; окончательная — в reservations.save
+        if car and date_from and date_to and cleaned_data.get('status') != 'cancelled':
+            conflict = reservations.find_conflict(car.pk, date_from, date_to, exclude=self.instance.pk)
+            if conflict:
+                raise forms.ValidationError(
+                    f'Период пересекается с подтвержденным бронированием #{conflict}'
+                )
+        return cleaned_data
+
 # Админка для бронирований
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "car", "date_from", "date_to", "status")
-    list_filter = ("status", "date_from")
-    date_hierarchy = "date_from"
-    search_fields = ("user__username", "car__name")
+class BookingAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    form = BookingAdminForm
+    list_display = ("id", "user", "car", "date_from", "date_to", "status", "total_amount")
+    list_select_related = ("user", "car")
+    list_filter = ("status", BookingYearFilter, "date_from", BookingBrandFilter)
+    readonly_fields = ("total_amount",)
+    search_fields = ("^user__username", "^car__name")
     raw_id_fields = ("user", "car")  # чтобы не грузить большой список
+    actions = ["confirm_bookings", "export_csv", "export_jsonl"] + [
+        auto_confirm_action(priority, 'car_id') for priority in reservations.PRIORITIES
+    ]
+
+    def save_model(self, request, obj, form, change):
+        # Проверка пересечений, услуги (с обязательными) и расчет — под блокировкой машины;
+        # services убираем из cleaned_data, чтобы save_m2m не переписал их выбором формы
+        services = form.cleaned_data.pop('services', None)
+        if change and 'services' not in form.changed_data:
+            services = None
+        elif services is not None:
+            services = [car_service.service_id for car_service in services]
+        reservations.save(obj, services)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # Период заняли между проверкой формы и блокировкой машины: транзакция формы
+        # откатывается, вместо 500 — сообщение и та же страница
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except reservations.BookingConflict as error:
+            self.message_user(
+                request, f"Период пересекается с подтвержденным бронированием #{error.booking_id}",
+                messages.ERROR
+            )
+            return HttpResponseRedirect(request.get_full_path())
+
+    # С «выбрать все» в queryset весь отфильтрованный список; файл отдается потоком
+    @admin.action(description="Выгрузить в CSV")
+    def export_csv(self, request, queryset):
+        return exports.streaming_response(queryset, 'csv')
+
+    @admin.action(description="Выгрузить в JSONL")
+    def export_jsonl(self, request, queryset):
+        return exports.streaming_response(queryset, 'jsonl')
+
+    @admin.action(description="Подтвердить выбранные бронирования")
+    def confirm_bookings(self, request, queryset):
+        confirmed, conflicts = 0, []
+        for booking in queryset.exclude(status='confirmed').order_by('pk'):
+            try:
+                reservations.confirm(booking)
+            except reservations.BookingConflict as error:
+                conflicts.append(f"#{booking.pk} (пересекается с #{error.booking_id})")
+            else:
+                confirmed += 1
+        if confirmed:
+            self.message_user(request, f"Подтверждено бронирований: {confirmed}", messages.SUCCESS)
+        if conflicts:
+            self.message_user(
+                request, "Не подтверждены, период занят: " + ", ".join(conflicts), messages.WARNING
+            )
 
 # Админка для услуг автомобиля
 @admin.register(CarService)
@@ -51,9 +262,23 @@ class CarServiceAdmin(admin.ModelAdmin):
     autocomplete_fields = ('car', 'service')
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('booking', 'rating', 'created_at', 'is_public')
-    list_filter = ('rating', 'is_public', 'created_at')
-    search_fields = ('booking__user__username', 'booking__car__name', 'comment')
+    # Колонка booking выводит пользователя и машину (Booking.__str__)
+    list_select_related = ('booking__user', 'booking__car')
+    list_filter = ('rating', 'is_public', ReviewYearFilter, 'created_at')
+    # Поиск по тексту отзыва (LIKE '%…%') не использует индексы — только по префиксу имен
+    search_fields = ('^booking__user__username', '^booking__car__name')
     readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'created_at'
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'car', 'brand', 'car_type', 'date_from', 'date_to', 'weekdays', 'multiplier', 'is_active')
+    list_filter = ('is_active', 'brand', 'car_type')
+    search_fields = ('name', 'brand')
+    raw_id_fields = ('car',)
+
+@admin.register(DiscountTier)
+class DiscountTierAdmin(admin.ModelAdmin):
+    list_display = ('brand', 'min_days', 'percentage')
+    list_filter = ('brand',)
@@ -0,0 +1,90 @@
+"""Асинхронные версии страниц только для чтения: каталог, машина, расчет стоимости.
+
+Подключаются вместо rental.views при ASYNC_READ_VIEWS = True, когда проект
+запущен под ASGI (uvicorn/daphne prestige.asgi:application): синхронное
+представление там занимает поток пула на весь запрос. Запросы идут через
+асинхронный ORM, независимые — одновременно (asyncio.gather). Шаблоны
+отрисовываются в sync_to_async: теги и context processor обращаются к
+кэшу и базе синхронно.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import aprefetch_related_objects
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, render
+
+from . import availability, caching, conditional, pricing, recommendations, stats
+from .models import Car
+from .pagination import KeysetPaginator
+from .views import _car_reviews, _catalog_query, _numbered_page, _quote_params
+
+
+async def _numbered_catalog_page(car_list, ordering, per_page, number):
+    paginator = Paginator(car_list.order_by(*ordering), per_page)
+    # Paginator.count — cached_property: подставляем результат acount(), чтобы не было синхронного COUNT
+    paginator.count = await car_list.acount()
+    page = _numbered_page(paginator, number)
+    page.object_list = [car async for car in page.object_list]
+    return page
+
+
+@conditional.conditional_get(conditional.page_etag, conditional.page_last_modified)
+@caching.anonymous_page
+async def home(request):
+    car_list, ordering, context = _catalog_query(request)
+
+    if settings.CATALOG_PAGINATION == 'keyset':
+        cars = await KeysetPaginator(car_list, ordering, context['per_page']).apage(request.GET.get('cursor'))
+    else:
+        cars = await _numbered_catalog_page(car_list, ordering, context['per_page'], request.GET.get('page'))
+
+    # Устаревшие карты доступности и статистика парка при промахе кэша — синхронный код
+    _, car_stats = await asyncio.gather(
+        sync_to_async(availability.attach)(cars.object_list),
+        sync_to_async(stats.get_stats)(),
+    )
+    context.update(cars=cars, car_stats=car_stats)
+    return await sync_to_async(render)(request, 'index.html', context)
+
+
+async def _reviews(car):
+    return [review async for review in _car_reviews(car)]
+
+
+@conditional.conditional_get(conditional.page_etag, conditional.page_last_modified)
+@caching.anonymous_page
+async def car_detail(request, pk):
+    car = await aget_object_or_404(Car, pk=pk)
+
+    tasks = [recommendations.asimilar_cars(car)]
+    # Отзывы и услуги выводятся внутри фрагмента: если он в кэше, загружать их незачем
+    user = await request.auser()
+    fragment_cached = user.is_authenticated and caching.has_fragment('car_detail', car.pk)
+    if not fragment_cached:
+        tasks += [
+            _reviews(car),
+            aprefetch_related_objects([car], 'services', 'carservice_set__service'),
+        ]
+    car_list, *loaded = await asyncio.gather(*tasks)
+    reviews = loaded[0] if loaded else []
+
+    avg_rating = car.average_rating if car.total_reviews else None
+
+    return await sync_to_async(render)(request, 'car_detail.html', {
+        'car': car,
+        'car_list': car_list,
+        'reviews': reviews,
+        'avg_rating': avg_rating
+    })
+
+
+@conditional.conditional_get(conditional.quote_etag)
+async def quote(request):
+    """Асинхронная версия rental.views.quote"""
+    params = _quote_params(request)
+    if isinstance(params, JsonResponse):
+        return params
+    return JsonResponse({'quotes': await pricing.aquote_many(*params)})
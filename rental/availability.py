@@ -0,0 +1,250 @@
+"""Движок доступности автомобилей.
+
+Для каждого автомобиля хранится битовая карта занятости (CarAvailability):
+один бит на сутки на горизонте HORIZON_DAYS дней начиная с start_date.
+Карта строится из подтвержденных бронирований и пересчитывается только
+в затронутом окне дат при изменении бронирования (см. rental.signals),
+поэтому проверки пересечений, поиск ближайшей свободной даты и календарь
+сводятся к битовым операциям и не зависят от длины истории бронирований.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, Car, CarAvailability
+
+# Горизонт бронирования: не дальше конца года и не более 180 + 90 дней вперед
+HORIZON_DAYS = 366
+FULL_MASK = (1 << HORIZON_DAYS) - 1
+# Сколько ближайших периодов аренды хранится в сводке для каталога
+UPCOMING_LIMIT = 3
+SUMMARY_FIELDS = ['next_booked_from', 'next_booked_to', 'next_free_date', 'upcoming']
+MAP_FIELDS = ['start_date', 'bitmap', 'updated_at'] + SUMMARY_FIELDS
+
+
+def _today():
+    return date.today()
+
+
+def _car_id(car):
+    return car if isinstance(car, int) else car.pk
+
+
+def range_mask(start_date, date_from, date_to):
+    """Маска дней [date_from, date_to] относительно start_date, обрезанная по горизонту"""
+    lo = max((date_from - start_date).days, 0)
+    hi = min((date_to - start_date).days, HORIZON_DAYS - 1)
+    if hi < lo:
+        return 0
+    return ((1 << (hi - lo + 1)) - 1) << lo
+
+
+def _scan_mask(car_ids, start_date, window_from, window_to):
+    """Строит маски занятости по базе только для окна [window_from, window_to]"""
+    masks = {car_id: 0 for car_id in car_ids}
+    rows = Booking.objects.filter(car_id__in=car_ids).confirmed().overlapping(
+        window_from, window_to
+    ).values_list('car_id', 'date_from', 'date_to')
+    for car_id, booked_from, booked_to in rows:
+        masks[car_id] |= range_mask(
+            start_date, max(booked_from, window_from), min(booked_to, window_to)
+        )
+    return masks
+
+
+def _horizon_end(start_date):
+    return start_date + timedelta(days=HORIZON_DAYS - 1)
+
+
+def _summarize(availability):
+    """Пересчитывает сводку ближайшей занятости по битовой карте"""
+    mask = availability.mask
+    start = availability.start_date
+
+    free = ~mask & FULL_MASK
+    availability.next_free_date = start + timedelta(days=(free & -free).bit_length() - 1) if free else None
+
+    ranges = []
+    rest = mask
+    while rest and len(ranges) < UPCOMING_LIMIT:
+        lo = (rest & -rest).bit_length() - 1
+        run = ~(rest >> lo)
+        length = (run & -run).bit_length() - 1
+        ranges.append((start + timedelta(days=lo), start + timedelta(days=lo + length - 1)))
+        rest &= ~(((1 << length) - 1) << lo)
+
+    availability.next_booked_from, availability.next_booked_to = ranges[0] if ranges else (None, None)
+    availability.upcoming = [[begin.isoformat(), end.isoformat()] for begin, end in ranges]
+
+
+def _shift(availability, today):
+    """Сдвигает устаревшую карту к сегодняшнему дню и досчитывает новый хвост"""
+    delta = (today - availability.start_date).days
+    old_end = _horizon_end(availability.start_date)
+    mask = availability.mask >> delta if delta < HORIZON_DAYS else 0
+    tail_from = max(old_end + timedelta(days=1), today)
+    mask |= _scan_mask([availability.car_id], today, tail_from, _horizon_end(today))[availability.car_id]
+    availability.start_date = today
+    availability.mask = mask
+    availability.updated_at = timezone.now()
+    _summarize(availability)
+
+
+def _build(car_ids, today):
+    """Новые карты на горизонт от today (без сохранения)"""
+    masks = _scan_mask(car_ids, today, today, _horizon_end(today))
+    built = []
+    for car_id in car_ids:
+        availability = CarAvailability(car_id=car_id, start_date=today)
+        availability.mask = masks[car_id]
+        _summarize(availability)
+        built.append(availability)
+    return built
+
+
+def _store(stale, missing, today):
+    """Сохраняет сдвинутые и новые карты под блокировками, возвращает {car_id: карта}.
+
+    Карта перечитывается под той же блокировкой строки, что в refresh(), и
+    сдвигается заново, только если ее еще никто не обновил. Для новой карты
+    блокируется строка Car, как в rental.reservations: бронирование машины,
+    сохраняемое в этот момент, попадет в скан уже зафиксированным.
+    """
+    with transaction.atomic():
+        list(Car.objects.select_for_update().filter(pk__in=missing).order_by('pk').values_list('pk', flat=True))
+        locked = {
+            availability.car_id: availability
+            for availability in CarAvailability.objects.select_for_update().filter(
+                car_id__in=stale + missing
+            ).order_by('car_id')
+        }
+        shifted = [
+            availability for availability in locked.values() if availability.start_date < today
+        ]
+        for availability in shifted:
+            _shift(availability, today)
+        if shifted:
+            CarAvailability.objects.bulk_update(shifted, MAP_FIELDS)
+        created = _build([car_id for car_id in missing if car_id not in locked], today)
+        CarAvailability.objects.bulk_create(created, ignore_conflicts=True)
+    locked.update({availability.car_id: availability for availability in created})
+    return locked
+
+
+def load_maps(cars):
+    """Возвращает {car_id: CarAvailability} для набора автомобилей.
+
+    Отсутствующие карты строятся одним запросом к бронированиям, устаревшие
+    сдвигаются к текущей дате. Запись идет только под блокировками (_store),
+    поэтому чтение не затирает одновременный refresh().
+    """
+    car_ids = [_car_id(car) for car in cars]
+    today = _today()
+    maps = CarAvailability.objects.in_bulk(car_ids, field_name='car_id')
+    stale = [car_id for car_id, availability in maps.items() if availability.start_date < today]
+    missing = [car_id for car_id in car_ids if car_id not in maps]
+    if stale or missing:
+        maps.update(_store(stale, missing, today))
+    return maps
+
+
+def attach(cars):
+    """Проставляет car.availability для страницы каталога.
+
+    Рассчитан на queryset с select_related('availability'): запрос к картам
+    делается только для машин без карты или с устаревшей картой.
+    """
+    today = _today()
+    pending = []
+    for car in cars:
+        cached = car._state.fields_cache.get('availability')
+        if cached is None or cached.start_date < today:
+            pending.append(car)
+    if pending:
+        maps = load_maps(pending)
+        for car in pending:
+            car.availability = maps[car.pk]
+    return cars
+
+
+def get_map(car):
+    return load_maps([car])[_car_id(car)]
+
+
+def is_range_free(car, date_from, date_to):
+    """Проверяет, что на все дни [date_from, date_to] нет подтвержденных бронирований"""
+    availability = get_map(car)
+    if date_from < availability.start_date or date_to > _horizon_end(availability.start_date):
+        # Запрос за пределами горизонта — обычная проверка по базе
+        return not Booking.objects.filter(car_id=_car_id(car)).confirmed().overlapping(
+            date_from, date_to
+        ).exists()
+    return not availability.mask & range_mask(availability.start_date, date_from, date_to)
+
+
+def _first_free_run(mask, offset, days):
+    """Индекс первого бита >= offset, с которого начинаются days свободных дней"""
+    free = ~mask & FULL_MASK
+    run = free >> offset
+    for i in range(1, days):
+        run &= free >> (offset + i)
+    if not run:
+        return None
+    return offset + (run & -run).bit_length() - 1
+
+
+def next_free_date(car, after=None, days=1):
+    """Ближайшая дата не раньше after, начиная с которой автомобиль свободен days дней"""
+    availability = get_map(car)
+    after = max(after or availability.start_date, availability.start_date)
+    offset = (after - availability.start_date).days
+    if offset >= HORIZON_DAYS:
+        return None
+    index = _first_free_run(availability.mask, offset, days)
+    if index is None or index + days > HORIZON_DAYS:
+        return None
+    return availability.start_date + timedelta(days=index)
+
+
+def occupancy(cars, date_from, date_to):
+    """Календарь занятости нескольких автомобилей: {car_id: [bool, ...]} по дням"""
+    maps = load_maps(cars)
+    days = (date_to - date_from).days + 1
+    calendar = {}
+    for car_id, availability in maps.items():
+        offset = (date_from - availability.start_date).days
+        mask = availability.mask >> offset if offset >= 0 else availability.mask << -offset
+        calendar[car_id] = [bool(mask >> i & 1) for i in range(days)]
+    return calendar
+
+
+def refresh(car_id, date_from, date_to):
+    """Пересчитывает биты карты автомобиля в окне [date_from, date_to]"""
+    with transaction.atomic():
+        availability = CarAvailability.objects.select_for_update().filter(car_id=car_id).first()
+        if availability is None:
+            # Карта еще не строилась — будет построена целиком при первом обращении
+            return
+        today = _today()
+        if availability.start_date < today:
+            _shift(availability, today)
+        window_from = max(date_from, availability.start_date)
+        window_to = min(date_to, _horizon_end(availability.start_date))
+        if window_from <= window_to:
+            window = range_mask(availability.start_date, window_from, window_to)
+            scanned = _scan_mask([car_id], availability.start_date, window_from, window_to)[car_id]
+            availability.mask = (availability.mask & ~window) | scanned
+            _summarize(availability)
+        availability.save(update_fields=MAP_FIELDS)
+
+
+def rebuild(car_ids=None):
+    """Полностью перестраивает карты (всех автомобилей или переданных)"""
+    queryset = CarAvailability.objects.all()
+    if car_ids is not None:
+        queryset = queryset.filter(car_id__in=car_ids)
+    queryset.delete()
+    if car_ids is None:
+        car_ids = list(Car.objects.values_list('id', flat=True))
+    return load_maps(car_ids)
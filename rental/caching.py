@@ -0,0 +1,271 @@
+"""Версионированный кэш с учетом попаданий.
+
+Каждое пространство имен (facets, catalog, ...) имеет счетчик версии в кэше.
+Ключи данных включают версию, поэтому инвалидация — это увеличение версии
+без перебора и удаления старых ключей: они просто истекают по таймауту.
+
+Промах пересчитывает только один процесс (блокировка через cache.add),
+остальные ждут его результат, а не повторяют те же запросы к базе.
+Здесь же кэш целых страниц для анонимных посетителей (PAGES) и версии
+отдельных машин для кэша фрагментов (car_namespace).
+"""
+import asyncio
+import hashlib
+from datetime import date
+from functools import wraps
+from time import monotonic, sleep, time_ns
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+DEFAULT_TIMEOUT = 60 * 60
+
+# Блокировка пересчета: сколько живет и сколько ее ждут остальные
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+POLL_INTERVAL = 0.05
+
+PAGES = 'pages'
+FRAGMENTS = 'fragments'
+PAGE_TIMEOUT = 10 * 60
+
+
+def _version_key(namespace):
+    return f'rental:version:{namespace}'
+
+
+def _initial_version():
+    # Версии нет в кэше (первый запуск или вытеснение): счетчик начинается с текущего
+    # времени в наносекундах, выше любого прежнего значения — иначе процесс, запомнивший
+    # версию до вытеснения, принял бы новую за ту же самую
+    return time_ns()
+
+
+def get_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        initial = _initial_version()
+        cache.add(_version_key(namespace), initial, timeout=None)
+        version = cache.get(_version_key(namespace), initial)
+    return version
+
+
+def bump_version(namespace):
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.add(_version_key(namespace), _initial_version(), timeout=None)
+        return cache.incr(_version_key(namespace))
+
+
+def make_key(namespace, key, version=None):
+    if version is None:
+        version = get_version(namespace)
+    return f'rental:{namespace}:v{version}:{key}'
+
+
+def count(namespace, outcome, amount=1):
+    """Увеличивает счетчик hits/misses пространства имен"""
+    if not amount:
+        return
+    counter = f'rental:stats:{namespace}:{outcome}'
+    try:
+        cache.incr(counter, amount)
+    except ValueError:
+        cache.add(counter, 0, timeout=None)
+        cache.incr(counter, amount)
+
+
+def single_flight(full_key, compute, timeout=DEFAULT_TIMEOUT):
+    """Вычисляет и кэширует значение так, что при промахе compute() выполняет один процесс.
+
+    Остальные ждут появления значения до LOCK_WAIT секунд, потом считают сами.
+    None из compute() не кэшируется.
+    """
+    lock_key = f'{full_key}:lock'
+    if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = monotonic() + LOCK_WAIT
+        while monotonic() < deadline:
+            sleep(POLL_INTERVAL)
+            value = cache.get(full_key)
+            if value is not None:
+                return value
+            if cache.get(lock_key) is None:
+                # Лидер закончил, но ничего не сохранил — пробуем занять блокировку сами
+                if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+                    break
+        else:
+            return compute()
+    try:
+        value = compute()
+        if value is not None:
+            cache.set(full_key, value, timeout=timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+async def asingle_flight(full_key, compute, timeout=DEFAULT_TIMEOUT):
+    """single_flight для корутины compute: ожидание не блокирует цикл событий"""
+    lock_key = f'{full_key}:lock'
+    if not await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = monotonic() + LOCK_WAIT
+        while monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            value = await cache.aget(full_key)
+            if value is not None:
+                return value
+            if await cache.aget(lock_key) is None:
+                if await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT):
+                    break
+        else:
+            return await compute()
+    try:
+        value = await compute()
+        if value is not None:
+            await cache.aset(full_key, value, timeout=timeout)
+        return value
+    finally:
+        await cache.adelete(lock_key)
+
+
+def cached(namespace, key, compute, timeout=DEFAULT_TIMEOUT):
+    """Значение из кэша по версионированному ключу или результат compute()"""
+    full_key = make_key(namespace, key)
+    value = cache.get(full_key)
+    if value is not None:
+        count(namespace, 'hits')
+        return value
+    count(namespace, 'misses')
+    return single_flight(full_key, compute, timeout)
+
+
+def car_namespace(car_id):
+    return f'car:{car_id}'
+
+
+def invalidate_car(*car_ids):
+    """Сбрасывает фрагменты машин и все кэшированные страницы"""
+    for car_id in set(car_ids) - {None}:
+        bump_version(car_namespace(car_id))
+    bump_version(PAGES)
+
+
+def fragment_key(name, car_id):
+    """Ключ фрагмента машины: версия машины + дата (в карточках есть «свободна с»)"""
+    return f'{name}:{car_id}:v{get_version(car_namespace(car_id))}:{date.today().isoformat()}'
+
+
+def has_fragment(name, car_id):
+    """Есть ли в кэше фрагмент машины — тогда данные для него можно не загружать"""
+    return cache.has_key(make_key(FRAGMENTS, fragment_key(name, car_id)))
+
+
+def _page_key(request):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'{digest}:{date.today().isoformat()}'
+
+
+def _page_entry(response):
+    """Содержимое ответа для кэша или None, если ответ кэшировать нельзя"""
+    if response.streaming or response.cookies or response.has_header('Set-Cookie'):
+        return None
+    if response.status_code not in (200, 404):
+        return None
+    return {
+        'content': response.content,
+        'status': response.status_code,
+        'content_type': response['Content-Type'],
+    }
+
+
+def _cached_response(entry):
+    return HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+
+
+def anonymous_page(view):
+    """Кэш целых GET-ответов для анонимных посетителей по пути и параметрам запроса.
+
+    Версия PAGES увеличивается сигналами Car, CarService, Booking и Review.
+    Асинхронные представления получают асинхронную обертку.
+    """
+    if iscoroutinefunction(view):
+        return _anonymous_page_async(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        # Сообщения (django.contrib.messages) у каждого свои
+        if request.method != 'GET' or request.user.is_authenticated or 'messages' in request.COOKIES:
+            return view(request, *args, **kwargs)
+
+        full_key = make_key(PAGES, _page_key(request))
+        entry = cache.get(full_key)
+        if entry is None:
+            count(PAGES, 'misses')
+            rendered = {}
+
+            def compute():
+                rendered['response'] = view(request, *args, **kwargs)
+                return _page_entry(rendered['response'])
+
+            entry = single_flight(full_key, compute, PAGE_TIMEOUT)
+            if 'response' in rendered:
+                return rendered['response']
+        else:
+            count(PAGES, 'hits')
+        return _cached_response(entry)
+
+    return wrapper
+
+
+def _anonymous_page_async(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or 'messages' in request.COOKIES:
+            return await view(request, *args, **kwargs)
+        # request.user в асинхронном коде загружается только через auser()
+        user = await request.auser()
+        if user.is_authenticated:
+            return await view(request, *args, **kwargs)
+
+        full_key = make_key(PAGES, _page_key(request))
+        entry = await cache.aget(full_key)
+        if entry is None:
+            count(PAGES, 'misses')
+            rendered = {}
+
+            async def compute():
+                rendered['response'] = await view(request, *args, **kwargs)
+                return _page_entry(rendered['response'])
+
+            entry = await asingle_flight(full_key, compute, PAGE_TIMEOUT)
+            if 'response' in rendered:
+                return rendered['response']
+        else:
+            count(PAGES, 'hits')
+        return _cached_response(entry)
+
+    return wrapper
+
+
+def hit_rate(namespace):
+    """Счетчики попаданий/промахов и доля попаданий для пространства имен"""
+    hits = cache.get(f'rental:stats:{namespace}:hits', 0)
+    misses = cache.get(f'rental:stats:{namespace}:misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'rate': hits / total if total else None,
+        'version': get_version(namespace),
+    }
+
+
+def reset_stats(namespace):
+    cache.delete_many([
+        f'rental:stats:{namespace}:hits',
+        f'rental:stats:{namespace}:misses',
+    ])
@@ -0,0 +1,151 @@
+"""Условные GET-запросы: ETag и Last-Modified без отрисовки страницы.
+
+Car.updated_at меняется при сохранении машины (auto_now) и через touch() —
+сигналами бронирований, отзывов, услуг, правил цены и скидок. Страницы
+каталога и машины показывают данные всего парка (счетчики категорий,
+похожие машины), поэтому их версия — отпечаток парка: MAX(updated_at) и
+COUNT(*) одним запросом по индексу. Ответ API стоимости зависит только
+от запрошенных машин. Если версия совпала с If-None-Match/If-Modified-Since,
+conditional_get() отвечает 304, не вызывая представление.
+"""
+import hashlib
+from datetime import date, datetime, time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag as quoted
+
+from .models import Car
+
+
+def touch(*car_ids):
+    """Отмечает изменение данных машин, которых не видно в самой строке Car"""
+    car_ids = set(car_ids) - {None}
+    if car_ids:
+        Car.objects.filter(pk__in=car_ids).update(updated_at=timezone.now())
+
+
+def touch_all():
+    """То же для всех машин: правила цены и скидки меняются редко"""
+    Car.objects.update(updated_at=timezone.now())
+
+
+def _fingerprint(cars):
+    row = cars.aggregate(last_modified=Max('updated_at'), total=Count('id'))
+    return row['last_modified'], row['total']
+
+
+def _start_of_today():
+    # В карточках есть «свободна с …»: с началом дня страница меняется без правок в базе
+    return timezone.make_aware(datetime.combine(date.today(), time.min))
+
+
+def _skip(request):
+    # Сообщения (django.contrib.messages) показываются один раз — такой ответ не переиспользуется
+    return 'messages' in request.COOKIES
+
+
+def _fleet(request):
+    """Отпечаток парка, один запрос на обработку запроса"""
+    if not hasattr(request, '_fleet_fingerprint'):
+        request._fleet_fingerprint = _fingerprint(Car.objects.all())
+    return request._fleet_fingerprint
+
+
+def _etag(*parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    # Слабый: похожие машины выбираются случайно, байты ответа могут отличаться
+    return f'W/"{digest}"'
+
+
+def page_etag(request, *args, **kwargs):
+    if _skip(request):
+        return None
+    last_modified, total = _fleet(request)
+    # Для вошедших пользователей в шапке их имя — версия своя у каждого
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    return _etag(last_modified, total, date.today(), user)
+
+
+def page_last_modified(request, *args, **kwargs):
+    # Только для гостей: по одной дате нельзя отличить ответ другому пользователю
+    if _skip(request) or request.user.is_authenticated:
+        return None
+    last_modified, _ = _fleet(request)
+    if last_modified is None:
+        return None
+    return max(last_modified, _start_of_today())
+
+
+def _quote_cars(request):
+    try:
+        return sorted({int(value) for value in request.GET.getlist('car')})
+    except ValueError:
+        return None
+
+
+def quote_etag(request, *args, **kwargs):
+    car_ids = _quote_cars(request)
+    if not car_ids:
+        return None
+    last_modified, total = _fingerprint(Car.objects.filter(pk__in=car_ids))
+    return _etag(last_modified, total, car_ids)
+
+
+def _validators(etag_func, last_modified_func, request, *args, **kwargs):
+    """(ETag, Last-Modified в секундах, вошел ли пользователь) — как в condition() Django"""
+    last_modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+    etag = etag_func(request, *args, **kwargs)
+    return (
+        quoted(etag) if etag is not None else None,
+        int(last_modified.timestamp()) if last_modified else None,
+        request.user.is_authenticated,
+    )
+
+
+def _finish(request, response, etag, last_modified, authenticated):
+    if request.method in ('GET', 'HEAD'):
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        patch_cache_control(response, no_cache=True)
+        if authenticated:
+            patch_cache_control(response, private=True)
+    return response
+
+
+def conditional_get(etag_func, last_modified_func=None):
+    """condition() + Cache-Control: no-cache — браузер хранит ответ, но перед показом проверяет версию.
+
+    Без no-cache браузер по одному Last-Modified мог бы эвристически
+    показывать страницу из своего кэша, не спрашивая сервер. В отличие от
+    condition() работает и с асинхронными представлениями: функции версии
+    обращаются к ORM и сессии, поэтому вызываются через sync_to_async.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                validators = await sync_to_async(_validators)(
+                    etag_func, last_modified_func, request, *args, **kwargs
+                )
+                response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, *validators)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                validators = _validators(etag_func, last_modified_func, request, *args, **kwargs)
+                response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(request, response, *validators)
+
+        return wrapper
+
+    return decorator
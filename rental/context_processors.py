@@ -1,5 +1,12 @@
-from .models import Car
- 
+from django.utils.functional import SimpleLazyObject
+
+from . import facets
+
+
 def car_categories_processor(request):
-    categories = Car.objects.values_list('type', flat=True).distinct().order_by('type')
-    return {'car_categories': categories} 
\ No newline at end of file
+    # Фасеты берутся из кэша и только если шаблон к ним обращается
+    car_facets = SimpleLazyObject(facets.get_facets)
+    return {
+        'car_categories': SimpleLazyObject(lambda: car_facets['categories']),
+        'car_facets': car_facets,
+    }
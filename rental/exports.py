@@ -0,0 +1,124 @@
+"""Выгрузка бронирований для бухгалтерии: CSV или JSONL потоком.
+
+Бронирования читаются пачками по первичному ключу (pk > последний
+ORDER BY pk LIMIT n): память не зависит от размера выгрузки, а первая
+строка уходит клиенту до того, как прочитана последняя. .iterator() для
+этого не подходит — драйвер MySQL без серверного курсора все равно
+загружает весь результат. Дни, скидка и суммы берутся из сохраненного
+расчета (Booking.price_snapshot), без запросов на каждую строку: расчет
+пишет reservations.save, старые записи заполнила миграция 0015. У записей
+без расчета (созданных в обход reservations, например командами замеров)
+суммы в выгрузке пустые — пересчет по текущим ценам их бы исказил.
+"""
+import csv
+import json
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CHUNK_SIZE = 2000
+
+# Ключ в JSONL и заголовок колонки CSV
+COLUMNS = [
+    ('id', "Бронирование"),
+    ('status', "Статус"),
+    ('user', "Клиент"),
+    ('email', "Email"),
+    ('car_id', "ID автомобиля"),
+    ('car', "Автомобиль"),
+    ('date_from', "Дата начала"),
+    ('date_to', "Дата окончания"),
+    ('days', "Дней"),
+    ('daily_rate', "Цена за сутки"),
+    ('base_price', "Аренда"),
+    ('services', "Услуги"),
+    ('services_total', "Услуги, сумма"),
+    ('discount_percentage', "Скидка, %"),
+    ('discount_amount', "Скидка"),
+    ('total', "Итого"),
+    ('rating', "Оценка"),
+]
+
+VALUES = (
+    'pk', 'status', 'user__username', 'user__email', 'car_id', 'car__brand', 'car__name',
+    'date_from', 'date_to', 'price_snapshot', 'review__rating',
+)
+
+
+def _chunks(queryset, chunk_size):
+    queryset = queryset.order_by('pk').values(*VALUES)
+    last = None
+    while True:
+        chunk = list((queryset if last is None else queryset.filter(pk__gt=last))[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]['pk']
+
+
+def _row(values):
+    snapshot = values['price_snapshot'] or {}
+    return {
+        'id': values['pk'],
+        'status': values['status'],
+        'user': values['user__username'],
+        'email': values['user__email'],
+        'car_id': values['car_id'],
+        'car': f"{values['car__brand']} {values['car__name']}",
+        'date_from': values['date_from'].isoformat(),
+        'date_to': values['date_to'].isoformat(),
+        'days': snapshot.get('days'),
+        'daily_rate': snapshot.get('daily_rate'),
+        'base_price': snapshot.get('base_price'),
+        'services': [
+            {'name': line.get('name', line['service']), 'price': line['price']}
+            for line in snapshot.get('services', ())
+        ],
+        'services_total': snapshot.get('services_total'),
+        'discount_percentage': snapshot.get('discount_percentage'),
+        'discount_amount': snapshot.get('discount_amount'),
+        'total': snapshot.get('total'),
+        'rating': values['review__rating'],
+    }
+
+
+class _Echo:
+    """Файл для csv.writer: writerow() возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    # BOM: Excel иначе открывает UTF-8 с кириллицей в системной кодировке
+    yield '\ufeff' + writer.writerow([title for _, title in COLUMNS])
+    for chunk in _chunks(queryset, chunk_size):
+        lines = []
+        for values in chunk:
+            row = _row(values)
+            row['services'] = '; '.join(f"{line['name']} {line['price']}" for line in row['services'])
+            lines.append(writer.writerow([row[key] for key, _ in COLUMNS]))
+        yield ''.join(lines)
+
+
+def jsonl_lines(queryset, chunk_size=CHUNK_SIZE):
+    for chunk in _chunks(queryset, chunk_size):
+        yield ''.join(
+            json.dumps(_row(values), ensure_ascii=False, cls=DjangoJSONEncoder) + '\n' for values in chunk
+        )
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+def streaming_response(queryset, export_format):
+    """Ответ-вложение, который отдается клиенту по мере чтения пачек"""
+    lines, content_type = FORMATS[export_format]
+    response = StreamingHttpResponse(lines(queryset), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="bookings-{date.today()}.{export_format}"'
+    return response
@@ -0,0 +1,54 @@
+"""Фасеты каталога: типы кузова, бренды и гистограмма цен.
+
+Считаются одним запросом и хранятся в версионированном кэше (rental.caching),
+версия увеличивается сигналами сохранения и удаления Car, поэтому
+в установившемся режиме меню категорий и фильтры не делают запросов.
+"""
+from decimal import Decimal
+
+from . import caching
+from .models import Car
+
+NAMESPACE = 'facets'
+# Ширина корзины гистограммы цен, AED за сутки
+PRICE_BUCKET = Decimal(1000)
+
+
+def compute():
+    types = {}
+    brands = {}
+    histogram = {}
+    categories = set()
+    all_brands = set()
+    for car_type, brand, price, is_available in Car.objects.values_list(
+        'type', 'brand', 'price', 'is_available'
+    ):
+        categories.add(car_type)
+        all_brands.add(brand)
+        if not is_available:
+            continue
+        types[car_type] = types.get(car_type, 0) + 1
+        brands[brand] = brands.get(brand, 0) + 1
+        bucket = int(price // PRICE_BUCKET * PRICE_BUCKET)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    return {
+        'categories': sorted(categories),
+        # Все бренды, включая недоступные машины (фильтры админки)
+        'all_brands': sorted(all_brands),
+        'types': types,
+        'brands': dict(sorted(brands.items())),
+        'price_histogram': [
+            (bucket, bucket + int(PRICE_BUCKET), count)
+            for bucket, count in sorted(histogram.items())
+        ],
+    }
+
+
+def get_facets():
+    # Суффикс — формат записи: прежние записи без all_brands не читаются
+    return caching.cached(NAMESPACE, 'all:2', compute)
+
+
+def invalidate():
+    caching.bump_version(NAMESPACE)
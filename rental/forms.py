@@ -1,8 +1,12 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import Booking, Review
+from . import availability
 from datetime import date
 
+# Максимальная длительность аренды, дней
+MAX_RENTAL_DAYS = 90
+
 class UserProfileForm(forms.ModelForm):
     first_name = forms.CharField(max_length=30, required=False, label='Имя',
                                widget=forms.TextInput(attrs={'class': 'form-control'}))
@@ -96,12 +100,11 @@ class BookingForm(forms.ModelForm):
         date_from = self.cleaned_data.get('date_from')
 
         if date_to and date_from:
-            # Проверяем максимальную длительность аренды (например, не более 90 дней)
-            max_rental_days = 90
+            # Проверяем максимальную длительность аренды
             rental_days = (date_to - date_from).days + 1
-            if rental_days > max_rental_days:
+            if rental_days > MAX_RENTAL_DAYS:
                 raise forms.ValidationError(
-                    f'Максимальный срок аренды - {max_rental_days} дней. '
+                    f'Максимальный срок аренды - {MAX_RENTAL_DAYS} дней. '
                     f'Вы выбрали {rental_days} дней.'
                 )
 
@@ -132,15 +135,9 @@ class BookingForm(forms.ModelForm):
             if date_to < date_from:
                 raise forms.ValidationError('Дата окончания аренды не может быть раньше даты начала')
 
-            # Проверка доступности автомобиля на выбранные даты
+            # Проверка доступности автомобиля на выбранные даты по битовой карте занятости
             if hasattr(self, 'car'):
-                overlapping_bookings = Booking.objects.filter(
-                    car=self.car,
-                    status='confirmed',
-                    date_from__lte=date_to,
-                    date_to__gte=date_from
-                )
-                if overlapping_bookings.exists():
+                if not availability.is_range_free(self.car, date_from, date_to):
                     raise forms.ValidationError('Автомобиль уже забронирован на выбранные даты')
 
         return cleaned_data 
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental import reservations
+
+
+class Command(BaseCommand):
+    help = ("Подтверждает ожидающие бронирования и отменяет пересекающиеся: "
+            "заметающая прямая по периодам каждой машины, победитель — по приоритету.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('car_ids', nargs='*', type=int, help="ID автомобилей (по умолчанию все)")
+        parser.add_argument('--priority', choices=list(reservations.PRIORITIES), default='fifo',
+                            help="fifo — первая заявка, longest — самая долгая аренда, "
+                                 "revenue — наибольшая выручка")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, ничего не менять")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = reservations.auto_confirm(
+            options['car_ids'] or None, options['priority'], dry_run=options['dry_run']
+        )
+        elapsed = time.perf_counter() - started
+        prefix = "будет " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}подтверждено: {len(result['confirmed'])}, {prefix}отменено: {len(result['cancelled'])} "
+            f"за {elapsed:.2f} с"
+        ))
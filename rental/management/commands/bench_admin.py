@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from rental.models import Car
+
+CHANGELISTS = [
+    '/admin/rental/booking/',
+    '/admin/rental/booking/?status__exact=confirmed',
+    '/admin/rental/booking/?q={name}',
+    '/admin/rental/review/',
+    '/admin/rental/review/?q={name}',
+    '/admin/rental/car/',
+    '/admin/rental/car/?q={name}',
+]
+
+
+class Command(BaseCommand):
+    help = ("Время ответа списков админки (бронирования, отзывы, машины) с фильтрами и поиском. "
+            "Завершается ошибкой, если медиана какого-либо списка превышает --budget-ms.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget-ms', type=float, default=300, help="Допустимая медиана ответа, мс")
+        parser.add_argument('--repeat', type=int, default=5, help="Запросов на каждый адрес")
+
+    def handle(self, *args, **options):
+        admin_user = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if admin_user is None:
+            raise CommandError("Нет активного суперпользователя")
+        car_name = Car.objects.order_by('pk').values_list('name', flat=True).first() or ''
+        client = Client()
+        client.force_login(admin_user)
+
+        self.stdout.write(f"{'адрес':<50} {'мед. мс':>8} {'макс. мс':>9} {'запросов':>9}")
+        over_budget = []
+        for template in CHANGELISTS:
+            url = template.format(name=car_name[:3])
+            # Первый запрос прогревает кэш фильтров
+            client.get(url)
+            timings = []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f"{url}: код ответа {response.status_code}")
+            median = statistics.median(timings)
+            self.stdout.write(f"{url:<50} {median:>8.1f} {max(timings):>9.1f} {len(queries):>9}")
+            if median > options['budget_ms']:
+                over_budget.append(url)
+
+        if over_budget:
+            raise CommandError(f"Превышен бюджет {options['budget_ms']:.0f} мс: {', '.join(over_budget)}")
+        self.stdout.write(self.style.SUCCESS(f"Все списки укладываются в {options['budget_ms']:.0f} мс"))
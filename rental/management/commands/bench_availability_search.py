@@ -0,0 +1,77 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from rental.models import Booking, Car
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Замеряет время поиска свободных машин по датам (анти-join по индексу "
+            "car/status/date_from/date_to) при росте таблицы бронирований. "
+            "Тестовые данные создаются в транзакции и откатываются.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000],
+                            help="Размеры таблицы бронирований для замеров")
+        parser.add_argument('--cars', type=int, default=50, help="Количество тестовых автомобилей")
+        parser.add_argument('--repeat', type=int, default=20, help="Повторов запроса на замер")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(42)
+        user = User.objects.create(username=f'bench-{time.time_ns()}')
+        cars = Car.objects.bulk_create(
+            Car(name=f'Bench {i}', brand='Bench', type='Bench', price=rng.randint(500, 5000))
+            for i in range(options['cars'])
+        )
+        car_ids = [car.pk for car in cars]
+        # История за 10 лет в прошлом, поиск — в ближайшие недели
+        history_start = date.today() - timedelta(days=3650)
+        created = 0
+        today = date.today()
+
+        self.stdout.write(f"{'бронирований':>14} {'мс/запрос':>10} {'найдено':>8}")
+        for size in sorted(options['sizes']):
+            while created < size:
+                batch = min(options['batch_size'], size - created)
+                bookings = []
+                for _ in range(batch):
+                    start = history_start + timedelta(days=rng.randrange(3650))
+                    bookings.append(Booking(
+                        user=user,
+                        car_id=rng.choice(car_ids),
+                        date_from=start,
+                        date_to=start + timedelta(days=rng.randint(1, 14)),
+                        status=rng.choice(('confirmed', 'confirmed', 'pending', 'cancelled')),
+                    ))
+                Booking.objects.bulk_create(bookings, batch_size=options['batch_size'])
+                created += batch
+
+            elapsed = []
+            found = 0
+            for _ in range(options['repeat']):
+                date_from = today + timedelta(days=rng.randrange(60))
+                date_to = date_from + timedelta(days=rng.randint(1, 14))
+                busy = Booking.objects.filter(car=OuterRef('pk')).confirmed().overlapping(date_from, date_to)
+                started = time.perf_counter()
+                found = len(Car.objects.filter(pk__in=car_ids).filter(~Exists(busy)).order_by('price'))
+                elapsed.append(time.perf_counter() - started)
+            elapsed.sort()
+            self.stdout.write(f"{created:>14} {elapsed[len(elapsed) // 2] * 1000:>10.2f} {found:>8}")
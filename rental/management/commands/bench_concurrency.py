@@ -0,0 +1,176 @@
+import asyncio
+import importlib
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.urls import clear_url_caches
+
+from rental.models import Car
+
+HOST = 'localhost'
+
+
+def use_async_views(enabled):
+    """Переключает маршруты каталога, машины и API на rental.async_views (или обратно)"""
+    settings.ASYNC_READ_VIEWS = enabled
+    clear_url_caches()
+    importlib.reload(importlib.import_module('rental.urls'))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+
+def wsgi_request(application, path, query):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    response = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        for _ in response:
+            pass
+    finally:
+        # close() отправляет request_finished: соединение с базой возвращается как у сервера
+        response.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_request(application, path, query):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', HOST.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    body_sent = False
+    status = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается; ожидание отменит сам обработчик
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный замер страниц только для чтения: WSGI с синхронными представлениями "
+            "против ASGI с rental.async_views при одинаковом числе одновременных запросов. "
+            "Обработчики Django вызываются в этом процессе, без сетевого сервера: "
+            "WSGI обслуживает --concurrency потоков (как gunicorn --threads), "
+            "ASGI — один цикл событий (как один воркер uvicorn).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help="Запросов на каждый режим")
+        parser.add_argument('--concurrency', type=int, default=16, help="Одновременных запросов")
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="Адрес (можно несколько); по умолчанию каталог, машина и API стоимости")
+        parser.add_argument('--bypass-page-cache', action='store_true',
+                            help="Уникальный параметр в каждом запросе: страницы не берутся из кэша")
+
+    def handle(self, *args, **options):
+        urls = options['paths'] or self._default_paths()
+        if not urls:
+            self.stdout.write("Нет автомобилей для замера")
+            return
+        targets = []
+        for number in range(options['requests']):
+            path, _, query = urls[number % len(urls)].partition('?')
+            if options['bypass_page_cache']:
+                query = f'{query}&_={number}' if query else f'_={number}'
+            targets.append((path, query))
+
+        initial = settings.ASYNC_READ_VIEWS
+        self.stdout.write(f"запросов: {len(targets)}, одновременно: {options['concurrency']}")
+        self.stdout.write(f"{'режим':<6} {'запр/с':>8} {'p50 мс':>8} {'p95 мс':>8} {'ошибок':>7}")
+        try:
+            use_async_views(False)
+            self._report('WSGI', *self._run_wsgi(targets, options['concurrency']))
+            use_async_views(True)
+            self._report('ASGI', *asyncio.run(self._run_asgi(targets, options['concurrency'])))
+        finally:
+            use_async_views(initial)
+
+    def _default_paths(self):
+        car_id = Car.objects.filter(is_available=True).values_list('id', flat=True).first()
+        if car_id is None:
+            return []
+        date_from = date.today() + timedelta(days=7)
+        date_to = date_from + timedelta(days=4)
+        return ['/', f'/car/{car_id}/', f'/api/quote/?car={car_id}&range={date_from}:{date_to}']
+
+    def _run_wsgi(self, targets, concurrency):
+        application = WSGIHandler()
+        for path, query in targets[:concurrency]:
+            wsgi_request(application, path, query)
+
+        def timed(target):
+            started = time.perf_counter()
+            status = wsgi_request(application, *target)
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, targets))
+        return time.perf_counter() - started, results
+
+    async def _run_asgi(self, targets, concurrency):
+        application = ASGIHandler()
+        for path, query in targets[:concurrency]:
+            await asgi_request(application, path, query)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(target):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await asgi_request(application, *target)
+                return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(timed(target) for target in targets))
+        return time.perf_counter() - started, results
+
+    def _report(self, mode, elapsed, results):
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        errors = sum(status >= 400 for _, status in results)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{mode:<6} {len(results) / elapsed:>8.1f} {statistics.median(latencies):>8.1f} "
+            f"{p95:>8.1f} {errors:>7}"
+        )
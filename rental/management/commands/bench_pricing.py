@@ -0,0 +1,81 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from rental import rates
+from rental.models import Car
+
+
+def legacy_quote(price, days):
+    """Прежняя цепочка свойств Booking: плоская цена × дни и скидка if/elif"""
+    base_price = price * days
+    if days >= 30:
+        percentage = 20
+    elif days >= 14:
+        percentage = 15
+    elif days >= 7:
+        percentage = 10
+    elif days >= 3:
+        percentage = 5
+    else:
+        percentage = 0
+    return base_price - base_price * percentage / 100
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает расчет стоимости по скомпилированным таблицам (rental.rates) "
+            "с посуточным вычислением правил и с прежней цепочкой свойств Booking.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=10_000, help="Количество расчетов")
+        parser.add_argument('--days', type=int, default=90, help="Длительность аренды")
+
+    def handle(self, *args, **options):
+        cars = list(Car.objects.values_list('id', 'brand', 'price'))
+        if not cars:
+            self.stdout.write("Нет автомобилей для замера")
+            return
+
+        started = time.perf_counter()
+        rates.compile_all()
+        self.stdout.write(f"компиляция таблиц: {(time.perf_counter() - started) * 1000:.1f} мс, "
+                          f"машин: {len(cars)}")
+
+        rng = random.Random(42)
+        days = options['days']
+        today = date.today()
+        quotes = []
+        for _ in range(options['quotes']):
+            date_from = today + timedelta(days=rng.randrange(rates.HORIZON_DAYS - days))
+            quotes.append((rng.choice(cars), date_from, date_from + timedelta(days=days - 1)))
+
+        def compiled():
+            for (car_id, brand, _), date_from, date_to in quotes:
+                base_price = rates.base_price(car_id, date_from, date_to)
+                base_price - base_price * rates.discount_percentage(days, brand) / 100
+
+        def evaluated():
+            for (car_id, brand, _), date_from, date_to in quotes:
+                base_price = rates.evaluate_base_price(car_id, date_from, date_to)
+                base_price - base_price * rates.discount_percentage(days, brand) / 100
+
+        def legacy():
+            for (_, _, price), _, _ in quotes:
+                legacy_quote(price, days)
+
+        self.stdout.write(f"{'способ':<24} {'мкс/расчет':>10}")
+        for name, run in (('цепочка свойств', legacy), ('посуточные правила', evaluated),
+                          ('скомпилированные', compiled)):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:<24} {elapsed / len(quotes) * 1e6:>10.2f}")
+
+        mismatches = sum(
+            rates.base_price(car_id, date_from, date_to)
+            != rates.evaluate_base_price(car_id, date_from, date_to)
+            for (car_id, _, _), date_from, date_to in quotes
+        )
+        self.stdout.write(f"расхождений с посуточным расчетом: {mismatches}")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from rental import thumbnails
+from rental.models import Car
+
+
+class Command(BaseCommand):
+    help = "Создает WebP/JPEG-копии фотографий автомобилей (rental.thumbnails) для уже загруженных файлов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Пересоздать существующие копии")
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        seen = set()
+        for car in Car.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image').iterator():
+            if car.image.name in seen:
+                continue
+            seen.add(car.image.name)
+            try:
+                renditions = thumbnails.generate(car.image, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f"{car.image.name}: {error}")
+                continue
+            done += 1
+            if options['verbosity'] > 1:
+                widths = ', '.join(str(width) for width, _ in renditions['webp'])
+                self.stdout.write(f"{car.image.name}: {widths}")
+        self.stdout.write(self.style.SUCCESS(f"Обработано фотографий: {done}, ошибок: {failed}"))
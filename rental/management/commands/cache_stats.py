@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from rental import caching
+
+
+class Command(BaseCommand):
+    help = "Показывает долю попаданий в кэш по пространствам имен"
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespaces', nargs='*', default=['facets', 'pricing', 'pages', 'fragments'])
+        parser.add_argument('--reset', action='store_true', help="Обнулить счетчики после вывода")
+
+    def handle(self, *args, **options):
+        for namespace in options['namespaces']:
+            stats = caching.hit_rate(namespace)
+            rate = f"{stats['rate']:.1%}" if stats['rate'] is not None else "—"
+            self.stdout.write(
+                f"{namespace}: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                f"доля {rate}, версия {stats['version']}"
+            )
+            if options['reset']:
+                caching.reset_stats(namespace)
@@ -0,0 +1,112 @@
+import os
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from rental import storage, thumbnails
+from rental.models import Car, MediaBlob
+
+
+class Command(BaseCommand):
+    help = ("Удаляет фото автомобилей, на которые не ссылается ни одна машина "
+            "(MediaBlob.refcount = 0 дольше --grace-hours), вместе с их уменьшенными копиями.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Не трогать файлы, загруженные или привязанные позже этого срока")
+        parser.add_argument('--recount', action='store_true',
+                            help="Пересчитать ссылки по Car.image и учесть файлы, которых нет в MediaBlob")
+        parser.add_argument('--ingest', action='store_true',
+                            help="Пересохранить фото со старыми именами в хранилище по хэшу")
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет удалено")
+
+    def handle(self, *args, **options):
+        field_storage = Car._meta.get_field('image').storage
+        if options['ingest']:
+            self._ingest(options['dry_run'])
+        if options['recount']:
+            self._recount(field_storage, options['dry_run'])
+
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        removed = freed = 0
+        candidates = MediaBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff)
+        for blob_id in candidates.values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                blob = MediaBlob.objects.select_for_update().filter(
+                    pk=blob_id, refcount__lte=0, updated_at__lt=cutoff
+                ).first()
+                # Счетчик мог разойтись — проверяем ссылки напрямую
+                if blob is None or Car.objects.filter(image=blob.name).exists():
+                    continue
+                exists = field_storage.exists(blob.name)
+                size = field_storage.size(blob.name) if exists else 0
+                if options['dry_run']:
+                    self.stdout.write(f"удалить {blob.name}")
+                else:
+                    if exists:
+                        thumbnails.delete_renditions(Car(image=blob.name).image)
+                        field_storage.delete(blob.name)
+                    blob.delete()
+                removed += 1
+                freed += size
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено файлов: {removed}, освобождено: {freed / 1024 / 1024:.1f} МБ"
+        ))
+
+    def _ingest(self, dry_run):
+        cars = Car.objects.exclude(image='').exclude(image__isnull=True)
+        ingested = 0
+        for car in cars.iterator():
+            if storage.digest_of(car.image.name):
+                continue
+            if dry_run:
+                self.stdout.write(f"пересохранить {car.image.name}")
+                continue
+            with car.image.open('rb') as original:
+                data = original.read()
+            car.image.save(os.path.basename(car.image.name), ContentFile(data), save=False)
+            car.save()
+            ingested += 1
+        self.stdout.write(f"Пересохранено фото: {ingested}")
+
+    def _recount(self, field_storage, dry_run):
+        references = dict(
+            Car.objects.exclude(image='').exclude(image__isnull=True).values('image').annotate(
+                total=Count('id')
+            ).order_by().values_list('image', 'total')
+        )
+        known = dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+        # Файлы на диске, о которых MediaBlob не знает (старые загрузки)
+        directory = Car._meta.get_field('image').upload_to.rstrip('/')
+        on_disk = set(self._walk(field_storage, directory))
+        missing = [
+            MediaBlob(name=name, size=field_storage.size(name), refcount=references.get(name, 0))
+            for name in on_disk - known.keys()
+        ]
+        fixed = [
+            (name, references.get(name, 0)) for name, refcount in known.items()
+            if refcount != references.get(name, 0)
+        ]
+        if dry_run:
+            self.stdout.write(f"Новых записей: {len(missing)}, исправленных счетчиков: {len(fixed)}")
+            return
+        MediaBlob.objects.bulk_create(missing, batch_size=500)
+        for name, refcount in fixed:
+            MediaBlob.objects.filter(name=name).update(refcount=refcount)
+        self.stdout.write(f"Новых записей: {len(missing)}, исправленных счетчиков: {len(fixed)}")
+
+    def _walk(self, field_storage, directory):
+        try:
+            directories, files = field_storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for filename in files:
+            yield f'{directory}/{filename}'
+        for name in directories:
+            yield from self._walk(field_storage, f'{directory}/{name}')
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental import outbox
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди OutboxEmail пачками с повторами"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, опрашивая очередь")
+        parser.add_argument('--interval', type=float, default=5.0, help="Пауза между опросами, сек")
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            # Разбираем очередь до конца, затем засыпаем (или выходим)
+            while True:
+                sent, failed = outbox.deliver_pending(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < options['batch_size']:
+                    break
+            if total_sent or total_failed or not options['loop']:
+                self.stdout.write(f"Отправлено: {total_sent}, ошибок: {total_failed}")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
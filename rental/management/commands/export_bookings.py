@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rental import exports
+from rental.models import Booking
+
+
+class Command(BaseCommand):
+    help = ("Выгружает бронирования с клиентом, машиной, услугами, днями, скидкой, суммой и оценкой "
+            "в CSV или JSONL. Пишет по мере чтения пачек, память не зависит от объема.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', default='-', help="Файл (по умолчанию stdout)")
+        parser.add_argument('--year', type=int, help="Бронирования, начинающиеся в этом году")
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help="Начало не раньше (ГГГГ-ММ-ДД)")
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help="Начало не позже (ГГГГ-ММ-ДД)")
+        parser.add_argument('--status', action='append',
+                            choices=[value for value, _ in Booking._meta.get_field('status').choices],
+                            help="Статус (можно несколько)")
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['year']:
+            bookings = bookings.filter(date_from__year=options['year'])
+        if options['date_from']:
+            bookings = bookings.filter(date_from__gte=options['date_from'])
+        if options['date_to']:
+            bookings = bookings.filter(date_from__lte=options['date_to'])
+        if options['status']:
+            bookings = bookings.filter(status__in=options['status'])
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size должен быть положительным")
+
+        lines, _ = exports.FORMATS[options['format']]
+        if options['output'] == '-':
+            for text in lines(bookings, options['chunk_size']):
+                self.stdout.write(text, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for text in lines(bookings, options['chunk_size']):
+                output.write(text)
+        self.stdout.write(self.style.SUCCESS(f"Выгрузка записана в {options['output']}"))
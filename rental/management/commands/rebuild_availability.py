@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from rental import availability
+
+
+class Command(BaseCommand):
+    help = "Перестраивает битовые карты занятости автомобилей по подтвержденным бронированиям"
+
+    def add_arguments(self, parser):
+        parser.add_argument('car_ids', nargs='*', type=int, help="ID автомобилей (по умолчанию все)")
+
+    def handle(self, *args, **options):
+        maps = availability.rebuild(options['car_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Перестроено карт занятости: {len(maps)}"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rental import stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает статистику доступного парка с нуля и сообщает о расхождениях"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Только проверить расхождения, ничего не меняя")
+
+    def handle(self, *args, **options):
+        drift = stats.find_drift()
+        for car_type, stored, expected in drift:
+            self.stdout.write(self.style.WARNING(
+                f"{car_type or 'весь парк'}: сохранено {stored}, ожидается {expected}"
+            ))
+
+        if options['check']:
+            if drift:
+                raise CommandError(f"Расхождений: {len(drift)}")
+            self.stdout.write(self.style.SUCCESS("Статистика парка актуальна"))
+            return
+
+        rebuilt = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Статистика пересчитана: корзин {len(rebuilt)}, исправлено расхождений {len(drift)}"
+        ))
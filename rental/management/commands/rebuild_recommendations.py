@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rental import recommendations
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает списки похожих автомобилей для всего парка"
+
+    def handle(self, *args, **options):
+        total = recommendations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Рекомендации пересчитаны для {total} автомобилей"))
@@ -0,0 +1,38 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from rental import search
+from rental.models import Car
+
+
+class Command(BaseCommand):
+    help = ("Пересобирает поисковый индекс парка (названия, бренды, типы кузова, отзывы). "
+            "С --bench замеряет время поиска по префиксам названий и брендов.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bench', action='store_true', help="Замерить время поиска после пересборки")
+        parser.add_argument('--repeat', type=int, default=20, help="Повторов каждого запроса при замере")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        cars, terms = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Индекс пересобран: {cars} автомобилей, {terms} слов за {time.perf_counter() - started:.2f} с"
+        ))
+        if options['bench']:
+            self._bench(options['repeat'])
+
+    def _bench(self, repeat):
+        queries = set()
+        for brand, name in Car.objects.order_by('pk').values_list('brand', 'name')[:5]:
+            queries.update([brand[:2], f'{brand} {name}', name[:3]])
+        self.stdout.write(f"{'запрос':<30} {'мс':>7} {'найдено':>8}")
+        for query in sorted(queries):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                found = search.search(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f"{query:<30} {statistics.median(timings):>7.2f} {len(found):>8}")
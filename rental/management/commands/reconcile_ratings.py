@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from rental import ratings
+
+
+class Command(BaseCommand):
+    help = "Сверяет статистику отзывов автомобилей с отзывами и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только показать расхождения")
+
+    def handle(self, *args, **options):
+        drift = ratings.find_drift()
+        for car_id, stored, expected in drift:
+            self.stdout.write(self.style.WARNING(
+                f"Автомобиль {car_id}: сумма/количество {stored}, ожидается {expected}"
+            ))
+        if options['dry_run']:
+            self.stdout.write(f"Расхождений: {len(drift)}")
+            return
+        fixed = ratings.reconcile(drift)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено автомобилей: {fixed}"))
@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, connections
+from django.db.models import Exists, OuterRef
+
+from rental import reservations
+from rental.models import Booking, Car
+
+STRESS_USERNAME = 'stress-bookings'
+
+
+def naive_reserve(user, car, date_from, date_to):
+    """Прежний порядок book_car: проверка без блокировки, затем отдельное сохранение"""
+    if reservations.find_conflict(car.pk, date_from, date_to):
+        raise reservations.BookingConflict()
+    booking = Booking.objects.create(user=user, car=car, date_from=date_from, date_to=date_to, status='pending')
+    # Администратор подтверждает «по очереди», не видя параллельной заявки
+    Booking.objects.filter(pk=booking.pk).update(status='confirmed')
+    return booking
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочная проверка бронирования: потоки одновременно бронируют и подтверждают "
+            "пересекающиеся периоды нескольких машин, затем ищутся пересечения подтвержденных броней. "
+            "Созданные бронирования удаляются. На SQLite SELECT ... FOR UPDATE не поддерживается — "
+            "для осмысленного результата нужна MySQL/PostgreSQL или OPTIONS 'transaction_mode': 'IMMEDIATE'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Параллельных потоков")
+        parser.add_argument('--attempts', type=int, default=500, help="Попыток бронирования всего")
+        parser.add_argument('--cars', type=int, default=2, help="Сколько машин делят нагрузку")
+        parser.add_argument('--window', type=int, default=20, help="Окно дат в днях (чем меньше, тем больше конфликтов)")
+        parser.add_argument('--naive', action='store_true',
+                            help="Для сравнения: проверка и сохранение без блокировки")
+        parser.add_argument('--keep', action='store_true', help="Не удалять созданные бронирования")
+
+    def handle(self, *args, **options):
+        cars = list(Car.objects.order_by('pk')[:options['cars']])
+        if not cars:
+            self.stdout.write("Нет автомобилей для проверки")
+            return
+        user, _ = User.objects.get_or_create(username=STRESS_USERNAME, defaults={'is_active': False})
+        # Окно далеко в будущем, чтобы не пересекаться с настоящими бронированиями
+        start = date.today() + timedelta(days=300)
+        rng = random.Random(42)
+        plan = []
+        for _ in range(options['attempts']):
+            date_from = start + timedelta(days=rng.randrange(options['window']))
+            plan.append((rng.choice(cars), date_from, date_from + timedelta(days=rng.randrange(4))))
+
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def attempt(task):
+            car, date_from, date_to = task
+            try:
+                if options['naive']:
+                    naive_reserve(user, car, date_from, date_to)
+                else:
+                    booking = reservations.reserve(user, car, date_from, date_to)
+                    reservations.confirm(booking)
+                outcome = 'confirmed'
+            except reservations.BookingConflict:
+                outcome = 'conflict'
+            except DatabaseError:
+                outcome = 'error'
+            with lock:
+                outcomes[outcome] += 1
+
+        def run(task):
+            try:
+                attempt(task)
+            finally:
+                # У каждого потока свое соединение с базой
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(run, plan))
+        elapsed = time.perf_counter() - started
+
+        created = Booking.objects.filter(user=user)
+        overlaps = created.filter(status='confirmed').filter(Exists(
+            Booking.objects.filter(
+                car=OuterRef('car'), status='confirmed',
+                date_from__lte=OuterRef('date_to'), date_to__gte=OuterRef('date_from'),
+            ).exclude(pk=OuterRef('pk'))
+        ))
+        double_booked = overlaps.count()
+
+        self.stdout.write(f"база: {connection.vendor}, потоков: {options['threads']}, машин: {len(cars)}, "
+                          f"режим: {'без блокировки' if options['naive'] else 'reservations'}")
+        self.stdout.write(f"попыток: {len(plan)} за {elapsed:.2f} с ({len(plan) / elapsed:.0f}/с)")
+        self.stdout.write(f"подтверждено: {outcomes['confirmed']}, конфликтов: {outcomes['conflict']}, "
+                          f"ошибок базы: {outcomes['error']}")
+        style = self.style.SUCCESS if not double_booked else self.style.ERROR
+        self.stdout.write(style(f"подтвержденных броней с пересечениями: {double_booked}"))
+
+        if not options['keep']:
+            # Удаление по одной: сигналы пересчитывают карты доступности
+            for booking in created.iterator():
+                booking.delete()
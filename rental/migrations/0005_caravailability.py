@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0004_car_average_rating_car_total_reviews_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Начало горизонта')),
+                ('bitmap', models.BinaryField(default=b'', verbose_name='Битовая карта занятости')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='rental.car', verbose_name='Автомобиль')),
+            ],
+            options={
+                'verbose_name': 'Занятость автомобиля',
+                'verbose_name_plural': 'Занятость автомобилей',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0005_caravailability'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['car', 'status', 'date_from', 'date_to'], name='booking_car_status_dates_idx'),
+        ),
+    ]
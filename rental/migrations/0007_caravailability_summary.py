@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0006_booking_car_status_dates_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caravailability',
+            name='next_booked_from',
+            field=models.DateField(blank=True, null=True, verbose_name='Ближайшая аренда с'),
+        ),
+        migrations.AddField(
+            model_name='caravailability',
+            name='next_booked_to',
+            field=models.DateField(blank=True, null=True, verbose_name='Ближайшая аренда по'),
+        ),
+        migrations.AddField(
+            model_name='caravailability',
+            name='next_free_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Ближайшая свободная дата'),
+        ),
+        migrations.AddField(
+            model_name='caravailability',
+            name='upcoming',
+            field=models.JSONField(blank=True, default=list, verbose_name='Ближайшие периоды аренды'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0007_caravailability_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('car_type', models.CharField(blank=True, max_length=50, unique=True, verbose_name='Тип кузова')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Количество автомобилей')),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма цен за сутки')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Минимальная цена')),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Максимальная цена')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика парка',
+                'verbose_name_plural': 'Статистика парка',
+            },
+        ),
+    ]
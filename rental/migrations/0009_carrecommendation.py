@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0008_fleetstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Схожесть')),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='rental.car', verbose_name='Автомобиль')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rental.car', verbose_name='Похожий автомобиль')),
+            ],
+            options={
+                'verbose_name': 'Похожий автомобиль',
+                'verbose_name_plural': 'Похожие автомобили',
+                'ordering': ['-score'],
+                'unique_together': {('car', 'recommended')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:13
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_sum(apps, schema_editor):
+    """Заполняет сумму и количество публичных оценок по существующим отзывам"""
+    Car = apps.get_model('rental', 'Car')
+    Review = apps.get_model('rental', 'Review')
+    rows = Review.objects.filter(is_public=True).values('booking__car').annotate(
+        rating_sum=Sum('rating'), total=Count('id')
+    ).order_by()
+    for row in rows:
+        Car.objects.filter(pk=row['booking__car']).update(
+            rating_sum=row['rating_sum'],
+            total_reviews=row['total'],
+            average_rating=round(row['rating_sum'] / row['total'], 2),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0010_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_sum, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:16
+
+import django.db.models.deletion
+import rental.models
+from django.db import migrations, models
+
+
+# Ступени, которые раньше были зашиты в Car.get_discount_percentage
+DEFAULT_TIERS = ((3, 5), (7, 10), (14, 15), (30, 20))
+
+
+def create_default_tiers(apps, schema_editor):
+    DiscountTier = apps.get_model('rental', 'DiscountTier')
+    DiscountTier.objects.bulk_create(
+        DiscountTier(brand='', min_days=min_days, percentage=percentage)
+        for min_days, percentage in DEFAULT_TIERS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0011_car_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand', models.CharField(blank=True, max_length=100, verbose_name='Бренд')),
+                ('min_days', models.PositiveIntegerField(verbose_name='От дней')),
+                ('percentage', models.PositiveSmallIntegerField(verbose_name='Скидка, %')),
+            ],
+            options={
+                'verbose_name': 'Скидка за длительность',
+                'verbose_name_plural': 'Скидки за длительность',
+                'ordering': ['brand', 'min_days'],
+                'unique_together': {('brand', 'min_days')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('brand', models.CharField(blank=True, max_length=100, verbose_name='Бренд')),
+                ('car_type', models.CharField(blank=True, max_length=50, verbose_name='Тип кузова')),
+                ('date_from', models.DateField(blank=True, null=True, verbose_name='Действует с')),
+                ('date_to', models.DateField(blank=True, null=True, verbose_name='Действует по')),
+                ('weekdays', models.CharField(blank=True, help_text='Номера дней недели (0 — понедельник, 6 — воскресенье), например 56 для выходных', max_length=7, verbose_name='Дни недели')),
+                ('multiplier', models.DecimalField(decimal_places=2, default=1, max_digits=5, verbose_name='Множитель цены')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активно')),
+                ('car', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='rental.car', verbose_name='Автомобиль')),
+            ],
+            options={
+                'verbose_name': 'Правило цены',
+                'verbose_name_plural': 'Правила цен',
+                'ordering': ['id'],
+            },
+            bases=(rental.models.TrackedStateMixin, models.Model),
+        ),
+        migrations.RunPython(create_default_tiers, migrations.RunPython.noop),
+    ]
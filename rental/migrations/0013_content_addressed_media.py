@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:20
+
+import rental.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def register_existing_images(apps, schema_editor):
+    """Заводит MediaBlob для уже загруженных фото с текущим числом ссылок"""
+    Car = apps.get_model('rental', 'Car')
+    MediaBlob = apps.get_model('rental', 'MediaBlob')
+    rows = Car.objects.exclude(image='').exclude(image__isnull=True).values('image').annotate(
+        total=Count('id')
+    ).order_by()
+    MediaBlob.objects.bulk_create(
+        MediaBlob(name=row['image'], refcount=row['total']) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0012_pricing_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Размер')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Загружен')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлен')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+            },
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=rental.storage.ContentAddressedStorage(), upload_to='cars/', verbose_name='Фото'),
+        ),
+        migrations.RunPython(register_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return str(Decimal(value).quantize(CENT))
+
+
+def fill_price_snapshots(apps, schema_editor):
+    """Расчет для существующих бронирований: плоская цена машины, услуги и ступени скидки"""
+    Booking = apps.get_model('rental', 'Booking')
+    DiscountTier = apps.get_model('rental', 'DiscountTier')
+
+    steps = defaultdict(list)
+    for brand, min_days, percentage in DiscountTier.objects.values_list('brand', 'min_days', 'percentage'):
+        steps[brand].append((min_days, percentage))
+
+    def discount(days, brand):
+        brand_steps = steps.get(brand) or steps.get('', [])
+        return max((percentage for min_days, percentage in brand_steps if days >= min_days), default=0)
+
+    services = defaultdict(list)
+    Through = Booking.services.through
+    for booking_id, service_id, name, price in Through.objects.values_list(
+        'booking_id', 'carservice__service_id', 'carservice__service__name', 'carservice__price'
+    ).order_by('carservice__service_id'):
+        services[booking_id].append((service_id, name, price))
+
+    batch = []
+    for booking in Booking.objects.select_related('car').iterator(chunk_size=500):
+        days = (booking.date_to - booking.date_from).days + 1
+        base_price = booking.car.price * days
+        services_total = sum((price for _, _, price in services[booking.pk]), Decimal(0)) * days
+        percent = discount(days, booking.car.brand)
+        subtotal = base_price + services_total
+        discount_amount = subtotal * percent / 100
+        booking.price_snapshot = {
+            'car': booking.car_id,
+            'date_from': booking.date_from.isoformat(),
+            'date_to': booking.date_to.isoformat(),
+            'days': days,
+            'daily_rate': _money(booking.car.price),
+            'base_price': _money(base_price),
+            'services': [
+                {'service': service_id, 'name': name, 'price': _money(price)}
+                for service_id, name, price in services[booking.pk]
+            ],
+            'services_total': _money(services_total),
+            'discount_percentage': percent,
+            'discount_amount': _money(discount_amount),
+            'total': _money(subtotal - discount_amount),
+        }
+        booking.total_amount = Decimal(booking.price_snapshot['total'])
+        batch.append(booking)
+        if len(batch) >= 500:
+            Booking.objects.bulk_update(batch, ['price_snapshot', 'total_amount'])
+            batch = []
+    Booking.objects.bulk_update(batch, ['price_snapshot', 'total_amount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0014_car_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='price_snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Расчет стоимости'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='total_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Сумма'),
+        ),
+        migrations.RunPython(fill_price_snapshots, migrations.RunPython.noop),
+    ]
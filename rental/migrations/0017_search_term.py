@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0016_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50, verbose_name='Слово')),
+                ('weight', models.PositiveIntegerField(verbose_name='Вес')),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rental.car', verbose_name='Автомобиль')),
+            ],
+            options={
+                'verbose_name': 'Слово поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+                'indexes': [models.Index(fields=['term', 'car', 'weight'], name='searchterm_term_car_idx')],
+                'unique_together': {('car', 'term')},
+            },
+        ),
+    ]
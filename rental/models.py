@@ -1,17 +1,67 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
-from datetime import datetime
+from datetime import date, datetime
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.db import transaction
 from django.conf import settings
 
+from .storage import ContentAddressedStorage
+
+class TrackedStateMixin:
+    """Запоминает значения полей tracked_fields на момент загрузки из базы,
+    чтобы обработчики сигналов видели старое состояние без повторного запроса"""
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_state()
+        return instance
+
+    def remember_state(self):
+        self._loaded_state = self.current_state()
+
+    def current_state(self):
+        # Отложенные поля (only/defer) пропускаем: обращение к ним — лишний запрос
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in self.tracked_fields if name not in deferred}
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Сигнал post_save уже обработан, фиксируем новое состояние
+        self.remember_state()
+
+    @property
+    def loaded_state(self):
+        """Состояние на момент загрузки (None для нового объекта)"""
+        return getattr(self, '_loaded_state', None)
+
+    def changed_fields(self):
+        """Имена отслеживаемых полей, изменившихся с момента загрузки"""
+        loaded = self.loaded_state
+        if loaded is None:
+            return set(self.tracked_fields)
+        current = self.current_state()
+        return {
+            name for name in current
+            if name not in loaded or loaded[name] != current[name]
+        }
+
 # Кастомный менеджер
 class AvailableCarManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().filter(is_available=True)
 
+class BookingQuerySet(models.QuerySet):
+    def confirmed(self):
+        return self.filter(status='confirmed')
+
+    def overlapping(self, date_from, date_to):
+        """Бронирования, пересекающиеся с периодом [date_from, date_to]"""
+        return self.filter(date_from__lte=date_to, date_to__gte=date_from)
+
 class Service(models.Model):
     name = models.CharField("Название услуги", max_length=100)
 
@@ -22,7 +72,9 @@ class Service(models.Model):
     def __str__(self):
         return self.name
 
-class Car(models.Model):
+class Car(TrackedStateMixin, models.Model):
+    tracked_fields = ('name', 'brand', 'type', 'price', 'is_available', 'average_rating', 'image')
+
     name = models.CharField("Название", max_length=100)
     brand = models.CharField("Бренд", max_length=100)
     type = models.CharField("Тип кузова", max_length=50)
@@ -32,12 +84,22 @@ class Car(models.Model):
     # Статистика отзывов
     average_rating = models.DecimalField("Средняя оценка", max_digits=3, decimal_places=2, default=0)
     total_reviews = models.PositiveIntegerField("Количество отзывов", default=0)
+    rating_sum = models.PositiveIntegerField("Сумма оценок", default=0)
+
+    # Меняется и при изменении бронирований, отзывов, услуг и цен машины (rental.conditional.touch)
+    updated_at = models.DateTimeField("Дата обновления", auto_now=True, db_index=True)
 
     # Стандартный и кастомный менеджеры
     objects = models.Manager()
     available = AvailableCarManager()
 
-    image = models.ImageField("Фото", upload_to="cars/", blank=True, null=True)
+    image = models.ImageField(
+        "Фото",
+        upload_to="cars/",
+        storage=ContentAddressedStorage(),
+        blank=True,
+        null=True
+    )
 
     services = models.ManyToManyField(
         "Service",
@@ -50,24 +112,29 @@ class Car(models.Model):
     class Meta:
         verbose_name = "Автомобиль"
         verbose_name_plural = "Автомобили"
+        indexes = [
+            # Поиск по префиксу в админке (LIKE 'текст%')
+            models.Index(fields=['name'], name='car_name_idx'),
+            models.Index(fields=['brand'], name='car_brand_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand} {self.name}"
+
+    def current_state(self):
+        state = super().current_state()
+        if 'image' in state:
+            # Имя файла, а не FieldFile: тот же объект меняется при image.save()
+            state['image'] = state['image'].name or ''
+        return state
     
     def get_absolute_url(self):
         return reverse("car_detail", args=[str(self.id)])
 
     def get_discount_percentage(self, days):
         """Возвращает процент скидки в зависимости от количества дней"""
-        if days >= 30:
-            return 20  # 20% скидка для аренды от 30 дней
-        elif days >= 14:
-            return 15  # 15% скидка для аренды от 14 дней
-        elif days >= 7:
-            return 10  # 10% скидка для аренды от 7 дней
-        elif days >= 3:
-            return 5   # 5% скидка для аренды от 3 дней
-        return 0
+        from .rates import discount_percentage
+        return discount_percentage(days, self.brand)
 
 class CarService(models.Model):
     car = models.ForeignKey(Car, on_delete=models.CASCADE, verbose_name="Автомобиль")
@@ -84,7 +151,83 @@ class CarService(models.Model):
     def __str__(self):
         return f"{self.car} - {self.service}"
 
-class Booking(models.Model):
+class MediaBlob(models.Model):
+    """Файл в хранилище по хэшу содержимого и число ссылок на него"""
+    name = models.CharField("Имя файла", max_length=255, unique=True)
+    size = models.PositiveBigIntegerField("Размер", default=0)
+    refcount = models.IntegerField("Ссылок", default=0)
+    created_at = models.DateTimeField("Загружен", auto_now_add=True)
+    updated_at = models.DateTimeField("Обновлен", auto_now=True)
+
+    class Meta:
+        verbose_name = "Файл хранилища"
+        verbose_name_plural = "Файлы хранилища"
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+class PricingRule(TrackedStateMixin, models.Model):
+    """Множитель к суточной цене машины (сезон, выходные, бренд, тип кузова).
+
+    Пустые условия не ограничивают правило; на день, подходящий под
+    несколько правил, их множители перемножаются.
+    """
+    tracked_fields = ('car_id', 'brand', 'car_type')
+
+    name = models.CharField("Название", max_length=100)
+    car = models.ForeignKey(
+        Car,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="pricing_rules",
+        verbose_name="Автомобиль"
+    )
+    brand = models.CharField("Бренд", max_length=100, blank=True)
+    car_type = models.CharField("Тип кузова", max_length=50, blank=True)
+    date_from = models.DateField("Действует с", null=True, blank=True)
+    date_to = models.DateField("Действует по", null=True, blank=True)
+    weekdays = models.CharField(
+        "Дни недели",
+        max_length=7,
+        blank=True,
+        help_text="Номера дней недели (0 — понедельник, 6 — воскресенье), например 56 для выходных"
+    )
+    multiplier = models.DecimalField("Множитель цены", max_digits=5, decimal_places=2, default=1)
+    is_active = models.BooleanField("Активно", default=True)
+
+    class Meta:
+        verbose_name = "Правило цены"
+        verbose_name_plural = "Правила цен"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.name} ×{self.multiplier}"
+
+    def clean(self):
+        if self.weekdays and not set(self.weekdays) <= set('0123456'):
+            raise ValidationError({'weekdays': "Допустимы только цифры от 0 до 6"})
+        if self.date_from and self.date_to and self.date_to < self.date_from:
+            raise ValidationError("Дата окончания не может быть раньше даты начала")
+
+class DiscountTier(models.Model):
+    """Ступень скидки за длительность аренды; пустой бренд — общая таблица"""
+    brand = models.CharField("Бренд", max_length=100, blank=True)
+    min_days = models.PositiveIntegerField("От дней")
+    percentage = models.PositiveSmallIntegerField("Скидка, %")
+
+    class Meta:
+        verbose_name = "Скидка за длительность"
+        verbose_name_plural = "Скидки за длительность"
+        unique_together = ['brand', 'min_days']
+        ordering = ['brand', 'min_days']
+
+    def __str__(self):
+        return f"{self.brand or 'Все бренды'}: от {self.min_days} дн. — {self.percentage}%"
+
+class Booking(TrackedStateMixin, models.Model):
+    tracked_fields = ('car_id', 'status', 'date_from', 'date_to')
+
     user = models.ForeignKey(
         User, 
         verbose_name="Клиент", 
@@ -114,9 +257,27 @@ class Booking(models.Model):
         blank=True
     )
 
+    # Расчет на момент бронирования (rental.pricing.snapshot): суточная цена,
+    # скидка, цены услуг и итог; пишется в rental.reservations
+    price_snapshot = models.JSONField("Расчет стоимости", null=True, blank=True, editable=False)
+    total_amount = models.DecimalField(
+        "Сумма", max_digits=10, decimal_places=2, null=True, blank=True, editable=False
+    )
+
+    objects = BookingQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Бронирование"
         verbose_name_plural = "Бронирования"
+        indexes = [
+            # Покрывает проверки пересечений по автомобилю и анти-join поиска свободных машин
+            models.Index(
+                fields=['car', 'status', 'date_from', 'date_to'],
+                name='booking_car_status_dates_idx'
+            ),
+            # Фильтры по дате и границы лет в админке
+            models.Index(fields=['date_from'], name='booking_date_from_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.car.name}"
@@ -135,8 +296,11 @@ class Booking(models.Model):
 
     @property
     def base_price(self):
-        """Рассчитывает базовую стоимость без скидки"""
-        return self.car.price * self.days_count
+        """Рассчитывает базовую стоимость без скидки с учетом правил цен"""
+        from .rates import base_price
+        if not self.days_count:
+            return 0
+        return base_price(self.car_id, self.date_from, self.date_to)
 
     @property
     def discount_amount(self):
@@ -148,7 +312,147 @@ class Booking(models.Model):
         """Рассчитывает общую стоимость бронирования со скидкой"""
         return self.base_price - self.discount_amount
 
-class Review(models.Model):
+    @property
+    def booked_total(self):
+        """Сумма по сохраненному расчету (для старых записей без него — пересчет)"""
+        if self.total_amount is not None:
+            return self.total_amount
+        return self.total_price
+
+    @property
+    def booked_services(self):
+        """Услуги с ценами на момент бронирования: [{'service', 'name', 'price'}]"""
+        if self.price_snapshot is not None:
+            return self.price_snapshot['services']
+        return [
+            {'service': car_service.service_id, 'name': car_service.service.name, 'price': car_service.price}
+            for car_service in self.services.select_related('service')
+        ]
+
+class CarRecommendation(models.Model):
+    """Предрассчитанные похожие автомобили (top-N по убыванию score)"""
+    car = models.ForeignKey(
+        Car,
+        on_delete=models.CASCADE,
+        related_name="recommendations",
+        verbose_name="Автомобиль"
+    )
+    recommended = models.ForeignKey(
+        Car,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Похожий автомобиль"
+    )
+    score = models.FloatField("Схожесть")
+
+    class Meta:
+        verbose_name = "Похожий автомобиль"
+        verbose_name_plural = "Похожие автомобили"
+        unique_together = ['car', 'recommended']
+        ordering = ['-score']
+
+    def __str__(self):
+        return f"{self.car_id} → {self.recommended_id} ({self.score:.2f})"
+
+class FleetStats(models.Model):
+    """Материализованная статистика доступного парка: car_type='' — весь парк, иначе тип кузова"""
+    car_type = models.CharField("Тип кузова", max_length=50, unique=True, blank=True)
+    total = models.PositiveIntegerField("Количество автомобилей", default=0)
+    price_sum = models.DecimalField("Сумма цен за сутки", max_digits=14, decimal_places=2, default=0)
+    min_price = models.DecimalField("Минимальная цена", max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField("Максимальная цена", max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField("Дата обновления", auto_now=True)
+
+    class Meta:
+        verbose_name = "Статистика парка"
+        verbose_name_plural = "Статистика парка"
+
+    def __str__(self):
+        return self.car_type or "Весь парк"
+
+    @property
+    def avg_price(self):
+        return self.price_sum / self.total if self.total else None
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'avg_price': self.avg_price,
+            'min_price': self.min_price,
+            'max_price': self.max_price,
+        }
+
+class CarAvailability(models.Model):
+    """Битовая карта занятости автомобиля: бит i соответствует дню start_date + i"""
+    car = models.OneToOneField(
+        Car,
+        on_delete=models.CASCADE,
+        related_name="availability",
+        verbose_name="Автомобиль"
+    )
+    start_date = models.DateField("Начало горизонта")
+    bitmap = models.BinaryField("Битовая карта занятости", default=b'')
+    updated_at = models.DateTimeField("Дата обновления", auto_now=True)
+
+    # Сводка ближайшей занятости для карточек каталога (фиксированного размера)
+    next_booked_from = models.DateField("Ближайшая аренда с", null=True, blank=True)
+    next_booked_to = models.DateField("Ближайшая аренда по", null=True, blank=True)
+    next_free_date = models.DateField("Ближайшая свободная дата", null=True, blank=True)
+    upcoming = models.JSONField("Ближайшие периоды аренды", default=list, blank=True)
+
+    class Meta:
+        verbose_name = "Занятость автомобиля"
+        verbose_name_plural = "Занятость автомобилей"
+
+    def __str__(self):
+        return f"Занятость {self.car_id} с {self.start_date}"
+
+    @property
+    def mask(self):
+        return int.from_bytes(bytes(self.bitmap), 'little')
+
+    @mask.setter
+    def mask(self, value):
+        self.bitmap = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+    @property
+    def upcoming_ranges(self):
+        """Ближайшие периоды аренды в виде пар дат"""
+        return [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in self.upcoming]
+
+class OutboxEmail(models.Model):
+    """Письмо в очереди на отправку (transactional outbox)"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка отправки'),
+    ]
+
+    subject = models.CharField("Тема", max_length=255)
+    body = models.TextField("Текст")
+    from_email = models.CharField("Отправитель", max_length=255, blank=True)
+    recipients = models.JSONField("Получатели", default=list)
+    status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField("Попыток отправки", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    sent_at = models.DateTimeField("Дата отправки", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь писем"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.get_status_display()})"
+
+class Review(TrackedStateMixin, models.Model):
+    tracked_fields = ('booking_id', 'rating', 'comment', 'is_public')
+
     RATING_CHOICES = [
         (1, '1 - Ужасно'),
         (2, '2 - Плохо'),
@@ -177,6 +481,10 @@ class Review(models.Model):
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         ordering = ['-created_at']
+        indexes = [
+            # Порядок списка отзывов без сортировки всей таблицы
+            models.Index(fields=['-created_at'], name='review_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"Отзыв на бронирование {self.booking.id} от {self.booking.user.username}"
@@ -189,27 +497,7 @@ class Review(models.Model):
             raise ValidationError("Отзыв можно оставить только после окончания аренды")
 
     def save(self, *args, **kwargs):
-        # Если это новый отзыв (еще не сохранен в базе)
-        if not self.pk:
-            # Отправляем уведомление администратору о новом отзыве
-            subject = f'Новый отзыв от {self.booking.user.username}'
-            message = f'''
-            Получен новый отзыв:
-            Автомобиль: {self.booking.car}
-            Клиент: {self.booking.user.get_full_name() or self.booking.user.username}
-            Оценка: {self.get_rating_display()}
-            Комментарий: {self.comment}
-            '''
-            try:
-                send_mail(
-                    subject,
-                    message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [admin[1] for admin in settings.ADMINS],
-                    fail_silently=True,
-                )
-            except Exception:
-                pass  # Игнорируем ошибки отправки почты
+        is_new = not self.pk
 
         # Если рейтинг низкий (1 или 2), автоматически скрываем отзыв
         if self.rating <= 2:
@@ -217,28 +505,61 @@ class Review(models.Model):
             self.is_moderated = False
 
         # Если отзыв редактировался, сбрасываем флаг модерации
-        if self.pk:
-            old_review = Review.objects.get(pk=self.pk)
-            if old_review.comment != self.comment or old_review.rating != self.rating:
+        if not is_new:
+            if self.loaded_state is None:
+                # Объект создан не из базы — берем прежние значения явно
+                self._loaded_state = Review.objects.get(pk=self.pk).current_state()
+            if self.changed_fields() & {'comment', 'rating'}:
                 self.is_moderated = False
 
-        super().save(*args, **kwargs)
+        # Статистику автомобиля обновляет сигнал post_save (rental.ratings) в этой же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # Уведомление администратору о новом отзыве ставится в очередь в той же транзакции,
+            # отправляет его воркер deliver_outbox
+            if is_new:
+                self.enqueue_notification()
+
+    def enqueue_notification(self):
+        recipients = [admin[1] for admin in settings.ADMINS]
+        if not recipients:
+            return
+        subject = f'Новый отзыв от {self.booking.user.username}'
+        message = f'''
+            Получен новый отзыв:
+            Автомобиль: {self.booking.car}
+            Клиент: {self.booking.user.get_full_name() or self.booking.user.username}
+            Оценка: {self.get_rating_display()}
+            Комментарий: {self.comment}
+            '''
+        OutboxEmail.objects.create(
+            subject=subject,
+            body=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipients=recipients,
+        )
 
-        # После сохранения обновляем статистику автомобиля
-        self.update_car_stats()
+class SearchTerm(models.Model):
+    """Инвертированный индекс поиска по парку (rental.search): слово → машина с весом"""
+    term = models.CharField("Слово", max_length=50)
+    car = models.ForeignKey(
+        Car,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автомобиль"
+    )
+    weight = models.PositiveIntegerField("Вес")
 
-    def update_car_stats(self):
-        """Обновляет статистику отзывов для автомобиля"""
-        car = self.booking.car
-        reviews = Review.objects.filter(
-            booking__car=car,
-            is_public=True
-        )
-        avg_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
-        total_reviews = reviews.count()
-        
-        # Обновляем статистику в модели Car
-        car.average_rating = avg_rating or 0
-        car.total_reviews = total_reviews
-        car.save(update_fields=['average_rating', 'total_reviews'])
+    class Meta:
+        verbose_name = "Слово поискового индекса"
+        verbose_name_plural = "Поисковый индекс"
+        # (car, term) — ранг машины в каталоге
+        unique_together = ['car', 'term']
+        indexes = [
+            # Покрывающий для поиска по префиксу: строки таблицы не читаются
+            models.Index(fields=['term', 'car', 'weight'], name='searchterm_term_car_idx'),
+        ]
 
+    def __str__(self):
+        return f"{self.term} → {self.car_id} ({self.weight})"
@@ -0,0 +1,100 @@
+"""Доставка писем из очереди OutboxEmail.
+
+Письма записываются в ту же транзакцию, что и породившие их данные,
+а отправляются отдельно (management-команда deliver_outbox) пачками
+через одно SMTP-соединение. Неудачные попытки повторяются с
+экспоненциальной задержкой, после MAX_ATTEMPTS письмо помечается failed.
+
+Пачка забирается короткой транзакцией (статус sending), отправка идет уже
+без блокировок строк. Если воркер упал посреди отправки, письма вернутся в
+работу через SENDING_TIMEOUT — возможна повторная доставка, но не потеря.
+"""
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# Задержка перед повтором: BASE_DELAY * 2 ** (попытка - 1)
+BASE_DELAY = timedelta(minutes=1)
+# Через сколько письмо, забранное упавшим воркером, снова можно отправлять
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+RESULT_FIELDS = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+
+
+def retry_delay(attempts):
+    return BASE_DELAY * 2 ** (attempts - 1)
+
+
+def _claim(batch_size, now):
+    """Забирает пачку готовых писем: другие воркеры пропускают ее до SENDING_TIMEOUT"""
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        for email in batch:
+            email.status = 'sending'
+            email.next_attempt_at = now + SENDING_TIMEOUT
+        OutboxEmail.objects.bulk_update(batch, ['status', 'next_attempt_at'])
+    return batch
+
+
+def deliver_pending(batch_size=BATCH_SIZE, connection=None):
+    """Отправляет одну пачку готовых к отправке писем, возвращает (отправлено, ошибок)"""
+    now = timezone.now()
+    batch = _claim(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        # Почтовый сервер недоступен — откладываем всю пачку
+        for email in batch:
+            _mark_failed(email, error, now)
+        OutboxEmail.objects.bulk_update(batch, RESULT_FIELDS)
+        return 0, len(batch)
+
+    try:
+        for email in batch:
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email or None,
+                email.recipients,
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as error:
+                _mark_failed(email, error, now)
+                failed += 1
+            else:
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.attempts += 1
+                sent += 1
+    finally:
+        connection.close()
+
+    OutboxEmail.objects.bulk_update(batch, RESULT_FIELDS)
+    return sent, failed
+
+
+def _mark_failed(email, error, now):
+    email.attempts += 1
+    email.last_error = f"{type(error).__name__}: {error}"
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = now + retry_delay(email.attempts)
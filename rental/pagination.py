@@ -0,0 +1,159 @@
+"""Курсорная (keyset) пагинация и пагинация с оценкой числа строк.
+
+Вместо COUNT(*) и OFFSET страница выбирается условием по значениям ключа
+сортировки последней показанной записи, поэтому глубокие страницы стоят
+столько же, сколько первая. Курсоры подписаны и непрозрачны для клиента.
+
+EstimatedCountPaginator — для списков админки по большим таблицам: число
+строк без фильтров берется из статистики СУБД, с фильтрами — ограниченный COUNT.
+"""
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    salt = 'rental.pagination.keyset'
+
+    def __init__(self, queryset, ordering, per_page):
+        """ordering — поля сортировки; первичный ключ добавляется для однозначности"""
+        ordering = list(ordering)
+        if ordering[-1].lstrip('-') not in ('pk', 'id'):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        self.queryset = queryset
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.per_page = per_page
+
+    def _encode(self, obj, direction):
+        values = []
+        for name, _ in self.fields:
+            value = getattr(obj, name)
+            values.append(value if isinstance(value, (int, str)) else str(value))
+        return signing.dumps({'d': direction, 'o': self._order(False), 'v': values}, salt=self.salt)
+
+    def _decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            return None, None
+        # Курсор другой сортировки дал бы неверную страницу: сравнение не с теми полями
+        if (not isinstance(data, dict) or data.get('d') not in ('next', 'prev')
+                or data.get('o') != self._order(False) or len(data.get('v', ())) != len(self.fields)):
+            return None, None
+        return data['d'], data['v']
+
+    def _after(self, values, backwards):
+        """Условие «строго после курсора» в порядке сортировки (или до него при backwards)"""
+        condition = Q()
+        for i, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for j, (prev_name, _) in enumerate(self.fields[:i]):
+                step &= Q(**{prev_name: values[j]})
+            condition |= step
+        return condition
+
+    def _order(self, backwards):
+        return [
+            f'-{name}' if descending != backwards else name
+            for name, descending in self.fields
+        ]
+
+    def _query(self, cursor):
+        direction, values = self._decode(cursor) if cursor else (None, None)
+        backwards = direction == 'prev'
+
+        queryset = self.queryset.order_by(*self._order(backwards))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+        return queryset[:self.per_page + 1], backwards, values
+
+    def _page(self, rows, backwards, values):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+
+        # has_more означает наличие записей дальше по направлению движения
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self._encode(rows[-1], 'next') if has_next else None,
+            previous_cursor=self._encode(rows[0], 'prev') if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, backwards, values = self._query(cursor)
+        return self._page(list(queryset), backwards, values)
+
+    async def apage(self, cursor=None):
+        queryset, backwards, values = self._query(cursor)
+        return self._page([obj async for obj in queryset], backwards, values)
+
+
+def estimate_rows(model, using='default'):
+    """Приблизительное число строк таблицы по статистике СУБД (None, если ее нет)"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = ("SELECT TABLE_ROWS FROM information_schema.TABLES "
+               "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s")
+    elif connection.vendor == 'postgresql':
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator без полного COUNT(*).
+
+    Без фильтров — оценка из статистики таблицы (если таблица больше
+    COUNT_LIMIT), с фильтрами — COUNT не дальше COUNT_LIMIT строк: записи
+    за этой границей находятся уточнением фильтра, поиском или сортировкой.
+    """
+    COUNT_LIMIT = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:self.COUNT_LIMIT].count()
@@ -0,0 +1,162 @@
+"""Расчет стоимости аренды пачкой: много машин × много периодов × услуги.
+
+Все цены машин и их услуг загружаются двумя запросами на пачку, результаты
+кэшируются по ключу (машина, период, услуги) в версионированном кэше
+(rental.caching); версия увеличивается при изменении Car и CarService.
+Суточные цены и скидки берутся из скомпилированных таблиц (rental.rates);
+услуги оплачиваются посуточно, скидка за длительность применяется ко всей сумме.
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import caching, rates
+from .models import Car, CarService
+
+NAMESPACE = 'pricing'
+
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return str(value.quantize(CENT))
+
+
+def _quote(car_id, daily_rate, brand, services, date_from, date_to):
+    days = (date_to - date_from).days + 1
+    base_price = rates.base_price(car_id, date_from, date_to)
+    services_daily = sum((price for _, price in services), Decimal(0))
+    services_total = services_daily * days
+    percent = rates.discount_percentage(days, brand)
+    subtotal = base_price + services_total
+    discount_amount = subtotal * percent / 100
+    return {
+        'car': car_id,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'days': days,
+        'daily_rate': _money(daily_rate),
+        'base_price': _money(base_price),
+        'services': [
+            {'service': service_id, 'price': _money(price)} for service_id, price in services
+        ],
+        'services_total': _money(services_total),
+        'discount_percentage': percent,
+        'discount_amount': _money(discount_amount),
+        'total': _money(subtotal - discount_amount),
+    }
+
+
+def _key(car_id, date_from, date_to, service_ids):
+    services = ','.join(str(service_id) for service_id in sorted(service_ids))
+    return f'{car_id}:{date_from.isoformat()}:{date_to.isoformat()}:{services}'
+
+
+def _keys(car_ids, ranges, service_ids):
+    version = caching.get_version(NAMESPACE)
+    return {
+        (car_id, date_from, date_to): caching.make_key(
+            NAMESPACE, _key(car_id, date_from, date_to, service_ids), version
+        )
+        for car_id in car_ids
+        for date_from, date_to in ranges
+    }
+
+
+def _loads(missing, service_ids):
+    """Запросы цен машин, их выбранных и обязательных услуг для недостающих расчетов"""
+    missing_cars = {car_id for car_id, _, _ in missing}
+    return (
+        Car.objects.filter(pk__in=missing_cars).values_list('id', 'price', 'brand'),
+        CarService.objects.filter(
+            Q(service_id__in=service_ids) | Q(is_required=True), car_id__in=missing_cars
+        ).values_list('car_id', 'service_id', 'price').order_by('service_id'),
+    )
+
+
+def _compute(missing, keys, car_rows, service_rows):
+    cars = {car_id: (price, brand) for car_id, price, brand in car_rows}
+    services = {car_id: [] for car_id in cars}
+    for car_id, service_id, price in service_rows:
+        services[car_id].append((service_id, price))
+
+    computed = {}
+    for car_id, date_from, date_to in missing:
+        if car_id in cars:
+            daily_rate, brand = cars[car_id]
+            computed[keys[car_id, date_from, date_to]] = _quote(
+                car_id, daily_rate, brand, services[car_id], date_from, date_to
+            )
+    return computed
+
+
+def _collect(keys, found, computed, missing):
+    caching.count(NAMESPACE, 'hits', len(found))
+    caching.count(NAMESPACE, 'misses', len(missing))
+    results = {**found, **computed}
+    return [results[key] for key in keys.values() if key in results]
+
+
+def quote_many(car_ids, ranges, service_ids=()):
+    """Расчеты для всех сочетаний car_ids × ranges.
+
+    ranges — пары дат (date_from, date_to); service_ids — id выбранных Service.
+    Обязательные услуги машины (CarService.is_required) входят в расчет всегда,
+    услуги, которых у машины нет, игнорируются. Неизвестные машины пропускаются.
+    """
+    service_ids = frozenset(service_ids)
+    keys = _keys(car_ids, ranges, service_ids)
+    found = cache.get_many(keys.values())
+    missing = [combo for combo, key in keys.items() if key not in found]
+
+    computed = {}
+    if missing:
+        cars, services = _loads(missing, service_ids)
+        computed = _compute(missing, keys, cars, services)
+        cache.set_many(computed, timeout=caching.DEFAULT_TIMEOUT)
+    return _collect(keys, found, computed, missing)
+
+
+async def aquote_many(car_ids, ranges, service_ids=()):
+    """quote_many для асинхронных представлений"""
+    service_ids = frozenset(service_ids)
+    keys = _keys(car_ids, ranges, service_ids)
+    found = await cache.aget_many(keys.values())
+    missing = [combo for combo, key in keys.items() if key not in found]
+
+    computed = {}
+    if missing:
+        cars, services = _loads(missing, service_ids)
+        cars = [row async for row in cars]
+        services = [row async for row in services]
+        # Таблицы rates при устаревшей версии компилируются синхронными запросами
+        computed = await sync_to_async(_compute)(missing, keys, cars, services)
+        await cache.aset_many(computed, timeout=caching.DEFAULT_TIMEOUT)
+    return _collect(keys, found, computed, missing)
+
+
+def quote(car_id, date_from, date_to, service_ids=()):
+    quotes = quote_many([car_id], [(date_from, date_to)], service_ids)
+    return quotes[0] if quotes else None
+
+
+def snapshot(car, car_services, date_from, date_to):
+    """Расчет для Booking.price_snapshot: те же поля, что у quote(), и названия услуг.
+
+    car_services — выбранные CarService с загруженным service.
+    """
+    car_services = sorted(car_services, key=lambda car_service: car_service.service_id)
+    result = _quote(
+        car.pk, car.price, car.brand,
+        [(car_service.service_id, car_service.price) for car_service in car_services],
+        date_from, date_to,
+    )
+    for line, car_service in zip(result['services'], car_services):
+        line['name'] = car_service.service.name
+    return result
+
+
+def invalidate():
+    caching.bump_version(NAMESPACE)
@@ -0,0 +1,306 @@
+"""Скомпилированные таблицы суточных цен и скидок.
+
+Правила PricingRule и ступени DiscountTier компилируются в памяти процесса:
+для каждой машины — префиксные суммы суточной цены (в филсах) на
+HORIZON_DAYS дней от сегодняшнего, для каждого бренда — таблица процента
+скидки по числу дней. Стоимость периода — разность двух префиксных сумм,
+скидка — обращение по индексу; правила на каждый день не вычисляются.
+
+Изменения правил и машин отмечаются в общем кэше: версия пространства имен
+плюс множество затронутых машин на каждую версию. Процесс, отставший на
+несколько версий, перекомпилирует только эти строки; если журнал изменений
+вытеснен из кэша — пересобирает таблицы целиком.
+
+Опубликованные таблицы не меняются: компиляция собирает новый _Tables
+(при частичной — на копии строк) и подменяет им текущий одним
+присваиванием. Поток, начавший расчет, дочитывает прежние таблицы и не
+видит наполовину пересобранных.
+"""
+from copy import copy
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.cache import cache
+
+from . import caching
+from .availability import HORIZON_DAYS
+from .models import Car, DiscountTier, PricingRule
+
+NAMESPACE = 'rates'
+# Скидка по индексу до этого числа дней, дальше — последняя ступень
+TIER_TABLE_DAYS = 366
+# Сколько хранится журнал изменений для других процессов
+CHANGES_TIMEOUT = 60 * 60 * 24
+# Отставание больше стольких версий (или новый отсчет после вытеснения) — полная компиляция
+MAX_CHANGES = 100
+# Машины затронуты все (правило без ограничения по машине)
+ALL = 'all'
+
+ONE = Decimal(1)
+
+
+class _Rule:
+    __slots__ = ('car_id', 'brand', 'car_type', 'date_from', 'date_to', 'weekdays', 'multiplier')
+
+    def __init__(self, rule):
+        self.car_id = rule.car_id
+        self.brand = rule.brand
+        self.car_type = rule.car_type
+        self.date_from = rule.date_from
+        self.date_to = rule.date_to
+        self.weekdays = {int(day) for day in rule.weekdays} if rule.weekdays else None
+        self.multiplier = rule.multiplier
+
+    def applies_to(self, car_id, brand, car_type):
+        return (
+            (self.car_id is None or self.car_id == car_id)
+            and (not self.brand or self.brand == brand)
+            and (not self.car_type or self.car_type == car_type)
+        )
+
+    def applies_on(self, day):
+        return (
+            (self.date_from is None or day >= self.date_from)
+            and (self.date_to is None or day <= self.date_to)
+            and (self.weekdays is None or day.weekday() in self.weekdays)
+        )
+
+    def day_indexes(self, start, days):
+        """Индексы дней горизонта [start, start + days), на которые действует правило"""
+        first = 0 if self.date_from is None else max((self.date_from - start).days, 0)
+        last = days if self.date_to is None else min((self.date_to - start).days + 1, days)
+        return [
+            index for index in range(first, last)
+            if self.weekdays is None or (start + timedelta(days=index)).weekday() in self.weekdays
+        ]
+
+
+class _Row:
+    """Скомпилированная строка машины"""
+    __slots__ = ('brand', 'car_type', 'price', 'rules', 'prefix')
+
+    def __init__(self, brand, car_type, price, rules, prefix):
+        self.brand = brand
+        self.car_type = car_type
+        self.price = price
+        self.rules = rules
+        self.prefix = prefix
+
+
+class _Tables:
+    def __init__(self):
+        self.version = None
+        self.start = None
+        self.rules = []
+        self.rule_days = []
+        self.tiers = {}
+        self.steps = {}
+        self.rows = {}
+
+
+_tables = _Tables()
+
+
+def _to_fils(amount):
+    return int((amount * 100).quantize(ONE))
+
+
+def _compile_rules(tables):
+    tables.rules = [_Rule(rule) for rule in PricingRule.objects.filter(is_active=True)]
+    tables.rule_days = [rule.day_indexes(tables.start, HORIZON_DAYS) for rule in tables.rules]
+
+
+def _compile_tiers(tables):
+    steps = {}
+    for brand, min_days, percentage in DiscountTier.objects.values_list(
+        'brand', 'min_days', 'percentage'
+    ).order_by('brand', 'min_days'):
+        steps.setdefault(brand, []).append((min_days, percentage))
+
+    tiers = {}
+    for brand, brand_steps in steps.items():
+        table = [0] * (TIER_TABLE_DAYS + 1)
+        for min_days, percentage in brand_steps:
+            for days in range(min(min_days, TIER_TABLE_DAYS + 1), TIER_TABLE_DAYS + 1):
+                table[days] = percentage
+        tiers[brand] = table
+    tables.tiers = tiers
+    tables.steps = steps
+
+
+def _compile_row(tables, car_id, brand, car_type, price):
+    factors = [ONE] * HORIZON_DAYS
+    rules = []
+    for rule, indexes in zip(tables.rules, tables.rule_days):
+        if rule.applies_to(car_id, brand, car_type):
+            rules.append(rule)
+            for index in indexes:
+                factors[index] *= rule.multiplier
+    daily = [_to_fils(price * factor) for factor in factors]
+    return _Row(brand, car_type, price, rules, list(accumulate(daily, initial=0)))
+
+
+def _compile_cars(tables, car_ids=None):
+    cars = Car.objects.all() if car_ids is None else Car.objects.filter(pk__in=car_ids)
+    found = set()
+    for car_id, brand, car_type, price in cars.values_list('id', 'brand', 'type', 'price'):
+        tables.rows[car_id] = _compile_row(tables, car_id, brand, car_type, price)
+        found.add(car_id)
+    if car_ids is not None:
+        # Удаленные машины
+        for car_id in set(car_ids) - found:
+            tables.rows.pop(car_id, None)
+
+
+def _publish(tables):
+    global _tables
+    _tables = tables
+    return tables
+
+
+def compile_all():
+    """Полная компиляция таблиц на горизонт от сегодняшнего дня"""
+    tables = _Tables()
+    tables.version = caching.get_version(NAMESPACE)
+    tables.start = date.today()
+    _compile_rules(tables)
+    _compile_tiers(tables)
+    _compile_cars(tables)
+    return _publish(tables)
+
+
+def _changes_key(version):
+    return f'rental:{NAMESPACE}:changes:{version}'
+
+
+def _sync():
+    """Приводит таблицы процесса к актуальной версии"""
+    tables = _tables
+    version = caching.get_version(NAMESPACE)
+    if tables.version == version and tables.start == date.today():
+        return tables
+    if (tables.version is None or tables.start != date.today() or version < tables.version
+            or version - tables.version > MAX_CHANGES):
+        return compile_all()
+
+    keys = [_changes_key(number) for number in range(tables.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys) or ALL in changes.values():
+        return compile_all()
+
+    updated = _Tables()
+    updated.start = tables.start
+    updated.rows = dict(tables.rows)
+    _compile_rules(updated)
+    _compile_tiers(updated)
+    car_ids = set().union(*changes.values())
+    if car_ids:
+        _compile_cars(updated, car_ids)
+    updated.version = version
+    return _publish(updated)
+
+
+def _mark_changed(car_ids):
+    version = caching.bump_version(NAMESPACE)
+    cache.set(_changes_key(version), car_ids, timeout=CHANGES_TIMEOUT)
+
+
+def cars_changed(car_ids):
+    """Отмечает изменение цены/бренда/типа машин (или их удаление)"""
+    _mark_changed(set(car_ids))
+
+
+def _rule_scope(car_id, brand, car_type):
+    if not car_id and not brand and not car_type:
+        return ALL
+    cars = Car.objects.all()
+    if car_id:
+        cars = cars.filter(pk=car_id)
+    if brand:
+        cars = cars.filter(brand=brand)
+    if car_type:
+        cars = cars.filter(type=car_type)
+    return set(cars.values_list('id', flat=True))
+
+
+def rule_changed(rule):
+    """Отмечает машины под правилом до и после изменения"""
+    scopes = [_rule_scope(rule.car_id, rule.brand, rule.car_type)]
+    old = rule.loaded_state
+    if old is not None:
+        scopes.append(_rule_scope(old['car_id'], old['brand'], old['car_type']))
+    _mark_changed(ALL if ALL in scopes else set().union(*scopes))
+
+
+def tiers_changed():
+    _mark_changed(set())
+
+
+def _row(tables, car_id):
+    row = tables.rows.get(car_id)
+    if row is None:
+        # Машина добавлена после компиляции: строка собирается в копии таблиц,
+        # копия публикуется, если за это время не опубликовали другие таблицы
+        updated = copy(tables)
+        updated.rows = dict(tables.rows)
+        _compile_cars(updated, [car_id])
+        row = updated.rows.get(car_id)
+        if row is not None and _tables is tables:
+            _publish(updated)
+    return row
+
+
+def _evaluate(row, date_from, date_to):
+    """Посуточное вычисление правил — для дат за пределами горизонта"""
+    total = 0
+    day = date_from
+    while day <= date_to:
+        factor = ONE
+        for rule in row.rules:
+            if rule.applies_on(day):
+                factor *= rule.multiplier
+        total += _to_fils(row.price * factor)
+        day += timedelta(days=1)
+    return total
+
+
+def _fils_for_range(tables, row, date_from, date_to):
+    first = (date_from - tables.start).days
+    last = (date_to - tables.start).days + 1
+    if first >= 0 and last <= HORIZON_DAYS:
+        return row.prefix[last] - row.prefix[first]
+    return _evaluate(row, date_from, date_to)
+
+
+def base_price(car_id, date_from, date_to):
+    """Стоимость аренды без скидки за период [date_from, date_to]"""
+    tables = _sync()
+    row = _row(tables, car_id)
+    if row is None:
+        return None
+    return Decimal(_fils_for_range(tables, row, date_from, date_to)).scaleb(-2)
+
+
+def discount_percentage(days, brand=''):
+    """Процент скидки за длительность по таблице бренда (или общей)"""
+    tables = _sync()
+    table = tables.tiers.get(brand) or tables.tiers.get('')
+    if not table or days <= 0:
+        return 0
+    return table[min(days, TIER_TABLE_DAYS)]
+
+
+def discount_steps(brand=''):
+    """Ступени скидки [(от дней, процент)] для бренда (или общие)"""
+    tables = _sync()
+    return tables.steps.get(brand) or tables.steps.get('', [])
+
+
+def evaluate_base_price(car_id, date_from, date_to):
+    """То же, что base_price, но с посуточным вычислением правил (для сверки и замеров)"""
+    tables = _sync()
+    row = _row(tables, car_id)
+    if row is None:
+        return None
+    return Decimal(_evaluate(row, date_from, date_to)).scaleb(-2)
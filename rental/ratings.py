@@ -0,0 +1,98 @@
+"""Инкрементальная статистика отзывов автомобиля.
+
+Car хранит сумму и количество публичных оценок; любое изменение отзыва
+(создание, правка, скрытие/публикация, удаление) превращается в дельту,
+которая применяется одним атомарным UPDATE с F()-выражениями. UPDATE
+идет мимо сигналов Car, поэтому похожие машины (average_rating входит в
+score) пересчитываются здесь же.
+"""
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils import timezone
+
+from . import recommendations
+from .models import Booking, Car, Review
+
+
+def _contribution(state, car_id):
+    """(car_id, оценка), если отзыв учитывается в статистике"""
+    if state and state['is_public'] and car_id:
+        return car_id, state['rating']
+    return None
+
+
+def _average(rating_sum, total):
+    return Coalesce(
+        Round(Cast(rating_sum, FloatField()) / NullIf(total, Value(0)), 2),
+        Value(0.0)
+    )
+
+
+def apply_delta(car_id, sum_delta, count_delta):
+    if not sum_delta and not count_delta:
+        return
+    rating_sum = F('rating_sum') + sum_delta
+    total = F('total_reviews') + count_delta
+    # average_rating идет первым: MySQL вычисляет SET слева направо
+    # и в последующих присваиваниях видит уже новые значения столбцов
+    Car.objects.filter(pk=car_id).update(
+        average_rating=_average(rating_sum, total),
+        rating_sum=rating_sum,
+        total_reviews=total,
+    )
+
+
+def review_car_id(review):
+    try:
+        return review.booking.car_id
+    except Booking.DoesNotExist:
+        return None
+
+
+def review_changed(review, old_state, new_state):
+    """Применяет переход отзыва из old_state в new_state (None — отзыва нет)"""
+    car_id = review_car_id(review)
+    old = _contribution(old_state, car_id)
+    new = _contribution(new_state, car_id)
+    if old == new:
+        return
+    if old:
+        apply_delta(old[0], -old[1], -1)
+    if new:
+        apply_delta(new[0], new[1], 1)
+    for changed_car_id in {contribution[0] for contribution in (old, new) if contribution}:
+        recommendations.refresh_for_car(changed_car_id)
+
+
+def find_drift():
+    """[(car_id, (сумма, количество) сохраненные, (сумма, количество) эталонные)]"""
+    expected = {
+        row['booking__car']: (row['rating_sum'], row['total'])
+        for row in Review.objects.filter(is_public=True).values('booking__car').annotate(
+            rating_sum=Sum('rating'), total=Count('id')
+        ).order_by()
+    }
+    drift = []
+    for car_id, rating_sum, total in Car.objects.values_list('id', 'rating_sum', 'total_reviews'):
+        actual = expected.get(car_id, (0, 0))
+        if (rating_sum, total) != actual:
+            drift.append((car_id, (rating_sum, total), actual))
+    return drift
+
+
+def reconcile(drift=None):
+    """Исправляет расхождения пакетным обновлением, возвращает число исправленных машин"""
+    drift = find_drift() if drift is None else drift
+    cars = []
+    now = timezone.now()
+    for car_id, _, (rating_sum, total) in drift:
+        average = round(rating_sum / total, 2) if total else 0
+        cars.append(Car(pk=car_id, rating_sum=rating_sum, total_reviews=total, average_rating=average,
+                        updated_at=now))
+    # bulk_update не заполняет auto_now, а от updated_at зависят ETag страниц
+    Car.objects.bulk_update(
+        cars, ['rating_sum', 'total_reviews', 'average_rating', 'updated_at'], batch_size=500
+    )
+    for car in cars:
+        recommendations.refresh_for_car(car.pk)
+    return len(cars)
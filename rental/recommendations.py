@@ -0,0 +1,159 @@
+"""Похожие автомобили для страницы машины.
+
+Для каждой машины хранится top-N похожих доступных автомобилей
+(CarRecommendation) по типу кузова, бренду, близости цены и рейтингу.
+При изменении машины пересчитываются только списки, в которые она входит
+или может войти, а на странице из готового списка выбирается случайная
+тройка — без ORDER BY RAND() по всему парку.
+"""
+import random
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, Min, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Abs, Cast, Coalesce, Greatest, NullIf
+
+from .models import Car, CarRecommendation
+
+TOP_N = 6
+SHOWN = 3
+
+TYPE_WEIGHT = 3.0
+BRAND_WEIGHT = 1.5
+PRICE_WEIGHT = 2.0
+RATING_WEIGHT = 0.2
+
+CANDIDATE_FIELDS = ('id', 'type', 'brand', 'price', 'average_rating')
+# Погрешность вычисления score в базе относительно Python
+SCORE_EPSILON = 1e-9
+
+
+def score(car, other):
+    """Схожесть other с car; оба — словари с полями CANDIDATE_FIELDS"""
+    value = 0.0
+    if car['type'] == other['type']:
+        value += TYPE_WEIGHT
+    if car['brand'] == other['brand']:
+        value += BRAND_WEIGHT
+    top = max(car['price'], other['price'])
+    if top:
+        value += PRICE_WEIGHT * float(1 - abs(car['price'] - other['price']) / top)
+    value += RATING_WEIGHT * float(other['average_rating'] or 0)
+    return value
+
+
+def _candidates():
+    return {row['id']: row for row in Car.available.values(*CANDIDATE_FIELDS)}
+
+
+def _top(car, candidates):
+    scored = [
+        (score(car, other), other_id)
+        for other_id, other in candidates.items()
+        if other_id != car['id']
+    ]
+    scored.sort(reverse=True)
+    return scored[:TOP_N]
+
+
+def _store(car_ids, subjects, candidates):
+    CarRecommendation.objects.filter(car_id__in=car_ids).delete()
+    CarRecommendation.objects.bulk_create(
+        CarRecommendation(car_id=car_id, recommended_id=other_id, score=value)
+        for car_id in car_ids if car_id in subjects
+        for value, other_id in _top(subjects[car_id], candidates)
+    )
+
+
+def _similarity(subject):
+    """score(машина, subject) выражением SQL для всех машин сразу"""
+    price = float(subject['price'])
+    own_price = Cast('price', FloatField())
+    closeness = 1 - Abs(own_price - price) / NullIf(Greatest(own_price, Value(price)), 0)
+    return ExpressionWrapper(
+        Case(When(type=subject['type'], then=Value(TYPE_WEIGHT)), default=Value(0.0))
+        + Case(When(brand=subject['brand'], then=Value(BRAND_WEIGHT)), default=Value(0.0))
+        + PRICE_WEIGHT * Coalesce(closeness, Value(0.0))
+        + RATING_WEIGHT * float(subject['average_rating'] or 0),
+        output_field=FloatField(),
+    )
+
+
+def _owners(car_id, subject):
+    """Машины, чей список может измениться: он содержит car_id, неполон или subject в него проходит"""
+    owners = set(CarRecommendation.objects.filter(recommended_id=car_id).values_list('car_id', flat=True))
+    lists = CarRecommendation.objects.filter(car=OuterRef('pk')).order_by().values('car')
+    cars = Car.objects.exclude(pk=car_id).annotate(
+        stored=Coalesce(Subquery(lists.annotate(total=Count('pk')).values('total')), 0),
+    )
+    admits = Q(stored__lt=TOP_N)
+    if subject and subject['is_available']:
+        cars = cars.annotate(
+            lowest=Subquery(lists.annotate(lowest=Min('score')).values('lowest')),
+            similarity=_similarity(subject),
+        )
+        # Нестрогое сравнение с запасом: при равенстве порядок решает id, пересчет не повредит
+        admits |= Q(lowest__lte=F('similarity') + SCORE_EPSILON)
+    owners.update(cars.filter(admits).values_list('pk', flat=True))
+    if subject:
+        owners.add(car_id)
+    return owners
+
+
+def refresh_for_car(car_id):
+    """Пересчитывает рекомендации после изменения или удаления машины car_id.
+
+    Затронутые списки выбираются запросом (_owners), остальные не читаются:
+    в них car_id нет и войти он не может.
+    """
+    subject = Car.objects.filter(pk=car_id).values(*CANDIDATE_FIELDS, 'is_available').first()
+    with transaction.atomic():
+        owners = _owners(car_id, subject)
+        if not owners:
+            return
+        subjects = {row['id']: row for row in Car.objects.filter(pk__in=owners).values(*CANDIDATE_FIELDS)}
+        _store(owners, subjects, _candidates())
+
+
+def rebuild():
+    """Полный пересчет рекомендаций для всех машин"""
+    candidates = _candidates()
+    subjects = {row['id']: row for row in Car.objects.values(*CANDIDATE_FIELDS)}
+    with transaction.atomic():
+        CarRecommendation.objects.all().delete()
+        _store(list(subjects), subjects, candidates)
+    return len(subjects)
+
+
+def similar_cars(car, count=SHOWN):
+    """Случайные count машин из предрассчитанного списка похожих"""
+    pool = [
+        recommendation.recommended
+        for recommendation in CarRecommendation.objects.filter(
+            car=car, recommended__is_available=True
+        ).select_related('recommended')
+    ]
+    if not pool and not CarRecommendation.objects.filter(car=car).exists():
+        # Список для машины еще не строился
+        refresh_for_car(car.pk)
+        pool = [
+            recommendation.recommended
+            for recommendation in CarRecommendation.objects.filter(car=car).select_related('recommended')
+        ]
+    return random.sample(pool, min(count, len(pool)))
+
+
+async def asimilar_cars(car, count=SHOWN):
+    """similar_cars для асинхронных представлений"""
+    pool = [
+        recommendation.recommended
+        async for recommendation in CarRecommendation.objects.filter(
+            car=car, recommended__is_available=True
+        ).select_related('recommended')
+    ]
+    if not pool and not await CarRecommendation.objects.filter(car=car).aexists():
+        # Построение списка — пакет синхронных запросов в транзакции
+        return await sync_to_async(similar_cars)(car, count)
+    return random.sample(pool, min(count, len(pool)))
@@ -0,0 +1,252 @@
+"""Бронирование без двойной продажи.
+
+BookingForm.clean проверяет пересечения до сохранения и без блокировок:
+два одновременных запроса могут обе пройти проверку. Здесь проверка и
+запись идут в одной короткой транзакции после блокировки строки Car
+(SELECT ... FOR UPDATE): бронирования одной машины обрабатываются по
+очереди, разные машины друг другу не мешают.
+
+Занятым считается период с подтвержденным бронированием. Ожидающие брони
+могут пересекаться между собой — подтверждает одну из них confirm(),
+повторяя проверку под той же блокировкой, или auto_confirm() сразу для
+всех ожидающих броней набора машин.
+"""
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from . import availability, caching, conditional, pricing, rates
+from .models import Booking, Car, CarService
+
+# Кто выигрывает при пересечении ожидающих броней
+PRIORITIES = {
+    'fifo': 'Первая заявка',
+    'longest': 'Самая долгая аренда',
+    'revenue': 'Наибольшая выручка',
+}
+# Размер пачки id в UPDATE ... WHERE id IN (...)
+UPDATE_BATCH = 1000
+
+
+class BookingConflict(Exception):
+    """Период пересекается с подтвержденным бронированием"""
+
+    def __init__(self, booking_id=None):
+        self.booking_id = booking_id
+        super().__init__('Автомобиль уже забронирован на выбранные даты')
+
+
+def _lock_car(car_id):
+    # Блокировка держится до конца транзакции
+    if not list(Car.objects.select_for_update().filter(pk=car_id).values_list('pk', flat=True)):
+        raise Car.DoesNotExist(f'Автомобиль {car_id} не найден')
+
+
+def find_conflict(car_id, date_from, date_to, exclude=None):
+    """id подтвержденного бронирования, пересекающего период, или None"""
+    conflicts = Booking.objects.filter(car_id=car_id).confirmed().overlapping(date_from, date_to)
+    if exclude is not None:
+        conflicts = conflicts.exclude(pk=exclude)
+    return conflicts.values_list('pk', flat=True).first()
+
+
+def _resolve_services(car_id, services):
+    """CarService выбранных и обязательных услуг машины одним запросом"""
+    return list(
+        CarService.objects.filter(
+            Q(service__in=services) | Q(is_required=True), car_id=car_id
+        ).select_related('service').order_by('service_id')
+    )
+
+
+def _write_services(booking, car_services, replace):
+    """Связи бронирования с услугами пакетной вставкой в промежуточную таблицу"""
+    through = Booking.services.through
+    if replace:
+        through.objects.filter(booking_id=booking.pk).delete()
+    through.objects.bulk_create([
+        through(booking_id=booking.pk, carservice_id=car_service.pk) for car_service in car_services
+    ])
+
+
+def _take_snapshot(booking, car_services):
+    booking.price_snapshot = pricing.snapshot(booking.car, car_services, booking.date_from, booking.date_to)
+    booking.total_amount = Decimal(booking.price_snapshot['total'])
+
+
+def save(booking, services=None):
+    """Сохраняет бронирование, если его период свободен, иначе BookingConflict.
+
+    services — выбранные Service; None оставляет услуги без изменений.
+    Обязательные услуги машины добавляются всегда. Расчет стоимости
+    сохраняется заново для новой брони, при смене машины, дат или услуг.
+    """
+    is_new = booking.pk is None
+    if services is None and is_new:
+        services = ()
+    with transaction.atomic():
+        _lock_car(booking.car_id)
+        if booking.status != 'cancelled':
+            conflict = find_conflict(booking.car_id, booking.date_from, booking.date_to, exclude=booking.pk)
+            if conflict:
+                raise BookingConflict(conflict)
+        changed = booking.changed_fields()
+        if services is None and 'car_id' in changed:
+            # Услуги прежней машины переносятся на новую вместе с ее обязательными
+            services = list(booking.services.values_list('service_id', flat=True))
+        car_services = None
+        if services is not None:
+            car_services = _resolve_services(booking.car_id, services)
+        elif changed & {'date_from', 'date_to'}:
+            car_services = list(booking.services.select_related('service'))
+        if car_services is not None:
+            _take_snapshot(booking, car_services)
+        booking.save()
+        if services is not None:
+            _write_services(booking, car_services, replace=not is_new)
+    return booking
+
+
+def reserve(user, car, date_from, date_to, services=()):
+    """Новое бронирование в статусе «ожидает»"""
+    booking = Booking(user=user, car=car, date_from=date_from, date_to=date_to, status='pending')
+    return save(booking, services)
+
+
+def confirm(booking):
+    """Подтверждает бронирование, если период все еще свободен"""
+    with transaction.atomic():
+        _lock_car(booking.car_id)
+        # Статус и даты могли измениться, пока ждали блокировку
+        booking = Booking.objects.get(pk=booking.pk)
+        if booking.status == 'confirmed':
+            return booking
+        conflict = find_conflict(booking.car_id, booking.date_from, booking.date_to, exclude=booking.pk)
+        if conflict:
+            raise BookingConflict(conflict)
+        booking.status = 'confirmed'
+        booking.save(update_fields=['status'])
+    return booking
+
+
+def _lock_cars(car_ids):
+    # Порядок по id: две пачки с общими машинами не заблокируют друг друга
+    return list(Car.objects.select_for_update().filter(pk__in=car_ids).order_by('pk').values_list('pk', 'brand'))
+
+
+def _revenue(booking, brand):
+    days = (booking['date_to'] - booking['date_from']).days + 1
+    subtotal = rates.base_price(booking['car_id'], booking['date_from'], booking['date_to'])
+    subtotal += (booking['services_daily'] or Decimal(0)) * days
+    return subtotal - subtotal * rates.discount_percentage(days, brand) / 100
+
+
+def _priority_key(priority, brands):
+    if priority == 'longest':
+        return lambda booking: (booking['date_from'] - booking['date_to'], booking['pk'])
+    if priority == 'revenue':
+        return lambda booking: (-_revenue(booking, brands[booking['car_id']]), booking['pk'])
+    return lambda booking: booking['pk']
+
+
+def _clusters(intervals):
+    """Заметающая прямая: группы пересекающихся (цепочкой) интервалов, отсортированных по началу"""
+    cluster, cluster_end = [], None
+    for interval in intervals:
+        if cluster and interval['date_from'] > cluster_end:
+            yield cluster
+            cluster = []
+        if not cluster or interval['date_to'] > cluster_end:
+            cluster_end = interval['date_to']
+        cluster.append(interval)
+    if cluster:
+        yield cluster
+
+
+def _resolve(cluster, key):
+    """(победители, проигравшие) среди ожидающих броней группы"""
+    pending = [interval for interval in cluster if interval['status'] == 'pending']
+    if len(pending) == len(cluster) == 1:
+        return pending, []
+    # Занятые отрезки: подтвержденные брони и уже выбранные победители, без пересечений
+    starts, ends = [], []
+    for interval in cluster:
+        if interval['status'] == 'confirmed':
+            if starts and interval['date_from'] <= ends[-1]:
+                ends[-1] = max(ends[-1], interval['date_to'])
+            else:
+                starts.append(interval['date_from'])
+                ends.append(interval['date_to'])
+    winners, losers = [], []
+    for booking in sorted(pending, key=key):
+        i = bisect_right(starts, booking['date_to'])
+        if i and ends[i - 1] >= booking['date_from']:
+            losers.append(booking)
+            continue
+        winners.append(booking)
+        # Победитель ни с чем не пересекается — встает между соседями, порядок сохраняется
+        starts.insert(i, booking['date_from'])
+        ends.insert(i, booking['date_to'])
+    return winners, losers
+
+
+def _update_status(booking_ids, status):
+    for i in range(0, len(booking_ids), UPDATE_BATCH):
+        Booking.objects.filter(pk__in=booking_ids[i:i + UPDATE_BATCH]).update(status=status)
+
+
+def auto_confirm(car_ids=None, priority='fifo', dry_run=False):
+    """Подтверждает ожидающие брони машин car_ids (None — всех), пересекающиеся отменяет.
+
+    Из пересекающихся заявок побеждает приоритетная (PRIORITIES), заявки,
+    пересекающие уже подтвержденные брони, отменяются. Статусы меняются
+    пакетными UPDATE без сигналов, поэтому карты доступности и кэш страниц
+    обновляются здесь же. Возвращает {'confirmed': [id], 'cancelled': [id]}.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f'Неизвестный приоритет: {priority}')
+    pending = Booking.objects.filter(status='pending', date_to__gte=date.today())
+    if car_ids is not None:
+        pending = pending.filter(car_id__in=car_ids)
+
+    with transaction.atomic():
+        brands = dict(_lock_cars(pending.values('car_id')))
+        fields = ('pk', 'car_id', 'date_from', 'date_to', 'status')
+        intervals = {car_id: [] for car_id in brands}
+        rows = pending.filter(car_id__in=brands).values(*fields)
+        if priority == 'revenue':
+            rows = rows.annotate(services_daily=Sum('services__price'))
+        for row in rows:
+            intervals[row['car_id']].append(row)
+        # Подтвержденные брони в тех же периодах — неподвижные препятствия
+        earliest = min((row['date_from'] for car_rows in intervals.values() for row in car_rows), default=None)
+        for row in Booking.objects.filter(
+            car_id__in=brands, status='confirmed', date_to__gte=earliest or date.today()
+        ).values(*fields):
+            intervals[row['car_id']].append(row)
+
+        key = _priority_key(priority, brands)
+        confirmed, cancelled, windows = [], [], {}
+        for car_id, car_intervals in intervals.items():
+            car_intervals.sort(key=lambda interval: (interval['date_from'], interval['date_to']))
+            for cluster in _clusters(car_intervals):
+                winners, losers = _resolve(cluster, key)
+                confirmed += [booking['pk'] for booking in winners]
+                cancelled += [booking['pk'] for booking in losers]
+                for booking in winners:
+                    window = windows.get(car_id, (booking['date_from'], booking['date_to']))
+                    windows[car_id] = (min(window[0], booking['date_from']), max(window[1], booking['date_to']))
+
+        if not dry_run:
+            _update_status(confirmed, 'confirmed')
+            _update_status(cancelled, 'cancelled')
+            for car_id, (date_from, date_to) in windows.items():
+                availability.refresh(car_id, date_from, date_to)
+            changed = [car_id for car_id, car_intervals in intervals.items()
+                       if any(row['status'] == 'pending' for row in car_intervals)]
+            caching.invalidate_car(*changed)
+            conditional.touch(*changed)
+    return {'confirmed': confirmed, 'cancelled': cancelled}
@@ -0,0 +1,138 @@
+"""Поиск по парку: инвертированный индекс SearchTerm (слово → машина, вес).
+
+Слова берутся из бренда, названия и типа кузова машины и из текста
+опубликованных отзывов по подтвержденным бронированиям (те же, что на
+странице машины). Индекс машины пересобирается сигналами при изменении
+этих полей. Слово запроса ищется как префикс диапазоном
+term >= слово AND term < слово + '\\uffff': в отличие от LIKE 'слово%' в
+SQLite и LIKE '%слово%' везде, он идет по индексу на любой СУБД.
+Машина находится, если совпали все слова запроса; ранг — сумма весов
+совпавших слов, точное совпадение весит вдвое больше префиксного.
+
+Индекс в базе, а не в памяти процесса: воркеры видят одни и те же
+данные, а запрос к нему — обычный фильтр каталога, совместимый с
+пагинацией и асинхронными представлениями.
+"""
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, When
+
+from .models import Car, Review, SearchTerm
+
+# Вес вхождения слова в поле машины; слово из отзыва — 1 за каждый отзыв
+FIELD_WEIGHTS = {'brand': 8, 'name': 8, 'type': 4}
+REVIEW_WEIGHT = 1
+MIN_TERM_LENGTH = 2
+# Лишние слова запроса отбрасываются: каждое — отдельный диапазон по индексу
+MAX_QUERY_TERMS = 5
+REBUILD_BATCH = 500
+
+TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре, «ё» как «е» — для кириллицы и латиницы одинаково"""
+    words = WORD.findall((text or '').lower().replace('ё', 'е'))
+    return [word[:TERM_LENGTH] for word in words if len(word) >= MIN_TERM_LENGTH]
+
+
+def _public_reviews():
+    return Review.objects.filter(booking__status='confirmed', is_public=True)
+
+
+def _weights(car, comments):
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(getattr(car, field)):
+            weights[term] += weight
+    for comment in comments:
+        for term in set(tokenize(comment)):
+            weights[term] += REVIEW_WEIGHT
+    return weights
+
+
+def _terms(car_ids):
+    comments = defaultdict(list)
+    for car_id, comment in _public_reviews().filter(booking__car_id__in=car_ids).values_list(
+        'booking__car_id', 'comment'
+    ):
+        comments[car_id].append(comment)
+    return [
+        SearchTerm(term=term, car_id=car.pk, weight=weight)
+        for car in Car.objects.filter(pk__in=car_ids).only(*FIELD_WEIGHTS)
+        for term, weight in _weights(car, comments[car.pk]).items()
+    ]
+
+
+def index_cars(*car_ids):
+    """Пересобирает индекс машин car_ids (удаленные машины из него уходят)"""
+    car_ids = set(car_ids) - {None}
+    if not car_ids:
+        return
+    with transaction.atomic():
+        SearchTerm.objects.filter(car_id__in=car_ids).delete()
+        SearchTerm.objects.bulk_create(_terms(car_ids))
+
+
+def booking_changed(booking):
+    """Отзыв виден в поиске, только пока бронирование подтверждено, и относится к его машине"""
+    if Review.objects.filter(booking=booking).exists():
+        index_cars(booking.car_id, booking.loaded_state.get('car_id'))
+
+
+def rebuild():
+    """Полная пересборка индекса, возвращает (машин, слов)"""
+    car_ids = list(Car.objects.order_by('pk').values_list('pk', flat=True))
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        for i in range(0, len(car_ids), REBUILD_BATCH):
+            SearchTerm.objects.bulk_create(_terms(car_ids[i:i + REBUILD_BATCH]))
+    return len(car_ids), SearchTerm.objects.count()
+
+
+def _prefix(term):
+    return Q(term__gte=term, term__lt=term + '\uffff')
+
+
+def matches(query):
+    """Queryset {car_id, rank} машин, подходящих под все слова запроса (None — искать нечего)"""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    condition = Q()
+    for term in terms:
+        condition |= _prefix(term)
+    # Отдельная сумма по каждому слову: HAVING отсекает машины, где какое-то слово не нашлось
+    per_term = {f'match_{i}': Sum('weight', filter=_prefix(term)) for i, term in enumerate(terms)}
+    return SearchTerm.objects.filter(condition).values('car_id').annotate(
+        rank=Sum(Case(
+            When(term__in=terms, then=F('weight') * 2), default=F('weight'), output_field=IntegerField()
+        )),
+        **per_term,
+    ).filter(**{f'{name}__gt': 0 for name in per_term})
+
+
+def filter_cars(cars, query):
+    """Машины cars, найденные по запросу, с рангом в поле search_rank.
+
+    Ранг считается коррелированным подзапросом по индексу (car, term) —
+    только для машин, уже прошедших фильтр. Запрос к базе не выполняется,
+    пока queryset не вычислен.
+    """
+    ranked = matches(query)
+    if ranked is None:
+        return cars
+    return cars.filter(pk__in=ranked.values('car_id')).annotate(
+        search_rank=Subquery(ranked.filter(car_id=OuterRef('pk')).values('rank')[:1])
+    )
+
+
+def search(query, limit=20):
+    """[(car_id, rank)] лучших совпадений по всему парку"""
+    ranked = matches(query)
+    if ranked is None:
+        return []
+    return list(ranked.order_by('-rank', 'car_id').values_list('car_id', 'rank')[:limit])
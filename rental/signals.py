@@ -0,0 +1,136 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import (
+    availability, caching, conditional, facets, pricing, rates, ratings, recommendations, search, stats, storage,
+    thumbnails,
+)
+from .models import Booking, Car, CarService, DiscountTier, PricingRule, Review
+
+
+def _confirmed_window(state):
+    if state and state['status'] == 'confirmed':
+        return state['car_id'], state['date_from'], state['date_to']
+    return None
+
+
+def _related_changed(*car_ids):
+    """Изменились данные, которые видны на страницах машин, но хранятся не в Car"""
+    caching.invalidate_car(*car_ids)
+    conditional.touch(*car_ids)
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    changed = instance.changed_fields()
+    if changed:
+        _related_changed(instance.car_id, (instance.loaded_state or {}).get('car_id'))
+    if instance.loaded_state and changed & {'status', 'car_id'}:
+        search.booking_changed(instance)
+    old = _confirmed_window(instance.loaded_state)
+    new = _confirmed_window(instance.current_state())
+    if old == new:
+        return
+    # Пересчитываем только дни, которые могли измениться
+    for window in {old, new} - {None}:
+        availability.refresh(*window)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    _related_changed(instance.car_id)
+    window = _confirmed_window(instance.loaded_state or instance.current_state())
+    if window:
+        availability.refresh(*window)
+
+
+# Поля Car, от которых зависят производные данные
+STATS_FIELDS = {'type', 'price', 'is_available'}
+FACET_FIELDS = {'brand', 'type', 'price', 'is_available'}
+RECOMMENDATION_FIELDS = {'brand', 'type', 'price', 'is_available', 'average_rating'}
+PRICING_FIELDS = {'brand', 'type', 'price'}
+SEARCH_FIELDS = {'name', 'brand', 'type'}
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Название, фото и прочие неотслеживаемые поля тоже видны на страницах
+    caching.invalidate_car(instance.pk)
+    changed = instance.changed_fields()
+    if changed & STATS_FIELDS:
+        stats.car_changed(instance.loaded_state, instance.current_state())
+    if changed & FACET_FIELDS:
+        facets.invalidate()
+    if changed & RECOMMENDATION_FIELDS:
+        recommendations.refresh_for_car(instance.pk)
+    if changed & PRICING_FIELDS:
+        rates.cars_changed([instance.pk])
+        pricing.invalidate()
+    if changed & SEARCH_FIELDS:
+        search.index_cars(instance.pk)
+    if 'image' in changed:
+        if instance.loaded_state:
+            storage.release(instance.loaded_state['image'])
+        storage.retain(instance.image.name)
+        if instance.image:
+            # Копии создаются при загрузке: страницы их не кодируют
+            try:
+                thumbnails.generate(instance.image)
+            except (OSError, ValueError):
+                # Не изображение — на страницах будет оригинал
+                pass
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, **kwargs):
+    caching.invalidate_car(instance.pk)
+    stats.car_changed(instance.loaded_state or instance.current_state(), None)
+    facets.invalidate()
+    recommendations.refresh_for_car(instance.pk)
+    rates.cars_changed([instance.pk])
+    pricing.invalidate()
+    storage.release(instance.image.name)
+
+
+@receiver([post_save, post_delete], sender=CarService)
+def car_service_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pricing.invalidate()
+        _related_changed(instance.car_id)
+
+
+@receiver([post_save, post_delete], sender=PricingRule)
+def pricing_rule_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rates.rule_changed(instance)
+        pricing.invalidate()
+        conditional.touch_all()
+
+
+@receiver([post_save, post_delete], sender=DiscountTier)
+def discount_tier_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rates.tiers_changed()
+        pricing.invalidate()
+        conditional.touch_all()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ratings.review_changed(instance, instance.loaded_state, instance.current_state())
+    _related_changed(ratings.review_car_id(instance))
+    if instance.changed_fields() & {'booking_id', 'comment', 'is_public'}:
+        search.index_cars(ratings.review_car_id(instance))
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.review_changed(instance, instance.loaded_state or instance.current_state(), None)
+    _related_changed(ratings.review_car_id(instance))
+    search.index_cars(ratings.review_car_id(instance))
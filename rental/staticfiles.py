@@ -0,0 +1,61 @@
+"""Хранилище статики: имена с хэшем содержимого и готовые сжатые копии.
+
+ManifestStaticFilesStorage при collectstatic переименовывает файлы в
+name.<хэш>.ext и переписывает ссылки в CSS; затем для текстовых файлов
+рядом записываются .gz и, если установлен пакет brotli, .br. Отдавать
+их без сжатия на лету может веб-сервер (gzip_static/brotli_static) или
+rental.views.serve_static.
+"""
+import gzip
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.ico', '.xml', '.html')
+# Маленькие файлы не сжимаем: выигрыш меньше накладных расходов
+MIN_SIZE = 512
+# Имя, обработанное ManifestStaticFilesStorage: style.0123456789ab.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # Без manifest_strict Django считает хэш файла, которого нет в манифесте, и при
+        # отсутствии файла все равно бросает ValueError: отдаем имя без хэша —
+        # 404 на одну картинку вместо 500 на всю страницу
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.endswith(COMPRESSIBLE):
+                yield from self._compress(name)
+
+    def _compress(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_SIZE:
+            return
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+            yield name, name + suffix, True
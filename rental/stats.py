@@ -0,0 +1,146 @@
+"""Инкрементально поддерживаемая статистика доступного парка.
+
+Строки FleetStats обновляются дельтами при сохранении и удалении автомобиля
+(см. rental.signals), главная страница читает готовую запись без агрегации.
+Минимум и максимум пересчитываются по базе только когда из корзины уходит
+автомобиль с крайней ценой.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import Car, FleetStats
+
+# Корзина всего парка
+FLEET = ''
+
+
+def _contribution(state):
+    """(тип, цена) автомобиля, если он учитывается в статистике"""
+    if state and state['is_available']:
+        return state['type'], state['price']
+    return None
+
+
+def _aggregate(car_type=None):
+    queryset = Car.available.all()
+    if car_type is not None:
+        queryset = queryset.filter(type=car_type)
+    return queryset.aggregate(
+        total=Count('id'),
+        price_sum=Sum('price'),
+        min_price=Min('price'),
+        max_price=Max('price')
+    )
+
+
+def _add(car_type, price):
+    for bucket in (FLEET, car_type):
+        updated = FleetStats.objects.filter(car_type=bucket).update(
+            total=F('total') + 1,
+            price_sum=F('price_sum') + price,
+            min_price=Least(Coalesce('min_price', Value(price)), Value(price)),
+            max_price=Greatest(Coalesce('max_price', Value(price)), Value(price)),
+        )
+        if not updated:
+            _rebuild_bucket(bucket)
+
+
+def _remove(car_type, price):
+    for bucket in (FLEET, car_type):
+        updated = FleetStats.objects.filter(car_type=bucket).update(
+            total=F('total') - 1,
+            price_sum=F('price_sum') - price,
+        )
+        if not updated:
+            _rebuild_bucket(bucket)
+            continue
+        stats = FleetStats.objects.get(car_type=bucket)
+        if stats.total == 0 and bucket != FLEET:
+            stats.delete()
+        elif price in (stats.min_price, stats.max_price):
+            # Ушла крайняя цена — пересчитываем только границы этой корзины
+            bounds = _aggregate(bucket or None)
+            stats.min_price, stats.max_price = bounds['min_price'], bounds['max_price']
+            stats.save(update_fields=['min_price', 'max_price', 'updated_at'])
+
+
+def _rebuild_bucket(bucket):
+    values = _aggregate(bucket or None)
+    if bucket != FLEET and not values['total']:
+        FleetStats.objects.filter(car_type=bucket).delete()
+        return
+    values['price_sum'] = values['price_sum'] or 0
+    FleetStats.objects.update_or_create(car_type=bucket, defaults=values)
+
+
+def car_changed(old_state, new_state):
+    """Применяет к статистике переход автомобиля из old_state в new_state"""
+    old = _contribution(old_state)
+    new = _contribution(new_state)
+    if old == new:
+        return
+    with transaction.atomic():
+        if old:
+            _remove(*old)
+        if new:
+            _add(*new)
+
+
+def get_stats(car_type=FLEET):
+    """Статистика корзины в формате агрегата Count/Avg/Min/Max"""
+    stats = FleetStats.objects.filter(car_type=car_type).first()
+    if stats is None and not FleetStats.objects.filter(car_type=FLEET).exists():
+        # Статистика еще не строилась — собираем все корзины сразу
+        rebuild()
+        stats = FleetStats.objects.filter(car_type=car_type).first()
+    if stats is None:
+        return FleetStats(car_type=car_type).as_dict()
+    return stats.as_dict()
+
+
+def compute():
+    """Эталонная статистика по базе: {car_type: значения}"""
+    expected = {}
+    rows = Car.available.values('type').annotate(
+        total=Count('id'),
+        price_sum=Sum('price'),
+        min_price=Min('price'),
+        max_price=Max('price')
+    ).order_by()
+    for row in rows:
+        expected[row.pop('type')] = row
+    fleet = _aggregate()
+    fleet['price_sum'] = fleet['price_sum'] or 0
+    expected[FLEET] = fleet
+    return expected
+
+
+def find_drift():
+    """Список (car_type, сохраненное, эталонное) для расходящихся корзин"""
+    expected = compute()
+    stored = {
+        stats.car_type: {
+            'total': stats.total,
+            'price_sum': stats.price_sum,
+            'min_price': stats.min_price,
+            'max_price': stats.max_price,
+        }
+        for stats in FleetStats.objects.all()
+    }
+    drift = []
+    for car_type in sorted(set(expected) | set(stored)):
+        if stored.get(car_type) != expected.get(car_type):
+            drift.append((car_type, stored.get(car_type), expected.get(car_type)))
+    return drift
+
+
+def rebuild():
+    """Пересоздает все записи статистики по базе"""
+    expected = compute()
+    with transaction.atomic():
+        FleetStats.objects.all().delete()
+        FleetStats.objects.bulk_create(
+            FleetStats(car_type=car_type, **values) for car_type, values in expected.items()
+        )
+    return expected
@@ -0,0 +1,107 @@
+"""Хранилище фотографий по хэшу содержимого.
+
+При сохранении изображение нормализуется (поворот по EXIF, ограничение
+размера, пересжатие без EXIF/XMP) и записывается под именем из SHA-256
+результата: cars/ab/abcdef….jpg. Повторная загрузка того же файла не
+создает копию, а возвращает имя существующего; URL меняется только вместе
+с содержимым, поэтому его можно кэшировать навсегда (immutable).
+
+Ссылки на файлы считаются в MediaBlob: retain/release вызываются из
+сигналов Car, неиспользуемые файлы удаляет команда collect_media.
+"""
+import hashlib
+import os
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from PIL import Image, ImageOps
+
+# Длинная сторона оригинала после нормализации
+MAX_DIMENSION = 2560
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+HASHED_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/(\1[0-9a-f]{62})\.\w+$')
+
+
+def normalize(data):
+    """(байты, расширение) нормализованного изображения или None, если это не изображение"""
+    try:
+        image = Image.open(BytesIO(data))
+        image_format = image.format
+        if image_format not in SAVE_OPTIONS or getattr(image, 'n_frames', 1) > 1:
+            return None
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    options = dict(SAVE_OPTIONS[image_format])
+    if icc_profile:
+        # Цветовой профиль оставляем, остальные метаданные (EXIF, GPS, XMP) — нет
+        options['icc_profile'] = icc_profile
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue(), EXTENSIONS[image_format]
+
+
+def digest_of(name):
+    """Хэш содержимого из имени файла (None для файлов, сохраненных по-старому)"""
+    match = HASHED_NAME.search(name or '')
+    return match.group(2) if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        content.seek(0)
+        data = content.read()
+        normalized = normalize(data)
+        if normalized:
+            data, extension = normalized
+        else:
+            extension = os.path.splitext(name)[1].lstrip('.').lower() or 'bin'
+
+        digest = hashlib.sha256(data).hexdigest()
+        directory = os.path.dirname(name)
+        name = '/'.join(part for part in (directory, digest[:2], f'{digest}.{extension}') if part)
+        if not self.exists(name):
+            name = self._save(name, ContentFile(data))
+        _register(name, len(data))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя однозначно определяется содержимым: одинаковые файлы совпадают
+        return name
+
+
+def _register(name, size):
+    from .models import MediaBlob
+    blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size})
+    if not created:
+        # Обновляем updated_at, чтобы сборщик мусора не удалил файл до привязки к машине
+        blob.save(update_fields=['updated_at'])
+
+
+def retain(name):
+    from .models import MediaBlob
+    if not name:
+        return
+    if not MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+        MediaBlob.objects.get_or_create(name=name, defaults={'refcount': 1})
+
+
+def release(name):
+    from .models import MediaBlob
+    if name:
+        MediaBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1)
@@ -1,6 +1,12 @@
 from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 import random
 
+from rental import caching, thumbnails
+
 register = template.Library()
 
 @register.simple_tag
@@ -21,3 +27,54 @@ def user_greeting(context):
     else:
         return "Добро пожаловать, гость!"
 
+@register.filter
+def get_item(mapping, key):
+    return mapping.get(key) if mapping else None
+
+@register.simple_tag
+def car_picture(car, sizes='100vw', css_class='', alt=None, loading='lazy'):
+    """<picture> с WebP/JPEG-копиями фото машины (srcset/sizes) или заглушкой"""
+    alt = car.name if alt is None else alt
+    renditions = thumbnails.get_renditions(car.image)
+    if renditions is None:
+        src = car.image.url if car.image else static('assets/default.jpg')
+        return format_html('<img src="{}" class="{}" alt="{}" loading="{}">', src, css_class, alt, loading)
+
+    # Ближайшая к карточке каталога копия как src для браузеров без srcset
+    fallback = renditions['jpeg'][min(1, len(renditions['jpeg']) - 1)][1]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}" '
+        'loading="{}" decoding="async">'
+        '</picture>',
+        thumbnails.srcset(renditions, 'webp'), sizes,
+        default_storage.url(fallback), thumbnails.srcset(renditions, 'jpeg'), sizes,
+        renditions['width'], renditions['height'], css_class, alt, loading,
+    )
+
+
+class CarFragmentNode(template.Node):
+    def __init__(self, nodelist, name, car):
+        self.nodelist = nodelist
+        self.name = name
+        self.car = car
+
+    def render(self, context):
+        user = context.get('user')
+        # Анонимам отдается кэш целой страницы, фрагменты — для вошедших
+        if user is None or not user.is_authenticated:
+            return self.nodelist.render(context)
+        car = self.car.resolve(context)
+        key = caching.fragment_key(self.name.resolve(context), car.pk)
+        return mark_safe(caching.cached(caching.FRAGMENTS, key, lambda: self.nodelist.render(context)))
+
+@register.tag
+def car_fragment(parser, token):
+    """{% car_fragment 'имя' car %}…{% endcar_fragment %} — кэш блока по версии машины"""
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' принимает имя фрагмента и машину")
+    nodelist = parser.parse(('endcar_fragment',))
+    parser.delete_first_token()
+    return CarFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
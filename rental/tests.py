@@ -1,3 +1,1641 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    async_views, availability, caching, exports, facets, outbox, rates, recommendations, reservations, search,
+    storage, thumbnails, views,
+)
+from .admin import BookingInline, BookingYearFilter
+from .availability import HORIZON_DAYS, get_map, is_range_free, next_free_date, occupancy, range_mask
+from .forms import MAX_RENTAL_DAYS
+from .models import (
+    Booking, Car, CarAvailability, CarRecommendation, CarService, DiscountTier, MediaBlob, OutboxEmail, PricingRule,
+    Review, SearchTerm, Service,
+)
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .ratings import find_drift, reconcile
+from .reservations import BookingConflict
+from .templatetags import custom_tags
+
+
+def make_car(**fields):
+    values = {'name': 'Camry', 'brand': 'Toyota', 'type': 'Седан', 'price': Decimal('300.00')}
+    values.update(fields)
+    return Car.objects.create(**values)
+
+
+def make_image(width=1200, height=800, image_format='JPEG', name='photo.jpg', color='navy'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaRootMixin:
+    """Файлы тестов пишутся во временный MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+
+def make_booking(user, car, date_from, days=1, status='pending', **fields):
+    values = {'price_snapshot': {'services': [], 'total': '300.00'}, 'total_amount': Decimal('300.00')}
+    values.update(fields)
+    return Booking.objects.create(
+        user=user, car=car, date_from=date_from, date_to=date_from + timedelta(days=days - 1), status=status,
+        **values
+    )
+
+
+def recommendations_and_rebuild():
+    """Сохраненные похожие машины до и после полного пересчета"""
+    def stored():
+        return set(CarRecommendation.objects.values_list('car_id', 'recommended_id', 'score'))
+
+    incremental = stored()
+    recommendations.rebuild()
+    return incremental, stored()
+
+
+class MyBookingsQueriesTest(TestCase):
+    """Страница «Мои бронирования»: число запросов не зависит от числа броней на странице"""
+
+    # Сессия, пользователь, бронирования страницы вместе с машиной и отзывом (per_page + 1 строка,
+    # без COUNT) и фасеты каталога для меню, если их нет в кэше
+    QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        from .views import BOOKINGS_PER_PAGE
+        cls.per_page = BOOKINGS_PER_PAGE
+        cls.user = User.objects.create_user('client', password='secret')
+        cars = [make_car(name=f'Camry {i}') for i in range(3)]
+        today = date.today()
+        for i in range(BOOKINGS_PER_PAGE + 3):
+            car = cars[i % len(cars)]
+            make_booking(cls.user, car, today + timedelta(days=2 * i + 1))
+            make_booking(cls.user, car, today - timedelta(days=2 * i + 10), status='confirmed')
+        for i in range(3):
+            make_booking(cls.user, cars[i], today + timedelta(days=100 + i), status='cancelled')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_page(self, tab, cursor=None):
+        params = {'tab': tab}
+        if cursor:
+            params['cursor'] = cursor
+        cache.clear()
+        with self.assertNumQueries(self.QUERIES):
+            response = self.client.get(reverse('my_bookings'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['bookings']
+
+    def test_full_pages(self):
+        for tab in ('upcoming', 'past'):
+            with self.subTest(tab=tab):
+                page = self.get_page(tab)
+                self.assertEqual(len(page), self.per_page)
+                self.assertTrue(page.has_next())
+
+    def test_partial_pages(self):
+        for tab in ('upcoming', 'past'):
+            with self.subTest(tab=tab):
+                page = self.get_page(tab, self.get_page(tab).next_cursor)
+                self.assertEqual(len(page), 3)
+                self.assertFalse(page.has_next())
+
+    def test_cancelled(self):
+        page = self.get_page('cancelled')
+        self.assertEqual(len(page), 3)
+        self.assertEqual({booking.status for booking in page}, {'cancelled'})
+
+
+class AvailabilityTest(TestCase):
+    """Битовые карты занятости и фильтр каталога по датам"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client')
+        self.car = make_car()
+        self.other = make_car(name='Corolla')
+        self.today = date.today()
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def test_confirmed_booking_occupies_days(self):
+        make_booking(self.user, self.car, self.today + timedelta(days=5), days=3, status='confirmed')
+        car_map = get_map(self.car)
+        self.assertEqual(car_map.next_booked_from, self.today + timedelta(days=5))
+        self.assertEqual(car_map.next_booked_to, self.today + timedelta(days=7))
+        self.assertFalse(is_range_free(self.car, self.today + timedelta(days=7), self.today + timedelta(days=9)))
+        self.assertTrue(is_range_free(self.car, self.today + timedelta(days=8), self.today + timedelta(days=9)))
+        self.assertTrue(is_range_free(self.other, self.today + timedelta(days=5), self.today + timedelta(days=7)))
+
+    def test_pending_booking_does_not_occupy_days(self):
+        make_booking(self.user, self.car, self.today + timedelta(days=5), days=3)
+        self.assertTrue(is_range_free(self.car, self.today + timedelta(days=5), self.today + timedelta(days=7)))
+
+    def test_map_follows_booking_changes(self):
+        get_map(self.car)
+        booking = make_booking(self.user, self.car, self.today + timedelta(days=5), days=3, status='confirmed')
+        self.assertFalse(is_range_free(self.car, self.today + timedelta(days=6), self.today + timedelta(days=6)))
+
+        booking.date_from += timedelta(days=10)
+        booking.date_to += timedelta(days=10)
+        booking.save()
+        self.assertTrue(is_range_free(self.car, self.today + timedelta(days=5), self.today + timedelta(days=7)))
+        self.assertFalse(is_range_free(self.car, self.today + timedelta(days=16), self.today + timedelta(days=16)))
+
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertTrue(is_range_free(self.car, self.today + timedelta(days=15), self.today + timedelta(days=17)))
+
+    def test_stale_map_is_shifted(self):
+        make_booking(self.user, self.car, self.today + timedelta(days=5), days=3, status='confirmed')
+        # За горизонтом карты, построенной 10 дней назад: попадает в нее только при досчете хвоста
+        tail = self.today + timedelta(days=HORIZON_DAYS - 3)
+        make_booking(self.user, self.car, tail, status='confirmed')
+        start_date = self.today - timedelta(days=10)
+        stale = CarAvailability(car=self.car, start_date=start_date)
+        stale.mask = range_mask(start_date, self.today + timedelta(days=5), self.today + timedelta(days=7))
+        stale.save()
+
+        car_map = get_map(self.car)
+        self.assertEqual(car_map.start_date, self.today)
+        self.assertEqual(car_map.next_booked_from, self.today + timedelta(days=5))
+        self.assertFalse(is_range_free(self.car, tail, tail))
+
+    def test_stale_map_does_not_overwrite_refresh(self):
+        start_date = self.today - timedelta(days=10)
+        CarAvailability.objects.create(car=self.car, start_date=start_date)
+        store = availability._store
+
+        def concurrent_refresh(*args):
+            # Бронирование подтверждено между чтением устаревшей карты и ее сохранением
+            booking, = Booking.objects.bulk_create([Booking(
+                user=self.user, car=self.car, date_from=self.day(5), date_to=self.day(7), status='confirmed'
+            )])
+            availability.refresh(self.car.pk, booking.date_from, booking.date_to)
+            return store(*args)
+
+        with mock.patch.object(availability, '_store', concurrent_refresh):
+            self.assertEqual(get_map(self.car).next_booked_from, self.day(5))
+        stored = CarAvailability.objects.get(car=self.car)
+        self.assertEqual((stored.start_date, stored.next_booked_from), (self.today, self.day(5)))
+
+    def test_next_free_date(self):
+        make_booking(self.user, self.car, self.day(0), days=2, status='confirmed')
+        make_booking(self.user, self.car, self.day(4), days=3, status='confirmed')
+        self.assertEqual(next_free_date(self.car), self.day(2))
+        # Окно в два дня между арендами есть, в три — только после второй аренды
+        self.assertEqual(next_free_date(self.car, days=2), self.day(2))
+        self.assertEqual(next_free_date(self.car, days=3), self.day(7))
+        self.assertEqual(next_free_date(self.car, after=self.day(5)), self.day(7))
+        self.assertEqual(next_free_date(self.car, after=self.day(-30)), self.day(2))
+        self.assertEqual(next_free_date(self.other), self.today)
+        # Свободный период не помещается в горизонт
+        self.assertIsNone(next_free_date(self.car, after=self.day(HORIZON_DAYS - 1), days=2))
+        self.assertIsNone(next_free_date(self.car, after=self.day(HORIZON_DAYS)))
+
+    def test_occupancy(self):
+        make_booking(self.user, self.car, self.day(1), days=2, status='confirmed')
+        make_booking(self.user, self.other, self.day(3), status='confirmed')
+        make_booking(self.user, self.other, self.day(0), days=5)
+        self.assertEqual(occupancy([self.car, self.other.pk], self.day(0), self.day(4)), {
+            self.car.pk: [False, True, True, False, False],
+            self.other.pk: [False, False, False, True, False],
+        })
+        self.assertEqual(occupancy([self.car], self.day(2), self.day(2)), {self.car.pk: [True]})
+
+    def test_catalog_date_filter(self):
+        make_booking(self.user, self.car, self.today + timedelta(days=5), days=3, status='confirmed')
+        make_booking(self.user, self.other, self.today + timedelta(days=5), days=3)
+
+        def catalog(date_from, date_to):
+            response = self.client.get(reverse('index'), {
+                'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(),
+            })
+            return {car.pk for car in response.context['cars']}
+
+        self.assertEqual(
+            catalog(self.today + timedelta(days=7), self.today + timedelta(days=9)), {self.other.pk}
+        )
+        self.assertEqual(
+            catalog(self.today + timedelta(days=8), self.today + timedelta(days=9)), {self.car.pk, self.other.pk}
+        )
+
+
+class KeysetPaginatorTest(TestCase):
+    """Курсорная пагинация: обход вперед и назад, подпись курсоров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Одинаковые цены: порядок внутри цены определяет первичный ключ
+        for i, price in enumerate([500, 300, 300, 300, 700, 100, 300]):
+            make_car(name=f'Car {i}', price=Decimal(price))
+
+    def paginator(self, *ordering):
+        return KeysetPaginator(Car.objects.all(), ordering, 3)
+
+    def walk(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def ids(self, page):
+        return [car.pk for car in page]
+
+    def test_forward(self):
+        for ordering, full_ordering in ((('price',), ('price', 'pk')), (('-price',), ('-price', '-pk'))):
+            with self.subTest(ordering=ordering):
+                pages = self.walk(self.paginator(*ordering))
+                expected = list(Car.objects.order_by(*full_ordering).values_list('pk', flat=True))
+                self.assertEqual([self.ids(page) for page in pages], [expected[:3], expected[3:6], expected[6:]])
+                self.assertFalse(pages[0].has_previous())
+                self.assertFalse(pages[-1].has_next())
+
+    def test_backward(self):
+        paginator = self.paginator('price')
+        pages = self.walk(paginator)
+        for i in range(len(pages) - 1, 0, -1):
+            previous = paginator.page(pages[i].previous_cursor)
+            self.assertEqual(self.ids(previous), self.ids(pages[i - 1]))
+            self.assertTrue(previous.has_next())
+        first = paginator.page(pages[1].previous_cursor)
+        self.assertFalse(first.has_previous())
+
+    def test_tampered_cursor_opens_first_page(self):
+        paginator = self.paginator('price')
+        first = paginator.page()
+        value, _, signature = first.next_cursor.rpartition(':')
+        for cursor in (value + ':' + signature[::-1], 'garbage', signing.dumps({'d': 'next', 'v': [1, 1]})):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.ids(paginator.page(cursor)), self.ids(first))
+
+    def test_cursor_of_other_ordering_opens_first_page(self):
+        for cursor_ordering, ordering in [
+            (('price', 'name'), ('price',)),
+            # То же число полей, другое направление или другие поля
+            (('price',), ('-price',)),
+            (('brand', 'name'), ('price', 'name')),
+            (('-name',), ('name',)),
+        ]:
+            with self.subTest(cursor_ordering=cursor_ordering, ordering=ordering):
+                cursor = self.paginator(*cursor_ordering).page().next_cursor
+                paginator = self.paginator(*ordering)
+                self.assertEqual(self.ids(paginator.page(cursor)), self.ids(paginator.page()))
+
+    def test_catalog_cursor_of_other_sort(self):
+        cache.clear()
+        cursor = self.client.get(reverse('index'), {'sort': 'price'}).context['cars'].next_cursor
+        self.assertIsNotNone(cursor)
+        first = self.client.get(reverse('index'), {'sort': '-price'}).context['cars']
+        replayed = self.client.get(reverse('index'), {'sort': '-price', 'cursor': cursor}).context['cars']
+        self.assertEqual(self.ids(replayed), self.ids(first))
+
+
+class RatingsTest(TestCase):
+    """Сумма и количество оценок машины меняются дельтами при правке отзывов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('client')
+        self.car = make_car()
+        past = date.today() - timedelta(days=30)
+        self.bookings = [
+            make_booking(self.user, self.car, past + timedelta(days=3 * i), status='confirmed') for i in range(3)
+        ]
+
+    def review(self, booking, rating, **fields):
+        return Review.objects.create(booking=booking, rating=rating, comment='Отлично', **fields)
+
+    def assertRating(self, rating_sum, total, average):
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.rating_sum, self.car.total_reviews), (rating_sum, total))
+        self.assertEqual(self.car.average_rating, Decimal(average))
+        self.assertEqual(find_drift(), [])
+
+    def test_create(self):
+        self.review(self.bookings[0], 5)
+        self.review(self.bookings[1], 4)
+        self.review(self.bookings[2], 4)
+        self.assertRating(13, 3, '4.33')
+
+    def test_edit(self):
+        review = self.review(self.bookings[0], 5)
+        self.review(self.bookings[1], 3)
+        review.rating = 4
+        review.save()
+        self.assertRating(7, 2, '3.50')
+        # Правка без смены оценки статистику не трогает
+        review.comment = 'Нормально'
+        review.save()
+        self.assertRating(7, 2, '3.50')
+        # Низкая оценка скрывает отзыв до модерации
+        review.rating = 2
+        review.save()
+        self.assertRating(3, 1, '3.00')
+
+    def test_hidden_review_is_not_counted(self):
+        review = self.review(self.bookings[0], 5)
+        self.review(self.bookings[1], 3, is_public=False)
+        self.assertRating(5, 1, '5.00')
+        review.is_public = False
+        review.save()
+        self.assertRating(0, 0, '0')
+        review.is_public = True
+        review.rating = 4
+        review.save()
+        self.assertRating(4, 1, '4.00')
+
+    def test_delete(self):
+        review = self.review(self.bookings[0], 5)
+        self.review(self.bookings[1], 3)
+        review.delete()
+        self.assertRating(3, 1, '3.00')
+        # Вместе с бронированием удаляется и его отзыв
+        self.bookings[1].delete()
+        self.assertRating(0, 0, '0')
+
+    def test_recommendations_follow_rating(self):
+        for i in range(8):
+            make_car(name=f'Car {i}', price=Decimal(280 + 5 * i))
+        review = self.review(self.bookings[0], 5)
+        self.assertEqual(*recommendations_and_rebuild())
+        self.assertTrue(CarRecommendation.objects.filter(recommended=self.car).exists())
+        review.rating = 3
+        review.save()
+        self.assertEqual(*recommendations_and_rebuild())
+        review.delete()
+        self.assertEqual(*recommendations_and_rebuild())
+
+    def test_reconcile(self):
+        self.review(self.bookings[0], 5)
+        self.review(self.bookings[1], 4)
+        Car.objects.filter(pk=self.car.pk).update(rating_sum=1, total_reviews=7)
+        self.assertEqual(find_drift(), [(self.car.pk, (1, 7), (9, 2))])
+        self.assertEqual(reconcile(), 1)
+        self.assertRating(9, 2, '4.50')
+
+
+class ReservationsTest(TestCase):
+    """Бронирование под блокировкой машины: пересечения с подтвержденными бронями не сохраняются"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client')
+        self.car = make_car()
+        rates.compile_all()
+        self.start = date.today() + timedelta(days=10)
+        self.confirmed = make_booking(self.user, self.car, self.start, days=5, status='confirmed')
+
+    def days(self, offset, days=1):
+        date_from = self.start + timedelta(days=offset)
+        return date_from, date_from + timedelta(days=days - 1)
+
+    def test_reserve_rejects_overlap(self):
+        for offset, days in ((-2, 3), (4, 3), (1, 2), (-1, 7)):
+            with self.subTest(offset=offset, days=days):
+                with self.assertRaises(BookingConflict) as raised:
+                    reservations.reserve(self.user, self.car, *self.days(offset, days))
+                self.assertEqual(raised.exception.booking_id, self.confirmed.pk)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_reserve_next_to_confirmed(self):
+        before = reservations.reserve(self.user, self.car, *self.days(-3, 3))
+        after = reservations.reserve(self.user, self.car, *self.days(5, 3))
+        self.assertEqual((before.status, after.status), ('pending', 'pending'))
+        self.assertEqual(before.price_snapshot['base_price'], '900.00')
+
+    def test_pending_bookings_may_overlap(self):
+        first = reservations.reserve(self.user, self.car, *self.days(10, 3))
+        second = reservations.reserve(self.user, self.car, *self.days(11, 3))
+        reservations.confirm(first)
+        with self.assertRaises(BookingConflict) as raised:
+            reservations.confirm(second)
+        self.assertEqual(raised.exception.booking_id, first.pk)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'pending')
+
+    def test_confirm(self):
+        booking = reservations.reserve(self.user, self.car, *self.days(10, 3))
+        self.assertEqual(reservations.confirm(booking).status, 'confirmed')
+        # Повторное подтверждение не конфликтует с самим собой
+        self.assertEqual(reservations.confirm(booking).status, 'confirmed')
+        self.assertFalse(is_range_free(self.car, *self.days(10, 3)))
+
+    def test_save_excludes_booking_itself(self):
+        self.confirmed.date_to += timedelta(days=2)
+        reservations.save(self.confirmed)
+        self.confirmed.refresh_from_db()
+        self.assertEqual(self.confirmed.date_to, self.start + timedelta(days=6))
+        self.assertEqual(self.confirmed.price_snapshot['base_price'], '2100.00')
+
+    def test_save_rejects_move_onto_confirmed(self):
+        booking = reservations.reserve(self.user, self.car, *self.days(10, 3))
+        reservations.confirm(booking)
+        booking.refresh_from_db()
+        booking.date_from, booking.date_to = self.days(3, 3)
+        with self.assertRaises(BookingConflict):
+            reservations.save(booking)
+        booking.refresh_from_db()
+        self.assertEqual((booking.date_from, booking.date_to), self.days(10, 3))
+
+    def test_cancelled_booking_is_not_checked(self):
+        booking = Booking(user=self.user, car=self.car, date_from=self.start, date_to=self.start, status='cancelled')
+        reservations.save(booking)
+        self.assertIsNotNone(booking.pk)
+
+    def test_required_services(self):
+        required = CarService.objects.create(
+            car=self.car, service=Service.objects.create(name='Страховка'), price=Decimal('50.00'), is_required=True
+        )
+        optional = CarService.objects.create(
+            car=self.car, service=Service.objects.create(name='Детское кресло'), price=Decimal('20.00')
+        )
+        booking = reservations.reserve(self.user, self.car, *self.days(10, 3))
+        self.assertEqual(set(booking.services.all()), {required})
+        self.assertEqual(booking.price_snapshot['services_total'], '150.00')
+
+        reservations.save(booking, [optional.service_id])
+        self.assertEqual(set(booking.services.all()), {required, optional})
+        self.assertEqual([line['name'] for line in booking.price_snapshot['services']], ['Страховка', 'Детское кресло'])
+        self.assertEqual(booking.price_snapshot['services_total'], '210.00')
+        self.assertEqual(booking.total_amount, Decimal(booking.price_snapshot['total']))
+
+
+class AutoConfirmTest(TestCase):
+    """Пакетное подтверждение: из пересекающихся ожидающих броней побеждает приоритетная"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client')
+        self.car = make_car()
+        self.other = make_car(name='Corolla')
+        rates.compile_all()
+        self.start = date.today() + timedelta(days=10)
+
+    def reserve(self, offset, days, car=None, services=()):
+        date_from = self.start + timedelta(days=offset)
+        return reservations.reserve(
+            self.user, car or self.car, date_from, date_from + timedelta(days=days - 1), services
+        ).pk
+
+    def statuses(self):
+        return dict(Booking.objects.values_list('pk', 'status'))
+
+    def assertResult(self, result, confirmed, cancelled):
+        self.assertEqual(sorted(result['confirmed']), sorted(confirmed))
+        self.assertEqual(sorted(result['cancelled']), sorted(cancelled))
+        statuses = self.statuses()
+        self.assertEqual({pk: statuses[pk] for pk in confirmed}, {pk: 'confirmed' for pk in confirmed})
+        self.assertEqual({pk: statuses[pk] for pk in cancelled}, {pk: 'cancelled' for pk in cancelled})
+
+    def test_fifo(self):
+        first = self.reserve(0, 5)
+        longer = self.reserve(2, 9)
+        separate = self.reserve(12, 2)
+        self.assertResult(reservations.auto_confirm(), [first, separate], [longer])
+
+    def test_longest(self):
+        first = self.reserve(0, 5)
+        longer = self.reserve(2, 9)
+        separate = self.reserve(12, 2)
+        self.assertResult(reservations.auto_confirm(priority='longest'), [longer, separate], [first])
+
+    def test_revenue(self):
+        chauffeur = CarService.objects.create(
+            car=self.car, service=Service.objects.create(name='Водитель'), price=Decimal('1000.00')
+        )
+        longer = self.reserve(0, 4)
+        expensive = self.reserve(1, 3, services=[chauffeur.service_id])
+        self.assertResult(reservations.auto_confirm(priority='revenue'), [expensive], [longer])
+
+    def test_chain_of_overlaps(self):
+        # Первая и третья не пересекаются между собой, но попадают в одну группу через вторую
+        first = self.reserve(0, 3)
+        middle = self.reserve(2, 3)
+        last = self.reserve(4, 3)
+        self.assertResult(reservations.auto_confirm(), [first, last], [middle])
+
+    def test_confirmed_booking_is_an_obstacle(self):
+        blocked = self.reserve(6, 3)
+        # Пересекается только с заблокированной заявкой, поэтому свободна
+        after = self.reserve(8, 3)
+        before = self.reserve(0, 5)
+        # Подтверждена после подачи заявок
+        make_booking(self.user, self.car, self.start + timedelta(days=5), days=2, status='confirmed')
+        self.assertResult(reservations.auto_confirm(priority='longest'), [before, after], [blocked])
+        self.assertFalse(is_range_free(self.car, self.start + timedelta(days=9), self.start + timedelta(days=9)))
+
+    def test_scope(self):
+        own = self.reserve(0, 3)
+        other = self.reserve(0, 3, car=self.other)
+        past = make_booking(self.user, self.car, date.today() - timedelta(days=5)).pk
+        self.assertResult(reservations.auto_confirm(car_ids=[self.car.pk]), [own], [])
+        self.assertEqual(self.statuses()[other], 'pending')
+        self.assertEqual(self.statuses()[past], 'pending')
+
+    def test_dry_run(self):
+        first = self.reserve(0, 5)
+        second = self.reserve(2, 5)
+        result = reservations.auto_confirm(dry_run=True)
+        self.assertEqual(result, {'confirmed': [first], 'cancelled': [second]})
+        self.assertEqual(set(self.statuses().values()), {'pending'})
+
+    def test_unknown_priority(self):
+        with self.assertRaises(ValueError):
+            reservations.auto_confirm(priority='random')
+
+
+class SearchTest(TestCase):
+    """Поиск по префиксам слов: кириллица, «ё», ранжирование, переиндексация сигналами"""
+
+    def setUp(self):
+        cache.clear()
+        self.mercedes = make_car(brand='Мерседес', name='Е-класс', type='Седан')
+        self.coupe = make_car(brand='Мерседесы', name='Ёлка', type='Купе')
+        self.mazda = make_car(brand='Мазда', name='6', type='Седан')
+
+    def found(self, query):
+        return [car_id for car_id, _ in search.search(query)]
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize('Мерседес-Бенц ЁЛКА, 6 x5'), ['мерседес', 'бенц', 'елка', 'x5'])
+        self.assertEqual(search.tokenize(None), [])
+
+    def test_prefix(self):
+        self.assertEqual(set(self.found('мерс')), {self.mercedes.pk, self.coupe.pk})
+        self.assertEqual(self.found('МАЗ'), [self.mazda.pk])
+        self.assertEqual(self.found('ма'), [self.mazda.pk])
+        self.assertEqual(self.found('ауди'), [])
+        # Слишком короткий запрос не ищется
+        self.assertIsNone(search.matches('м'))
+
+    def test_yo(self):
+        self.assertEqual(self.found('елка'), [self.coupe.pk])
+        self.assertEqual(self.found('Ёлк'), [self.coupe.pk])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.found('мерс седан'), [self.mercedes.pk])
+        self.assertEqual(self.found('мерс купе'), [self.coupe.pk])
+        self.assertEqual(self.found('мазда купе'), [])
+
+    def test_exact_match_ranks_higher(self):
+        self.assertEqual(search.search('мерседес'), [(self.mercedes.pk, 16), (self.coupe.pk, 8)])
+        self.assertEqual(search.search('мерседесы'), [(self.coupe.pk, 16)])
+
+    def test_reviews(self):
+        user = User.objects.create_user('client')
+        booking = make_booking(user, self.mazda, date.today() - timedelta(days=10), status='confirmed')
+        review = Review.objects.create(booking=booking, rating=5, comment='Отличный кабриолет для поездки')
+        self.assertEqual(search.search('кабриолет'), [(self.mazda.pk, 2)])
+        # Слово из отзыва весит меньше слова из названия машины
+        self.assertEqual(self.found('седан'), [self.mercedes.pk, self.mazda.pk])
+        Review.objects.create(
+            booking=make_booking(user, self.mercedes, date.today() - timedelta(days=20), status='confirmed'),
+            rating=5, comment='Седан, седан и еще раз седан',
+        )
+        self.assertEqual(search.search('седан'), [(self.mercedes.pk, 10), (self.mazda.pk, 8)])
+
+        review.is_public = False
+        review.save()
+        self.assertEqual(self.found('кабриолет'), [])
+        review.is_public = True
+        review.save()
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.found('кабриолет'), [])
+
+    def test_car_changes_reindex(self):
+        self.mazda.brand = 'Мерседес'
+        self.mazda.save()
+        self.assertEqual(self.found('мазда'), [])
+        self.assertEqual(self.found('мерседес'), [self.mercedes.pk, self.mazda.pk, self.coupe.pk])
+        mazda_pk = self.mazda.pk
+        self.mazda.delete()
+        self.assertNotIn(mazda_pk, self.found('мерседес'))
+
+    def test_rebuild(self):
+        SearchTerm.objects.all().delete()
+        self.assertEqual(self.found('мерс'), [])
+        self.assertEqual(search.rebuild()[0], 3)
+        self.assertEqual(set(self.found('мерс')), {self.mercedes.pk, self.coupe.pk})
+
+    def test_catalog(self):
+        response = self.client.get(reverse('index'), {'q': 'мерс седан'})
+        self.assertEqual([car.pk for car in response.context['cars']], [self.mercedes.pk])
+        # Префикс бренда и точное совпадение типа кузова
+        self.assertEqual(response.context['cars'][0].search_rank, 8 + 4 * 2)
+
+
+class QuoteApiTest(TestCase):
+    """API стоимости: длина и конец периода ограничены, как при бронировании"""
+
+    def setUp(self):
+        cache.clear()
+        self.car = make_car()
+        self.start = date.today() + timedelta(days=10)
+
+    def get(self, *ranges):
+        return self.client.get(reverse('quote'), {
+            'car': [self.car.pk], 'range': [f'{date_from}:{date_to}' for date_from, date_to in ranges],
+        })
+
+    def test_quote(self):
+        response = self.get((self.start, self.start + timedelta(days=MAX_RENTAL_DAYS - 1)))
+        self.assertEqual(response.status_code, 200)
+        quote, = response.json()['quotes']
+        self.assertEqual(quote['days'], MAX_RENTAL_DAYS)
+        self.assertEqual(quote['base_price'], f'{300 * MAX_RENTAL_DAYS}.00')
+
+    def test_rejects_long_ranges(self):
+        last_day = date.today() + timedelta(days=HORIZON_DAYS - 1)
+        for date_from, date_to in [
+            (self.start, self.start + timedelta(days=MAX_RENTAL_DAYS)),
+            (date(2000, 1, 1), date(2099, 12, 31)),
+            (date(1, 1, 1), date(9999, 12, 31)),
+            (last_day, last_day + timedelta(days=1)),
+        ]:
+            with self.subTest(date_from=date_from, date_to=date_to):
+                response = self.get((self.start, self.start), (date_from, date_to))
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class FailingBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise SMTPException('451 Temporary failure')
+
+
+class UnavailableBackend(locmem.EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+@override_settings(ADMINS=[('Администратор', 'admin@example.com')])
+class OutboxTest(TestCase):
+    """Уведомления об отзывах: очередь OutboxEmail в транзакции отзыва и доставка с повторами"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('client')
+        self.booking = make_booking(self.user, make_car(), date.today() - timedelta(days=10), status='confirmed')
+
+    def review(self):
+        return Review.objects.create(booking=self.booking, rating=5, comment='Отлично')
+
+    def test_new_review_is_queued(self):
+        review = self.review()
+        email, = OutboxEmail.objects.all()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.recipients, ['admin@example.com'])
+        self.assertIn('Отлично', email.body)
+        # Правка отзыва писем не добавляет
+        review.comment = 'Хорошо'
+        review.save()
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_rolled_back_review_is_not_queued(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.review()
+            self.assertEqual(OutboxEmail.objects.count(), 1)
+            # Второй отзыв на то же бронирование откатывает всю транзакцию
+            self.review()
+        self.assertFalse(Review.objects.exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    @override_settings(ADMINS=[])
+    def test_no_recipients(self):
+        self.review()
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def deliver(self, now, backend=None):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            return outbox.deliver_pending(connection=backend)
+
+    def test_deliver(self):
+        self.review()
+        self.assertEqual(outbox.deliver_pending(), (1, 0))
+        message, = mail.outbox
+        self.assertEqual(message.to, ['admin@example.com'])
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('sent', 1))
+        self.assertEqual(outbox.deliver_pending(), (0, 0))
+
+    def test_sends_outside_claim(self):
+        self.review()
+        statuses = []
+
+        class RecordingBackend(locmem.EmailBackend):
+            def send_messages(self, messages):
+                statuses.append(OutboxEmail.objects.get().status)
+                return super().send_messages(messages)
+
+        self.assertEqual(outbox.deliver_pending(connection=RecordingBackend()), (1, 0))
+        self.assertEqual(statuses, ['sending'])
+
+    def test_retry_with_backoff(self):
+        self.review()
+        now = timezone.now()
+        for attempt in range(1, outbox.MAX_ATTEMPTS):
+            self.assertEqual(self.deliver(now, FailingBackend()), (0, 1))
+            email = OutboxEmail.objects.get()
+            self.assertEqual((email.status, email.attempts), ('pending', attempt))
+            self.assertEqual(email.next_attempt_at, now + outbox.retry_delay(attempt))
+            self.assertIn('SMTPException', email.last_error)
+            # До истечения задержки письмо не отправляется
+            self.assertEqual(self.deliver(email.next_attempt_at - timedelta(seconds=1)), (0, 0))
+            now = email.next_attempt_at
+        self.assertEqual(outbox.retry_delay(4), timedelta(minutes=8))
+
+        self.assertEqual(self.deliver(now, FailingBackend()), (0, 1))
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('failed', outbox.MAX_ATTEMPTS))
+        self.assertEqual(self.deliver(now + timedelta(days=30)), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_server_unavailable(self):
+        self.review()
+        Review.objects.create(
+            booking=make_booking(self.user, self.booking.car, date.today() - timedelta(days=20), status='confirmed'),
+            rating=4, comment='Хорошо',
+        )
+        now = timezone.now()
+        self.assertEqual(self.deliver(now, UnavailableBackend()), (0, 2))
+        self.assertEqual(
+            set(OutboxEmail.objects.values_list('status', 'attempts', 'next_attempt_at')),
+            {('pending', 1, now + outbox.BASE_DELAY)},
+        )
+        self.assertEqual(self.deliver(now + outbox.BASE_DELAY), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_abandoned_claim_is_retried(self):
+        self.review()
+        now = timezone.now()
+        # Воркер забрал письмо и упал, не записав результат
+        OutboxEmail.objects.update(status='sending', next_attempt_at=now + outbox.SENDING_TIMEOUT)
+        self.assertEqual(self.deliver(now), (0, 0))
+        self.assertEqual(self.deliver(now + outbox.SENDING_TIMEOUT), (1, 0))
+        self.assertEqual(OutboxEmail.objects.get().status, 'sent')
+
+
+class RecommendationsTest(TestCase):
+    """Инкрементальный пересчет похожих машин дает те же списки, что и полный"""
+
+    def setUp(self):
+        self.cars = [
+            make_car(name=f'Car {i}', brand=brand, type=car_type, price=Decimal(price))
+            for i, (brand, car_type, price) in enumerate([
+                ('Toyota', 'Седан', 300), ('Toyota', 'Седан', 320), ('Toyota', 'Кроссовер', 450),
+                ('BMW', 'Седан', 900), ('BMW', 'Кроссовер', 1100), ('BMW', 'Купе', 1500),
+                ('Kia', 'Седан', 250), ('Kia', 'Хэтчбек', 200), ('Mercedes', 'Седан', 1000),
+                ('Mercedes', 'Купе', 1600), ('Audi', 'Седан', 950), ('Audi', 'Кроссовер', 1200),
+            ])
+        ]
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(*recommendations_and_rebuild())
+
+    def test_created(self):
+        self.assertMatchesRebuild()
+        self.assertEqual(
+            CarRecommendation.objects.filter(car=self.cars[0]).count(), recommendations.TOP_N
+        )
+
+    def test_changes(self):
+        changes = [
+            ('price', Decimal('1550')), ('type', 'Купе'), ('brand', 'Kia'), ('is_available', False),
+            ('is_available', True), ('price', Decimal('0')),
+        ]
+        for i, (field, value) in enumerate(changes):
+            with self.subTest(field=field, value=value):
+                car = self.cars[i * 2 % len(self.cars)]
+                setattr(car, field, value)
+                car.save()
+                self.assertMatchesRebuild()
+
+    def test_deleted(self):
+        self.cars[3].delete()
+        self.assertMatchesRebuild()
+        self.assertFalse(CarRecommendation.objects.filter(recommended_id=self.cars[3].pk).exists())
+
+    def test_unrelated_lists_are_not_rewritten(self):
+        recommendations.rebuild()
+        untouched = CarRecommendation.objects.filter(car=self.cars[9]).values_list('pk', flat=True)
+        before = set(untouched)
+        # Дешевая машина другого бренда и кузова не проходит в список дорогого купе
+        self.cars[7].price = Decimal('210')
+        self.cars[7].save()
+        self.assertEqual(set(untouched), before)
+        self.assertMatchesRebuild()
+
+    def test_queries_do_not_grow_with_fleet(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                recommendations.refresh_for_car(self.cars[0].pk)
+            return len(captured)
+
+        before = queries()
+        for i in range(30):
+            make_car(name=f'Extra {i}', brand='Lada', type='Пикап', price=Decimal(100 + i))
+        self.assertEqual(queries(), before)
+
+
+class RatesTest(TestCase):
+    """Скомпилированные таблицы цен и скидок"""
+
+    def setUp(self):
+        cache.clear()
+        self.car = make_car()
+        rates.compile_all()
+        self.today = date.today()
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def next_weekday(self, weekday, after=0):
+        offset = after + (weekday - self.day(after).weekday()) % 7
+        return self.day(offset)
+
+    def make_rules(self):
+        PricingRule.objects.create(name='Выходные', brand='Toyota', weekdays='56', multiplier=Decimal('1.50'))
+        PricingRule.objects.create(
+            name='Сезон', car=self.car, date_from=self.day(10), date_to=self.day(availability.HORIZON_DAYS + 20),
+            multiplier=Decimal('1.20'),
+        )
+        PricingRule.objects.create(name='Кроссоверы', car_type='Кроссовер', multiplier=Decimal('2.00'))
+
+    def test_weekday_and_date_rules(self):
+        self.make_rules()
+        monday = self.next_weekday(0)
+        saturday = self.next_weekday(5)
+        self.assertEqual(rates.base_price(self.car.pk, monday, monday), Decimal('300.00'))
+        self.assertEqual(rates.base_price(self.car.pk, saturday, saturday), Decimal('450.00'))
+        season_monday = self.next_weekday(0, after=10)
+        season_sunday = self.next_weekday(6, after=10)
+        self.assertEqual(rates.base_price(self.car.pk, season_monday, season_monday), Decimal('360.00'))
+        self.assertEqual(rates.base_price(self.car.pk, season_sunday, season_sunday), Decimal('540.00'))
+        # Правило другого типа кузова и другого бренда машины не касается
+        other = make_car(brand='Kia')
+        self.assertEqual(rates.base_price(other.pk, saturday, saturday), Decimal('300.00'))
+        suv = make_car(brand='Kia', type='Кроссовер')
+        self.assertEqual(rates.base_price(suv.pk, monday, monday), Decimal('600.00'))
+        # Неактивное правило не применяется
+        PricingRule.objects.filter(name='Выходные').update(is_active=False)
+        rates.compile_all()
+        season_saturday = self.next_weekday(5, after=10)
+        self.assertEqual(rates.base_price(self.car.pk, season_saturday, season_saturday), Decimal('360.00'))
+
+    def test_prefix_sums_match_daily_evaluation(self):
+        self.make_rules()
+        for offset in (0, 3, 9, 10, 40, availability.HORIZON_DAYS - 31):
+            for days in (1, 2, 7, 30):
+                date_from, date_to = self.day(offset), self.day(offset + days - 1)
+                self.assertEqual(
+                    rates.base_price(self.car.pk, date_from, date_to),
+                    rates.evaluate_base_price(self.car.pk, date_from, date_to),
+                )
+
+    def test_horizon_boundary(self):
+        self.make_rules()
+        last = self.day(availability.HORIZON_DAYS - 1)
+        tables = rates._sync()
+        row = tables.rows[self.car.pk]
+        with mock.patch.object(rates, '_evaluate', wraps=rates._evaluate) as evaluate:
+            # Последний день горизонта — по префиксным суммам
+            inside = rates.base_price(self.car.pk, last - timedelta(days=6), last)
+            evaluate.assert_not_called()
+            # Период, выходящий за горизонт (или начинающийся до сегодняшнего дня), — посуточно
+            crossing = rates.base_price(self.car.pk, last - timedelta(days=6), last + timedelta(days=1))
+            outside = rates.base_price(self.car.pk, last + timedelta(days=1), last + timedelta(days=7))
+            past = rates.base_price(self.car.pk, self.day(-1), self.day(5))
+            self.assertEqual(evaluate.call_count, 3)
+        self.assertEqual(inside, Decimal(rates._evaluate(row, last - timedelta(days=6), last)).scaleb(-2))
+        self.assertEqual(crossing - inside, rates.evaluate_base_price(self.car.pk, last + timedelta(days=1), last + timedelta(days=1)))
+        self.assertEqual(outside, rates.evaluate_base_price(self.car.pk, last + timedelta(days=1), last + timedelta(days=7)))
+        self.assertEqual(past, rates.evaluate_base_price(self.car.pk, self.day(-1), self.day(5)))
+        # Сезонное правило действует и за горизонтом: неделя с выходными дороже 7 * 360
+        self.assertGreater(outside, Decimal('2520.00'))
+
+    def test_discount_tiers(self):
+        DiscountTier.objects.all().delete()
+        self.assertEqual(rates.discount_percentage(30), 0)
+        DiscountTier.objects.create(min_days=3, percentage=5)
+        DiscountTier.objects.create(min_days=7, percentage=10)
+        DiscountTier.objects.create(brand='Toyota', min_days=5, percentage=15)
+        self.assertEqual(
+            [rates.discount_percentage(days) for days in (0, 1, 2, 3, 6, 7, 90, 1000)],
+            [0, 0, 0, 5, 5, 10, 10, 10],
+        )
+        self.assertEqual([rates.discount_percentage(days, 'Toyota') for days in (4, 5, 1000)], [0, 15, 15])
+        # Бренд без своей таблицы — общая
+        self.assertEqual(rates.discount_percentage(7, 'Kia'), 10)
+        self.assertEqual(rates.discount_steps(), [(3, 5), (7, 10)])
+        self.assertEqual(rates.discount_steps('Toyota'), [(5, 15)])
+        self.assertEqual(rates.discount_steps('Kia'), [(3, 5), (7, 10)])
+
+    def test_incremental_sync(self):
+        other = make_car(brand='Kia')
+        monday = self.next_weekday(0)
+        self.assertEqual(rates.base_price(other.pk, monday, monday), Decimal('300.00'))
+        published = rates._tables
+        other_row = published.rows[other.pk]
+        rule = PricingRule.objects.create(name='Toyota', brand='Toyota', multiplier=Decimal('1.10'))
+        self.assertEqual(rates.base_price(self.car.pk, monday, monday), Decimal('330.00'))
+        # Пересобрана только строка машины под правилом
+        self.assertIs(rates._tables.rows[other.pk], other_row)
+        self.assertEqual(published.rows[self.car.pk].prefix[1], 30000)
+        rule.brand = 'Kia'
+        rule.save()
+        self.assertEqual(rates.base_price(self.car.pk, monday, monday), Decimal('300.00'))
+        self.assertEqual(rates.base_price(other.pk, monday, monday), Decimal('330.00'))
+        self.car.price = Decimal('400.00')
+        self.car.save()
+        self.assertEqual(rates.base_price(self.car.pk, monday, monday), Decimal('400.00'))
+        car_id = self.car.pk
+        self.car.delete()
+        self.assertNotIn(car_id, rates._sync().rows)
+        self.assertIsNone(rates.base_price(car_id, monday, monday))
+
+    def test_new_car_does_not_modify_published_tables(self):
+        published = rates._tables
+        rows = dict(published.rows)
+        # Без сигналов: машины нет в таблицах, версия не менялась
+        car, = Car.objects.bulk_create([Car(name='Rio', brand='Kia', type='Седан', price=Decimal('150.00'))])
+        self.assertEqual(rates.base_price(car.pk, self.today, self.today + timedelta(days=1)), Decimal('300.00'))
+        self.assertEqual(published.rows, rows)
+        self.assertIsNot(rates._tables, published)
+        self.assertIn(car.pk, rates._tables.rows)
+        self.assertIsNone(rates.base_price(car.pk + 1000, self.today, self.today))
+
+    def test_version_survives_eviction(self):
+        self.assertEqual(rates.base_price(self.car.pk, self.today, self.today), Decimal('300.00'))
+        versions = {caching.get_version(rates.NAMESPACE)}
+        for price in ('400.00', '500.00'):
+            # Счетчик версий вытеснен из кэша, затем цену меняют без сигналов Car
+            cache.delete(caching._version_key(rates.NAMESPACE))
+            Car.objects.filter(pk=self.car.pk).update(price=Decimal(price))
+            rates.cars_changed([self.car.pk])
+            versions.add(caching.get_version(rates.NAMESPACE))
+            self.assertEqual(rates.base_price(self.car.pk, self.today, self.today), Decimal(price))
+        self.assertEqual(len(versions), 3)
+
+
+class BookingAdminTest(TestCase):
+    """Сохранение бронирования в админке"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+        self.car = make_car()
+        self.start = date.today() + timedelta(days=5)
+        self.confirmed = make_booking(self.admin, self.car, self.start, days=3, status='confirmed')
+
+    def post(self, url, date_from, status='pending'):
+        # Предварительная проверка формы пропускает конфликт, как при гонке с подтверждением
+        with mock.patch.object(reservations, 'find_conflict', side_effect=[None, self.confirmed.pk]):
+            return self.client.post(url, {
+                'user': self.admin.pk, 'car': self.car.pk, 'status': status,
+                'date_from': date_from, 'date_to': date_from + timedelta(days=1),
+            })
+
+    def test_conflict_on_add_is_reported(self):
+        url = reverse('admin:rental_booking_add')
+        response = self.post(url, self.start + timedelta(days=1))
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(Booking.objects.count(), 1)
+        page = self.client.get(url)
+        self.assertContains(page, f'пересекается с подтвержденным бронированием #{self.confirmed.pk}')
+
+    def test_conflict_on_change_keeps_booking(self):
+        booking = make_booking(self.admin, self.car, self.start + timedelta(days=10))
+        url = reverse('admin:rental_booking_change', args=[booking.pk])
+        response = self.post(url, self.start)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        booking.refresh_from_db()
+        self.assertEqual(booking.date_from, self.start + timedelta(days=10))
+
+
+class ThumbnailsTest(MediaRootMixin, TestCase):
+    """Копии фотографий: кодирование при загрузке, поиск готовых при показе"""
+
+    def test_renditions_created_on_upload(self):
+        car = make_car(image=make_image())
+        renditions = thumbnails.get_renditions(car.image)
+        self.assertEqual((renditions['width'], renditions['height']), (1200, 800))
+        self.assertEqual([width for width, _ in renditions['webp']], [320, 640, 1024])
+        self.assertEqual([width for width, _ in renditions['jpeg']], [320, 640, 1024])
+        for _, name in renditions['webp'] + renditions['jpeg']:
+            self.assertTrue(default_storage.exists(name))
+        with default_storage.open(renditions['webp'][0][1]) as rendition:
+            self.assertEqual(Image.open(rendition).size, (320, 213))
+
+    def test_small_original_is_not_upscaled(self):
+        car = make_car(image=make_image(200, 100))
+        renditions = thumbnails.get_renditions(car.image)
+        self.assertEqual([width for width, _ in renditions['jpeg']], [200])
+
+    def test_cache_miss_finds_files_without_encoding(self):
+        car = make_car(image=make_image())
+        renditions = thumbnails.get_renditions(car.image)
+        cache.clear()
+        with mock.patch.object(thumbnails, '_encode') as encode:
+            self.assertEqual(thumbnails.get_renditions(car.image), renditions)
+            encode.assert_not_called()
+
+    def test_page_request_serves_original_until_built(self):
+        car = make_car(image=make_image())
+        thumbnails.delete_renditions(car.image)
+        with mock.patch.object(thumbnails, '_encode') as encode:
+            self.assertIsNone(thumbnails.get_renditions(car.image))
+            self.assertIsNone(thumbnails.get_renditions(car.image))
+            encode.assert_not_called()
+        self.assertIn(f'<img src="{car.image.url}"', custom_tags.car_picture(car))
+
+        call_command('build_thumbnails', stdout=StringIO())
+        renditions = thumbnails.get_renditions(car.image)
+        self.assertEqual([width for width, _ in renditions['webp']], [320, 640, 1024])
+        self.assertIn('<picture>', custom_tags.car_picture(car))
+
+    def test_not_an_image(self):
+        car = make_car(image=SimpleUploadedFile('photo.jpg', b'not an image'))
+        self.assertTrue(car.image)
+        self.assertIsNone(thumbnails.get_renditions(car.image))
+
+
+class ExportTest(TestCase):
+    """Выгрузка бронирований CSV/JSONL пачками"""
+
+    SNAPSHOT = {
+        'days': 2, 'daily_rate': '300.00', 'base_price': '600.00',
+        'services': [{'service': 1, 'name': 'Детское кресло', 'price': '50.00'}],
+        'services_total': '100.00', 'discount_percentage': 5, 'discount_amount': '35.00', 'total': '665.00',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', email='client@example.com', password='secret')
+        cls.car = make_car()
+        start = date(2026, 7, 1)
+        cls.bookings = [
+            make_booking(cls.user, cls.car, start + timedelta(days=3 * i), days=2, status='confirmed',
+                         price_snapshot=dict(cls.SNAPSHOT))
+            for i in range(5)
+        ]
+        Review.objects.create(booking=cls.bookings[0], rating=5, comment='Отлично')
+        # Запись в обход reservations — без расчета
+        cls.raw, = Booking.objects.bulk_create([
+            Booking(user=cls.user, car=cls.car, date_from=start + timedelta(days=30),
+                    date_to=start + timedelta(days=31), status='pending')
+        ])
+
+    def collect(self, lines, chunk_size):
+        # Пачка — один запрос, пересчета по строкам нет
+        chunks = -(-Booking.objects.count() // chunk_size)
+        with self.assertNumQueries(chunks + 1):
+            return list(lines(Booking.objects.all(), chunk_size))
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in ''.join(self.collect(exports.jsonl_lines, 2)).splitlines()]
+        self.assertEqual([row['id'] for row in rows], sorted(booking.pk for booking in Booking.objects.all()))
+        first = rows[0]
+        self.assertEqual(first['email'], 'client@example.com')
+        self.assertEqual(first['car'], 'Toyota Camry')
+        self.assertEqual((first['date_from'], first['date_to']), ('2026-07-01', '2026-07-02'))
+        self.assertEqual(first['services'], [{'name': 'Детское кресло', 'price': '50.00'}])
+        self.assertEqual((first['days'], first['total'], first['rating']), (2, '665.00', 5))
+        self.assertIsNone(rows[1]['rating'])
+        raw = rows[-1]
+        self.assertEqual(raw['id'], self.raw.pk)
+        self.assertIsNone(raw['total'])
+        self.assertEqual(raw['services'], [])
+
+    def test_csv(self):
+        content = ''.join(self.collect(exports.csv_lines, 4))
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(rows[0], [title for _, title in exports.COLUMNS])
+        self.assertEqual(len(rows), 1 + len(self.bookings) + 1)
+        first = dict(zip([key for key, _ in exports.COLUMNS], rows[1]))
+        self.assertEqual(first['services'], 'Детское кресло 50.00')
+        self.assertEqual((first['discount_percentage'], first['total'], first['rating']), ('5', '665.00', '5'))
+
+    def test_admin_action_streams(self):
+        admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:rental_booking_changelist'), {
+            'action': 'export_jsonl', '_selected_action': [booking.pk for booking in self.bookings[:2]],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="bookings-', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [booking.pk for booking in self.bookings[:2]])
+
+
+class MediaStorageTest(MediaRootMixin, TestCase):
+    """Хранилище фото по хэшу содержимого, счетчик ссылок и collect_media"""
+
+    def blob(self, name):
+        return MediaBlob.objects.get(name=name)
+
+    def collect(self, *args):
+        call_command('collect_media', '--grace-hours', '0', *args, stdout=StringIO())
+
+    def test_same_content_shares_one_file(self):
+        first = make_car(image=make_image(name='one.jpg'))
+        second = make_car(image=make_image(name='two.jpg'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^cars/([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$')
+        with first.image.open('rb') as image:
+            self.assertEqual(storage.digest_of(first.image.name), hashlib.sha256(image.read()).hexdigest())
+        self.assertEqual(self.blob(first.image.name).refcount, 2)
+        _, files = first.image.storage.listdir(first.image.name.rsplit('/', 1)[0])
+        self.assertEqual(files, [first.image.name.rsplit('/', 1)[1]])
+
+    def test_normalized_before_hashing(self):
+        car = make_car(image=make_image(3000, 1500, image_format='PNG', name='big.png'))
+        self.assertTrue(car.image.name.endswith('.png'))
+        with car.image.open('rb') as image:
+            self.assertEqual(Image.open(image).size, (2560, 1280))
+        # Не изображение сохраняется как есть, с исходным расширением
+        other = make_car(image=SimpleUploadedFile('manual.pdf', b'%PDF-1.4'))
+        self.assertTrue(other.image.name.endswith('.pdf'))
+        self.assertEqual(self.blob(other.image.name).size, 8)
+
+    def test_refcount_follows_cars(self):
+        car = make_car(image=make_image())
+        old = car.image.name
+        car.image = make_image(color='red')
+        car.save()
+        self.assertNotEqual(car.image.name, old)
+        self.assertEqual(self.blob(old).refcount, 0)
+        self.assertEqual(self.blob(car.image.name).refcount, 1)
+        new = car.image.name
+        car.delete()
+        self.assertEqual(self.blob(new).refcount, 0)
+
+    def test_collect_media_removes_unreferenced(self):
+        kept = make_car(image=make_image())
+        replaced = make_car(image=make_image(color='red'))
+        unused = replaced.image.name
+        field_storage = replaced.image.storage
+        renditions = thumbnails.get_renditions(replaced.image)
+        replaced.image = None
+        replaced.save()
+
+        self.collect('--dry-run')
+        self.assertTrue(field_storage.exists(unused))
+        self.collect()
+        self.assertFalse(field_storage.exists(unused))
+        self.assertFalse(MediaBlob.objects.filter(name=unused).exists())
+        for _, name in renditions['webp'] + renditions['jpeg']:
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(field_storage.exists(kept.image.name))
+        self.assertEqual(self.blob(kept.image.name).refcount, 1)
+
+    def test_grace_period_and_drifted_counter(self):
+        car = make_car(image=make_image())
+        # Счетчик разошелся: машина ссылается на файл, а ссылок 0
+        MediaBlob.objects.filter(name=car.image.name).update(refcount=0)
+        self.collect()
+        self.assertTrue(car.image.storage.exists(car.image.name))
+        self.collect('--recount')
+        self.assertEqual(self.blob(car.image.name).refcount, 1)
+
+        # Только что загруженный, еще не привязанный файл не удаляется до истечения срока
+        name = car.image.storage.save('cars/fresh.jpg', make_image(color='green'))
+        self.assertEqual(self.blob(name).refcount, 0)
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(car.image.storage.exists(name))
+
+
+class StaticFilesTest(TestCase):
+    """collectstatic со сжатыми копиями и их отдача serve_static"""
+
+    CSS = 'body { background: url("logo.png"); }\n' + ''.join(f'.c{i} {{ margin: {i}px; }}\n' for i in range(100))
+
+    def setUp(self):
+        source = Path(tempfile.mkdtemp())
+        self.root = Path(tempfile.mkdtemp())
+        for directory in (source, self.root):
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        (source / 'site.css').write_text(self.CSS)
+        (source / 'tiny.js').write_text('let a = 1;\n')
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'navy').save(buffer, 'PNG')
+        (source / 'logo.png').write_bytes(buffer.getvalue())
+
+        settings_override = override_settings(
+            STATIC_ROOT=self.root, STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.css = staticfiles_storage.stored_name('site.css')
+
+    def get(self, path, accept_encoding=''):
+        request = RequestFactory().get(f'/static/{path}', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return views.serve_static(request, path)
+
+    def test_compressed_copies(self):
+        self.assertRegex(self.css, r'^site\.[0-9a-f]{12}\.css$')
+        hashed = (self.root / self.css).read_bytes()
+        self.assertIn(staticfiles_storage.stored_name('logo.png').encode(), hashed)
+        self.assertEqual(gzip.decompress((self.root / f'{self.css}.gz').read_bytes()), hashed)
+        # Маленькие и несжимаемые файлы — без копий
+        self.assertFalse((self.root / f"{staticfiles_storage.stored_name('tiny.js')}.gz").exists())
+        self.assertFalse((self.root / f"{staticfiles_storage.stored_name('logo.png')}.gz").exists())
+        # Файла нет в манифесте — имя без хэша вместо ошибки
+        self.assertEqual(staticfiles_storage.stored_name('missing.css'), 'missing.css')
+
+    def test_serve_negotiates_encoding(self):
+        response = self.get(self.css, 'gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), (self.root / self.css).read_bytes())
+
+        response = self.get(self.css)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), (self.root / self.css).read_bytes())
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        # .br предпочтительнее, если клиент его принимает
+        (self.root / f'{self.css}.br').write_bytes(b'brotli')
+        response = self.get(self.css, 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(b''.join(response.streaming_content), b'brotli')
+
+    def test_unhashed_name_not_cached_forever(self):
+        response = self.get('site.css', 'gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Cache-Control', response)
+
+
+class PageCacheTest(TestCase):
+    """Кэш страниц для гостей и фрагментов машин для вошедших"""
+
+    def setUp(self):
+        cache.clear()
+        self.car = make_car(name='Camry')
+
+    def rename_silently(self, name):
+        # Без сигналов: версии кэша не меняются
+        Car.objects.filter(pk=self.car.pk).update(name=name)
+
+    def test_anonymous_page_cached_until_car_saved(self):
+        self.assertContains(self.client.get(reverse('index')), 'Camry')
+        self.rename_silently('Corolla')
+        self.assertContains(self.client.get(reverse('index')), 'Camry')
+        self.assertEqual(caching.hit_rate(caching.PAGES)['hits'], 1)
+        # Другие параметры запроса — другая запись
+        self.assertContains(self.client.get(reverse('index'), {'sort': 'price'}), 'Corolla')
+
+        self.car.refresh_from_db()
+        self.car.name = 'Land Cruiser'
+        self.car.save()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Land Cruiser')
+        self.assertNotContains(response, 'Corolla')
+
+    def test_car_page_invalidated_by_review(self):
+        url = reverse('car_detail', args=[self.car.pk])
+        self.assertNotContains(self.client.get(url), 'Превосходная машина')
+        user = User.objects.create_user('client', password='secret')
+        booking = make_booking(user, self.car, date.today() - timedelta(days=5), status='confirmed')
+        Review.objects.create(booking=booking, rating=5, comment='Превосходная машина')
+        self.assertContains(self.client.get(url), 'Превосходная машина')
+
+    def test_messages_cookie_bypasses_cache(self):
+        self.client.get(reverse('index'))
+        self.rename_silently('Corolla')
+        self.client.cookies['messages'] = 'pending'
+        self.assertContains(self.client.get(reverse('index')), 'Corolla')
+
+    def test_fragments_for_authenticated_users(self):
+        user = User.objects.create_user('client', password='secret')
+        self.client.force_login(user)
+        url = reverse('car_detail', args=[self.car.pk])
+        self.assertContains(self.client.get(url), 'Camry')
+        self.rename_silently('Corolla')
+        # Страница для вошедшего не кэшируется, а блок машины — по версии машины
+        self.assertContains(self.client.get(url), 'Camry')
+        self.assertEqual(caching.hit_rate(caching.PAGES)['hits'], 0)
+        caching.invalidate_car(self.car.pk)
+        self.assertContains(self.client.get(url), 'Corolla')
+
+        # Изменение другой машины блок не сбрасывает
+        self.rename_silently('Highlander')
+        caching.invalidate_car(make_car(name='Rio').pk)
+        self.assertContains(self.client.get(url), 'Corolla')
+
+
+class ConditionalGetTest(TestCase):
+    """304 по ETag/Last-Modified без отрисовки страницы"""
+
+    def setUp(self):
+        cache.clear()
+        self.car = make_car()
+        self.other = make_car(name='Rio', brand='Kia')
+
+    def test_page_not_modified(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        # Только отпечаток парка, представление не вызывается
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(reverse('index'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # Изменение машины (и бронирование — через touch) меняет версию
+        self.other.price = Decimal('350.00')
+        self.other.save()
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        user = User.objects.create_user('client', password='secret')
+        make_booking(user, self.car, date.today() + timedelta(days=3))
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_authenticated_version_is_private(self):
+        anonymous = self.client.get(reverse('car_detail', args=[self.car.pk]))
+        user = User.objects.create_user('client', password='secret')
+        self.client.force_login(user)
+        response = self.client.get(reverse('car_detail', args=[self.car.pk]))
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(
+            self.client.get(reverse('car_detail', args=[self.car.pk]), HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304,
+        )
+        # Версия гостя вошедшему не подходит
+        self.assertEqual(
+            self.client.get(reverse('car_detail', args=[self.car.pk]), HTTP_IF_NONE_MATCH=anonymous['ETag']).status_code,
+            200,
+        )
+
+    def test_messages_cookie_disables_validators(self):
+        self.client.cookies['messages'] = 'pending'
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_quote_depends_on_requested_cars(self):
+        params = {'car': [self.car.pk], 'range': f'{date.today()}:{date.today() + timedelta(days=2)}'}
+        etag = self.client.get(reverse('quote'), params)['ETag']
+        self.other.price = Decimal('350.00')
+        self.other.save()
+        self.assertEqual(self.client.get(reverse('quote'), params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Правило цены касается всех машин
+        PricingRule.objects.create(name='Сезон', multiplier=Decimal('1.10'))
+        response = self.client.get(reverse('quote'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quotes'][0]['base_price'], '990.00')
+
+
+class AsyncViewsTest(TestCase):
+    """Асинхронные каталог, страница машины и API стоимости отвечают так же, как синхронные"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client', password='secret')
+        self.cars = [make_car(name=f'Camry {i}', price=Decimal(300 + 10 * i)) for i in range(5)]
+        booking = make_booking(self.user, self.cars[0], date.today() - timedelta(days=5), status='confirmed')
+        Review.objects.create(booking=booking, rating=5, comment='Превосходная машина')
+        recommendations_and_rebuild()
+
+    def request(self, path, user=None, **params):
+        request = RequestFactory().get(path, params)
+        request.user = user or AnonymousUser()
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        return request
+
+    def both(self, name, path, *args, user=None, **params):
+        """Ответы синхронной и асинхронной версии на одинаковый запрос (кэш страниц сброшен)"""
+        responses = []
+        for view in (getattr(views, name), async_to_sync(getattr(async_views, name))):
+            cache.clear()
+            # Приветствие в шапке выбирается случайно
+            with mock.patch('random.choice', lambda choices: choices[0]):
+                responses.append(view(self.request(path, user, **params), *args))
+        return responses
+
+    def test_catalog(self):
+        for params in ({}, {'sort': 'price'}, {'category': 'Седан', 'q': 'Camry'}):
+            with self.subTest(params=params):
+                sync, asynchronous = self.both('home', '/', **params)
+                self.assertEqual(asynchronous.status_code, 200)
+                self.assertEqual(asynchronous.content, sync.content)
+                self.assertEqual(asynchronous['ETag'], sync['ETag'])
+
+    @override_settings(CATALOG_PAGINATION='pages')
+    def test_numbered_catalog(self):
+        sync, asynchronous = self.both('home', '/', page='1')
+        self.assertEqual(asynchronous.content, sync.content)
+
+    def test_car_detail(self):
+        car = self.cars[0]
+        for user in (None, self.user):
+            with self.subTest(user=user):
+                sync, asynchronous = self.both('car_detail', f'/car/{car.pk}/', car.pk, user=user)
+                self.assertEqual(asynchronous['ETag'], sync['ETag'])
+                for response in (sync, asynchronous):
+                    self.assertContains(response, 'Превосходная машина')
+                    self.assertContains(response, 'Camry 0')
+        with self.assertRaises(Http404):
+            async_to_sync(async_views.car_detail)(self.request('/car/0/'), 0)
+
+    def test_fragment_cached_for_authenticated_user(self):
+        car = self.cars[0]
+        views.car_detail(self.request(f'/car/{car.pk}/', self.user), car.pk)
+        with mock.patch.object(async_views, '_reviews') as reviews:
+            response = async_to_sync(async_views.car_detail)(self.request(f'/car/{car.pk}/', self.user), car.pk)
+        # Отзывы не загружались, но есть во фрагменте из кэша
+        reviews.assert_not_called()
+        self.assertContains(response, 'Превосходная машина')
+
+    def test_quote(self):
+        params = {
+            'car': [car.pk for car in self.cars[:2]],
+            'range': [f'{date.today()}:{date.today() + timedelta(days=2)}'],
+        }
+        sync, asynchronous = self.both('quote', '/api/quote/', **params)
+        self.assertEqual(asynchronous.status_code, 200)
+        self.assertEqual(json.loads(asynchronous.content), json.loads(sync.content))
+        sync, asynchronous = self.both('quote', '/api/quote/', car='x')
+        self.assertEqual(asynchronous.status_code, 400)
+        self.assertEqual(asynchronous.content, sync.content)
+
+
+class AdminListsTest(TestCase):
+    """Списки админки по большим таблицам: оценка числа строк и фильтры из кэша"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+        self.cars = [make_car(name=f'Camry {i}') for i in range(4)] + [make_car(name='X5', brand='BMW')]
+
+    def test_estimated_count(self):
+        cars = Car.objects.order_by('pk')
+        with mock.patch('rental.pagination.estimate_rows', return_value=50_000), self.assertNumQueries(0):
+            self.assertEqual(EstimatedCountPaginator(cars, 20).count, 50_000)
+        # Маленькая таблица или оценки нет — точный COUNT
+        with mock.patch('rental.pagination.estimate_rows', return_value=100), self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(cars, 20).count, 5)
+        with mock.patch('rental.pagination.estimate_rows', return_value=50_000) as estimate:
+            with mock.patch.object(EstimatedCountPaginator, 'COUNT_LIMIT', 3):
+                # С фильтром оценка не подходит: COUNT не дальше COUNT_LIMIT строк
+                self.assertEqual(EstimatedCountPaginator(cars.filter(brand='Toyota'), 2).count, 3)
+                self.assertEqual(EstimatedCountPaginator(cars.filter(brand='BMW'), 2).count, 1)
+            estimate.assert_not_called()
+
+    def test_changelist_uses_cached_filters(self):
+        url = reverse('admin:rental_car_changelist')
+        with mock.patch.object(facets, 'compute', wraps=facets.compute) as compute:
+            response = self.client.get(url)
+            self.client.get(url, {'brand': 'BMW'})
+        compute.assert_called_once()
+        self.assertContains(response, '?brand=BMW')
+        self.assertContains(response, '?type=%D0%A1%D0%B5%D0%B4%D0%B0%D0%BD')
+        response = self.client.get(url, {'brand': 'BMW'})
+        self.assertEqual([car.pk for car in response.context['cl'].result_list], [self.cars[-1].pk])
+
+        # Новый бренд появляется после сигнала Car
+        make_car(name='Rio', brand='Kia')
+        self.assertContains(self.client.get(url), '?brand=Kia')
+
+    def test_booking_year_filter(self):
+        user = User.objects.create_user('client', password='secret')
+        old = make_booking(user, self.cars[0], date(2023, 5, 1))
+        new = make_booking(user, self.cars[1], date(2025, 8, 1))
+        url = reverse('admin:rental_booking_changelist')
+        response = self.client.get(url)
+        years, = [spec for spec in response.context['cl'].filter_specs if isinstance(spec, BookingYearFilter)]
+        self.assertEqual([value for value, _ in years.lookup_choices], ['2025', '2024', '2023'])
+        self.assertEqual(
+            [booking.pk for booking in self.client.get(url, {'year': '2023'}).context['cl'].result_list], [old.pk]
+        )
+        self.assertEqual(
+            sorted(booking.pk for booking in self.client.get(url, {'year': 'x'}).context['cl'].result_list),
+            [old.pk, new.pk],
+        )
+        # Варианты лет — из кэша, без MIN/MAX на каждый запрос
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries if 'MIN(' in query['sql']])
+
+
+class BookingInlineTest(TestCase):
+    """Бронирования в карточке машины: только просмотр ближайших и недавних"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+        self.car = make_car()
+        self.url = reverse('admin:rental_car_change', args=[self.car.pk])
+
+    def add_bookings(self, count, start):
+        return [make_booking(self.admin, self.car, start + timedelta(days=2 * i)) for i in range(count)]
+
+    def test_recent_rows_only(self):
+        today = date.today()
+        self.add_bookings(3, today - timedelta(days=BookingInline.recent_days + 20))
+        recent = self.add_bookings(BookingInline.max_rows + 5, today - timedelta(days=10))
+        response = self.client.get(self.url)
+        formset, = [formset for formset in response.context['inline_admin_formsets']
+                    if formset.opts.__class__ is BookingInline]
+        self.assertEqual(
+            [form.original.pk for form in formset], [booking.pk for booking in recent[:BookingInline.max_rows]]
+        )
+        content = response.content.decode()
+        self.assertIn(f'name="bookings-TOTAL_FORMS" value="{BookingInline.max_rows}"', content)
+        # Ни полей для правки, ни удаления, ни добавления
+        self.assertEqual(
+            sorted({name.split('-')[-1] for name in re.findall(r'name="bookings-\d+-([^"]*)"', content)}),
+            ['car', 'id'],
+        )
+        self.assertIn('name="bookings-MAX_NUM_FORMS" value="0"', content)
+
+    def test_queries_do_not_grow_with_history(self):
+        self.add_bookings(2, date.today())
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self.add_bookings(BookingInline.max_rows, date.today() + timedelta(days=10))
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(many), len(few))
+
+    def test_saving_car_keeps_bookings(self):
+        booking, = self.add_bookings(1, date.today() + timedelta(days=3))
+        response = self.client.get(self.url)
+        data = {
+            name: value for name, value in response.context['adminform'].form.initial.items()
+            if name not in ('image', 'services') and value is not None
+        }
+        data.update(name='Camry Hybrid')
+        for inline in response.context['inline_admin_formsets']:
+            formset = inline.formset
+            data.update({f'{formset.prefix}-{name}': value for name, value in formset.management_form.initial.items()})
+            for index, form in enumerate(formset.initial_forms):
+                data[f'{formset.prefix}-{index}-id'] = form.instance.pk
+                data[f'{formset.prefix}-{index}-car'] = self.car.pk
+                # Поддельное поле удаления и правки игнорируются
+                data[f'{formset.prefix}-{index}-DELETE'] = 'on'
+                data[f'{formset.prefix}-{index}-status'] = 'cancelled'
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.name, 'Camry Hybrid')
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
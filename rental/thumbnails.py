@@ -0,0 +1,158 @@
+"""Уменьшенные копии фотографий автомобилей.
+
+Для каждого оригинала строятся WebP и JPEG шириной WIDTHS (не шире
+оригинала) и сохраняются в THUMBS_DIR под именем из хэша содержимого:
+одинаковые загрузки делят одни и те же файлы, а новый файл под старым
+именем получает новые URL. Копии создаются при загрузке фото (сигнал
+post_save Car), для старых файлов — командой build_thumbnails; запрос
+страницы их не кодирует: при промахе кэша он только ищет готовые файлы
+(один процесс на оригинал, caching.single_flight), а пока копий нет,
+показывается оригинал. Набор копий кэшируется, чтобы шаблоны не читали
+файлы при каждом запросе.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageOps
+
+from . import caching
+from .storage import digest_of
+
+WIDTHS = (320, 640, 1024)
+FORMATS = {
+    # формат Pillow, расширение, параметры сохранения
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+THUMBS_DIR = 'thumbs'
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# Повороты EXIF, после которых ширина и высота меняются местами
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _cache_key(name):
+    return f'rental:thumbs:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def _digest(image_file):
+    # В хранилище по хэшу он уже есть в имени файла
+    known = digest_of(image_file.name)
+    if known:
+        return known[:20]
+    digest = hashlib.sha256()
+    image_file.open('rb')
+    try:
+        for chunk in image_file.chunks():
+            digest.update(chunk)
+    finally:
+        image_file.close()
+    return digest.hexdigest()[:20]
+
+
+def _rendition_name(digest, width, extension):
+    return f'{THUMBS_DIR}/{digest[:2]}/{digest}_{width}.{extension}'
+
+
+def _widths(original_width):
+    widths = [width for width in WIDTHS if width < original_width] + [min(original_width, WIDTHS[-1])]
+    return sorted(set(widths))
+
+
+def _encode(original, width, image_format, options):
+    image = original.copy()
+    image.thumbnail((width, width * 4), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG без прозрачности — накладываем на белый фон
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def generate(image_file, force=False):
+    """Создает недостающие копии и возвращает их описание:
+    {'width', 'height', 'webp': [(ширина, имя)], 'jpeg': [(ширина, имя)]}"""
+    digest = _digest(image_file)
+    image_file.open('rb')
+    try:
+        original = ImageOps.exif_transpose(Image.open(image_file))
+        original.load()
+    finally:
+        image_file.close()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    renditions = {'width': original.width, 'height': original.height}
+    for key, (image_format, extension, options) in FORMATS.items():
+        renditions[key] = []
+        for width in _widths(original.width):
+            name = _rendition_name(digest, width, extension)
+            if force or not default_storage.exists(name):
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(_encode(original, width, image_format, options)))
+            renditions[key].append((width, name))
+
+    cache.set(_cache_key(image_file.name), renditions, timeout=CACHE_TIMEOUT)
+    return renditions
+
+
+def _existing(image_file):
+    """Описание уже созданных копий без кодирования; {} — если копий нет или файл не читается"""
+    try:
+        digest = _digest(image_file)
+        image_file.open('rb')
+        try:
+            # Размеры из заголовка, пиксели не декодируются
+            image = Image.open(image_file)
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+        finally:
+            image_file.close()
+    except (OSError, ValueError):
+        return {}
+
+    renditions = {'width': width, 'height': height}
+    for key, (_, extension, _) in FORMATS.items():
+        renditions[key] = [(size, _rendition_name(digest, size, extension)) for size in _widths(width)]
+        if not all(default_storage.exists(name) for _, name in renditions[key]):
+            return {}
+    return renditions
+
+
+def get_renditions(image_file):
+    """Описание копий оригинала или None — тогда показывается сам оригинал"""
+    if not image_file:
+        return None
+    renditions = cache.get(_cache_key(image_file.name))
+    if renditions is None:
+        # Пустой результат тоже кэшируется: generate перезапишет его, когда копии появятся
+        renditions = caching.single_flight(
+            _cache_key(image_file.name), lambda: _existing(image_file), timeout=CACHE_TIMEOUT
+        )
+    return renditions or None
+
+
+def delete_renditions(image_file):
+    """Удаляет копии оригинала (перед удалением самого файла)"""
+    digest = _digest(image_file)
+    directory = f'{THUMBS_DIR}/{digest[:2]}'
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        files = []
+    for filename in files:
+        if filename.startswith(f'{digest}_'):
+            default_storage.delete(f'{directory}/{filename}')
+    cache.delete(_cache_key(image_file.name))
+
+
+def srcset(renditions, key):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in renditions[key])
@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Страницы только для чтения: асинхронные версии при запуске под ASGI
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
-    path('', views.home, name='index'),
-    path('car/<int:pk>/', views.car_detail, name='car_detail'),  # ← new
+    path('', read_views.home, name='index'),
+    path('car/<int:pk>/', read_views.car_detail, name='car_detail'),  # ← new
     path('my-bookings/', views.my_bookings, name='my_bookings'),
     path('booking/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
     path('profile/', views.profile, name='profile'),
@@ -14,4 +18,5 @@ urlpatterns = [
     path('review/<int:review_id>/edit/', views.edit_review, name='edit_review'),
     path('review/<int:review_id>/delete/', views.delete_review, name='delete_review'),
     path('about/', views.about, name='about'),
+    path('api/quote/', read_views.quote, name='quote'),
 ]
\ No newline at end of file
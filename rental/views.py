@@ -1,20 +1,53 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Car, Booking, CarService, Review
+from .models import Car, Booking, Review
 from django.shortcuts import get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Avg, Count, Prefetch, Min, Max
+from django.db.models import Exists, OuterRef
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .forms import UserProfileForm, PasswordChangeCustomForm, BookingForm, ReviewForm
+from .forms import MAX_RENTAL_DAYS, UserProfileForm, PasswordChangeCustomForm, BookingForm, ReviewForm
+from . import availability, caching, conditional, pricing, rates, recommendations, reservations, search, stats, storage
+from .staticfiles import HASHED_NAME
+from .pagination import KeysetPaginator
 from django.contrib.auth import update_session_auth_hash
 from django.urls import reverse
+from django.conf import settings
 from django.http import JsonResponse
-from datetime import datetime
+from django.utils.cache import patch_vary_headers
+from django.views.static import serve
+from datetime import datetime, date, timedelta
+import mimetypes
 from django.core.exceptions import ValidationError
 
-def home(request):
+# Варианты сортировки каталога
+CATALOG_ORDERING = {
+    'price': ('price',),
+    '-price': ('-price',),
+    'name': ('brand', 'name'),
+    '-name': ('-brand', '-name'),
+    # Только вместе с поиском (?q=): ранг из rental.search.filter_cars
+    'relevance': ('-search_rank', 'price'),
+}
+
+def _parse_date_range(date_from, date_to):
+    """Разбирает даты из GET-параметров, некорректный период игнорируется"""
+    try:
+        date_from = date.fromisoformat(date_from) if date_from else None
+        date_to = date.fromisoformat(date_to) if date_to else None
+    except ValueError:
+        return None, None
+    if date_from and not date_to:
+        date_to = date_from
+    if date_to and not date_from:
+        date_from = date_to
+    if date_from and date_to < date_from:
+        return None, None
+    return date_from, date_to
+
+def _catalog_query(request):
+    """Queryset каталога, порядок сортировки и параметры для шаблона (без запросов к базе)"""
     per_page = request.GET.get('per_page', 4)
     try:
         per_page = int(per_page)
@@ -23,14 +56,8 @@ def home(request):
     except ValueError:
         per_page = 4
 
-    # Предзагружаем подтвержденные бронирования для каждой машины
-    confirmed_bookings = Prefetch(
-        'bookings',
-        queryset=Booking.objects.filter(status='confirmed').order_by('date_from'),
-        to_attr='confirmed_bookings'
-    )
-    
-    car_list = Car.available.all().prefetch_related(confirmed_bookings)
+    # Сводка ближайшей занятости хранится в карте доступности — без загрузки истории бронирований
+    car_list = Car.available.all().select_related('availability')
 
     # Фильтрация по типу автомобиля
     car_type_filter = request.GET.get('type')
@@ -51,58 +78,82 @@ def home(request):
         except ValueError:
             pass
 
-    # Сортировка
-    sort = request.GET.get('sort', 'price')  # по умолчанию сортируем по цене
-    if sort == '-price':
-        car_list = car_list.order_by('-price')
-    elif sort == 'name':
-        car_list = car_list.order_by('brand', 'name')
-    elif sort == '-name':
-        car_list = car_list.order_by('-brand', '-name')
-    else:
-        car_list = car_list.order_by('price')
-    
-    paginator = Paginator(car_list, per_page)
-    page = request.GET.get('page')
+    # Фильтрация по датам аренды: исключаем машины с подтвержденными пересекающимися бронированиями
+    date_from, date_to = _parse_date_range(request.GET.get('date_from'), request.GET.get('date_to'))
+    if date_from and date_to:
+        busy = Booking.objects.filter(car=OuterRef('pk')).confirmed().overlapping(date_from, date_to)
+        car_list = car_list.filter(~Exists(busy))
+
+    # Поиск по бренду, названию, типу кузова и отзывам
+    query = request.GET.get('q', '').strip()
+    searching = bool(search.tokenize(query))
+    if searching:
+        car_list = search.filter_cars(car_list, query)
+
+    # Сортировка: по умолчанию по цене, при поиске — по релевантности
+    sort = request.GET.get('sort', 'relevance' if searching else 'price')
+    if sort not in CATALOG_ORDERING or (sort == 'relevance' and not searching):
+        sort = 'price'
+
+    return car_list, CATALOG_ORDERING[sort], {
+        'per_page': per_page,
+        'pagination_mode': settings.CATALOG_PAGINATION,
+        'current_category': car_type_filter,
+        'current_sort': sort,
+        'query': query,
+        'min_price': min_price,
+        'max_price': max_price,
+        'date_from': date_from,
+        'date_to': date_to,
+        'today': date.today()
+    }
 
+def _numbered_page(paginator, number):
     try:
-        cars = paginator.page(page)
+        return paginator.page(number)
     except PageNotAnInteger:
-        cars = paginator.page(1)
+        return paginator.page(1)
     except EmptyPage:
         # Если пользователь ввёл несуществующую страницу — покажем последнюю
-        cars = paginator.page(paginator.num_pages)
-
-    car_stats = Car.available.aggregate(
-    total=Count('id'),
-        avg_price=Avg('price'),
-        min_price=Min('price'),
-        max_price=Max('price')
-    )
-
-    return render(request, 'index.html', {
-    'cars': cars,
-    'per_page': per_page,
-        'car_stats': car_stats,
-        'current_category': car_type_filter,
-        'current_sort': sort,
-        'min_price': min_price,
-        'max_price': max_price
-})
+        return paginator.page(paginator.num_pages)
 
-def car_detail(request, pk):
-    car = get_object_or_404(Car, pk=pk)
-    car_list = Car.available.exclude(id=car.id).order_by('?')[:3]  # 3 случайных
-    
-    # Получаем все подтвержденные отзывы для этой машины
-    reviews = Review.objects.filter(
+@conditional.conditional_get(conditional.page_etag, conditional.page_last_modified)
+@caching.anonymous_page
+def home(request):
+    car_list, ordering, context = _catalog_query(request)
+
+    if settings.CATALOG_PAGINATION == 'keyset':
+        # Курсорная пагинация: без COUNT(*) и OFFSET, глубокие страницы не дороже первой
+        cars = KeysetPaginator(car_list, ordering, context['per_page']).page(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(car_list.order_by(*ordering), context['per_page'])
+        cars = _numbered_page(paginator, request.GET.get('page'))
+    availability.attach(cars.object_list)
+
+    # Материализованная статистика парка, обновляется сигналами Car
+    context.update(cars=cars, car_stats=stats.get_stats())
+    return render(request, 'index.html', context)
+
+def _car_reviews(car):
+    """Подтвержденные публичные отзывы машины, новые первыми"""
+    return Review.objects.filter(
         booking__car=car,
         booking__status='confirmed',
         is_public=True
     ).select_related('booking__user').order_by('-created_at')
 
-    # Вычисляем среднюю оценку
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg']
+@conditional.conditional_get(conditional.page_etag, conditional.page_last_modified)
+@caching.anonymous_page
+def car_detail(request, pk):
+    car = get_object_or_404(Car, pk=pk)
+    car_list = recommendations.similar_cars(car)  # 3 случайных из предрассчитанных похожих
+    
+    # Все подтвержденные отзывы для этой машины; запрос выполнится только
+    # при отрисовке, если фрагмент не нашелся в кэше
+    reviews = _car_reviews(car)
+
+    # Средняя оценка поддерживается сигналами отзывов (rental.ratings)
+    avg_rating = car.average_rating if car.total_reviews else None
 
     return render(request, 'car_detail.html', {
         'car': car,
@@ -126,12 +177,36 @@ def logout_view(request):
     logout(request)
     return redirect('/')
 
+# Разделы истории бронирований: (название, порядок сортировки)
+BOOKING_TABS = {
+    'upcoming': ('Предстоящие', ('date_from',)),
+    'past': ('Завершенные', ('-date_from',)),
+    'cancelled': ('Отмененные', ('-date_from',)),
+}
+BOOKINGS_PER_PAGE = 12
+
 @login_required
 def my_bookings(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-date_from')
     today = datetime.now().date()
+    tab = request.GET.get('tab')
+    if tab not in BOOKING_TABS:
+        tab = 'upcoming'
+
+    # Машина и отзыв загружаются для всей страницы сразу; услуги и сумма берутся
+    # из сохраненного расчета (price_snapshot), без запросов к услугам
+    bookings = Booking.objects.filter(user=request.user).select_related('car', 'review')
+    if tab == 'cancelled':
+        bookings = bookings.filter(status='cancelled')
+    elif tab == 'past':
+        bookings = bookings.exclude(status='cancelled').filter(date_to__lt=today)
+    else:
+        bookings = bookings.exclude(status='cancelled').filter(date_to__gte=today)
+
+    page = KeysetPaginator(bookings, BOOKING_TABS[tab][1], BOOKINGS_PER_PAGE).page(request.GET.get('cursor'))
     return render(request, 'rental/my_bookings.html', {
-        'bookings': bookings,
+        'bookings': page,
+        'tabs': [(key, title) for key, (title, _) in BOOKING_TABS.items()],
+        'current_tab': tab,
         'today': today
     })
 
@@ -184,27 +259,25 @@ def book_car(request, car_id):
         form = BookingForm(request.POST, car=car)
         
         if form.is_valid():
-            booking = form.save(commit=False)
-            booking.user = request.user
-            booking.car = car
-            booking.status = 'pending'
-            booking.save()
-            
-            # Сохраняем выбранные услуги
-            selected_services = form.cleaned_data.get('selected_services')
-            if selected_services:
-                for service in selected_services:
-                    car_service = CarService.objects.get(car=car, service=service)
-                    booking.services.add(car_service)
-            
-            messages.success(request, 'Автомобиль успешно забронирован! Ожидайте подтверждения.')
-            return redirect('my_bookings')
+            # Форма проверяет даты заранее, окончательно — под блокировкой машины
+            try:
+                reservations.reserve(
+                    request.user, car,
+                    form.cleaned_data['date_from'], form.cleaned_data['date_to'],
+                    form.cleaned_data.get('selected_services') or (),
+                )
+            except reservations.BookingConflict as error:
+                form.add_error(None, str(error))
+            else:
+                messages.success(request, 'Автомобиль успешно забронирован! Ожидайте подтверждения.')
+                return redirect('my_bookings')
     else:
         form = BookingForm(car=car)
     
     return render(request, 'rental/book_car.html', {
         'form': form,
-        'car': car
+        'car': car,
+        'discount_tiers': rates.discount_steps(car.brand),
     })
 
 @login_required
@@ -221,18 +294,14 @@ def edit_booking_dates(request, booking_id):
                 
             booking = form.save(commit=False)
             booking.status = 'pending'  # При изменении дат статус снова становится "ожидает"
-            booking.save()
-
-            # Обновляем выбранные услуги
-            booking.services.clear()  # Удаляем старые связи
-            selected_services = form.cleaned_data.get('selected_services')
-            if selected_services:
-                for service in selected_services:
-                    car_service = CarService.objects.get(car=booking.car, service=service)
-                    booking.services.add(car_service)
-
-            messages.success(request, 'Даты бронирования успешно изменены')
-            return redirect('my_bookings')
+            try:
+                # Вместе с датами заменяем выбранные услуги
+                reservations.save(booking, form.cleaned_data.get('selected_services') or ())
+            except reservations.BookingConflict as error:
+                form.add_error(None, str(error))
+            else:
+                messages.success(request, 'Даты бронирования успешно изменены')
+                return redirect('my_bookings')
         else:
             messages.error(request, 'Пожалуйста, исправьте ошибки в форме')
     else:
@@ -310,5 +379,76 @@ def delete_review(request, review_id):
         'review': review
     })
 
+# Ограничения на размер пачки расчета стоимости
+QUOTE_MAX_CARS = 50
+QUOTE_MAX_RANGES = 20
+
+def _parse_quote_ranges(values):
+    ranges = []
+    for value in values:
+        date_from, _, date_to = value.partition(':')
+        date_from, date_to = _parse_date_range(date_from, date_to)
+        if not date_from:
+            raise ValueError(value)
+        ranges.append((date_from, date_to))
+    return ranges
+
+def _quote_params(request):
+    """(car_ids, ranges, service_ids) из GET-параметров или JsonResponse с ошибкой"""
+    try:
+        car_ids = [int(value) for value in request.GET.getlist('car')]
+        service_ids = [int(value) for value in request.GET.getlist('service')]
+        ranges = _parse_quote_ranges(request.GET.getlist('range'))
+        if request.GET.get('date_from'):
+            ranges += _parse_quote_ranges([f"{request.GET['date_from']}:{request.GET.get('date_to', '')}"])
+    except ValueError:
+        return JsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+
+    if not car_ids or not ranges:
+        return JsonResponse({'error': 'Укажите автомобили (car) и периоды (range)'}, status=400)
+    if len(car_ids) > QUOTE_MAX_CARS or len(ranges) > QUOTE_MAX_RANGES:
+        return JsonResponse({'error': 'Слишком большой запрос'}, status=400)
+    # За горизонтом таблиц цен расчет идет по дням: длину и конец периода ограничиваем,
+    # как при бронировании
+    last_day = date.today() + timedelta(days=availability.HORIZON_DAYS - 1)
+    for date_from, date_to in ranges:
+        if (date_to - date_from).days + 1 > MAX_RENTAL_DAYS or date_to > last_day:
+            return JsonResponse({
+                'error': f'Период не длиннее {MAX_RENTAL_DAYS} дней и не позже {last_day.isoformat()}'
+            }, status=400)
+    return car_ids, ranges, service_ids
+
+@conditional.conditional_get(conditional.quote_etag)
+def quote(request):
+    """Стоимость аренды для машин × периодов: ?car=1&car=2&range=2025-07-01:2025-07-05&service=3"""
+    params = _quote_params(request)
+    if isinstance(params, JsonResponse):
+        return params
+    return JsonResponse({'quotes': pricing.quote_many(*params)})
+
 def about(request):
     return render(request, 'rental/about.html')
+
+def serve_media(request, path, document_root=None):
+    """Отдача media при DEBUG; файлы с хэшем в имени кэшируются навсегда"""
+    response = serve(request, path, document_root=document_root)
+    if storage.digest_of(path) or path.startswith('thumbs/'):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def serve_static(request, path):
+    """Отдача STATIC_ROOT: готовая .br/.gz-копия по Accept-Encoding, вечный кэш для имен с хэшем"""
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accept_encoding and (settings.STATIC_ROOT / f'{path}{suffix}').is_file():
+            response = serve(request, f'{path}{suffix}', document_root=settings.STATIC_ROOT)
+            response['Content-Encoding'] = encoding
+            response['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            break
+    if response is None:
+        response = serve(request, path, document_root=settings.STATIC_ROOT)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if HASHED_NAME.search(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
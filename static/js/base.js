@@ -0,0 +1,27 @@
+// Navbar scroll effect
+window.addEventListener('scroll', function() {
+    const navbar = document.querySelector('.navbar');
+    if (window.scrollY > 50) {
+        navbar.style.padding = '0.5rem 0';
+    } else {
+        navbar.style.padding = '1rem 0';
+    }
+});
+
+// Add smooth transition to dropdown menus
+document.addEventListener('DOMContentLoaded', function() {
+    const dropdowns = document.querySelectorAll('.dropdown');
+    dropdowns.forEach(dropdown => {
+        dropdown.addEventListener('show.bs.dropdown', function() {
+            const menu = this.querySelector('.dropdown-menu');
+            menu.style.display = 'block';
+            setTimeout(() => menu.style.opacity = '1', 0);
+        });
+
+        dropdown.addEventListener('hide.bs.dropdown', function() {
+            const menu = this.querySelector('.dropdown-menu');
+            menu.style.opacity = '0';
+            setTimeout(() => menu.style.display = 'none', 200);
+        });
+    });
+});
@@ -0,0 +1,24 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Smooth scroll for hero button
+    document.querySelector('a[href="#cars-section"]').addEventListener('click', function(e) {
+        e.preventDefault();
+        document.querySelector('#cars-section').scrollIntoView({
+            behavior: 'smooth'
+        });
+    });
+
+    // Intersection Observer for cards animation
+    const observer = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                entry.target.style.opacity = '1';
+            }
+        });
+    }, {
+        threshold: 0.1
+    });
+
+    document.querySelectorAll('.animate-cards > *').forEach(card => {
+        observer.observe(card);
+    });
+});